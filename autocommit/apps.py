@@ -4,3 +4,11 @@ from django.apps import AppConfig
 class AutocommitConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'autocommit'
+
+    def ready(self):
+        from filesys.startup import run_at_startup
+
+        from .scheduler import scheduler
+
+        # Pick up snapshots a previous process left pending, without waiting for the next save
+        run_at_startup('autocommit-recover', scheduler.recover)
@@ -0,0 +1,236 @@
+import logging
+import os
+import time
+from datetime import timedelta
+
+import git
+from django.conf import settings
+from django.utils import timezone
+
+from filesys.git_pool import git_repo
+from filesys.models import Repository
+from .models import RepositoryMaintenance
+from .tasks import HISTORY_BRANCH, HISTORY_INDEX_TIP, _record_history_tip
+
+logger = logging.getLogger(__name__)
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def _replay(repo, commit, tree, message, parent):
+    """Create a copy of `commit` with the given tree, message and parent, keeping authorship and dates"""
+    return git.Commit.create_from_tree(
+        repo,
+        tree,
+        message,
+        parent_commits=[parent] if parent is not None else [],
+        head=False,
+        author=commit.author,
+        committer=commit.committer,
+        author_date=commit.authored_datetime,
+        commit_date=commit.committed_datetime
+    )
+
+
+def _squash_message(bucket):
+    first, last = bucket[0], bucket[-1]
+    paths = set()
+    for commit in bucket:
+        paths.update(line[2:] for line in commit.message.splitlines() if line.startswith('- '))
+    message = (
+        f"chore: squashed {len(bucket)} auto-commit(s) from "
+        f"{first.committed_datetime:%Y-%m-%d %H:%M} to {last.committed_datetime:%Y-%m-%d %H:%M}\n"
+    )
+    for path in sorted(paths):
+        message += f"\n- {path}"
+    return message
+
+
+def compact_history(repo, keep_recent=None, bucket_seconds=None):
+    """
+    Squash old history-branch snapshots into one commit per time bucket
+
+    Only commits that exist solely on the history branch are rewritten; the
+    newest `keep_recent` of them are replayed unchanged on top of the squashed
+    ones, so the branch tip keeps the same tree. Callers must hold the
+    repository lock (i.e. open the handle with write=True).
+
+    Returns:
+        int: number of commits removed from the branch
+    """
+    keep_recent = _setting('AUTOCOMMIT_HISTORY_KEEP_RECENT', 100) if keep_recent is None else keep_recent
+    bucket_seconds = bucket_seconds or _setting('AUTOCOMMIT_HISTORY_BUCKET', 3600)
+    if HISTORY_BRANCH not in repo.heads:
+        return 0
+
+    tip = repo.heads[HISTORY_BRANCH].commit
+    try:
+        bases = repo.merge_base(tip, repo.head.commit)
+    except ValueError:
+        bases = []
+    base = bases[0] if bases else None
+
+    rev = f"{base.hexsha}..{tip.hexsha}" if base is not None else tip.hexsha
+    chain = list(repo.iter_commits(rev, first_parent=True))
+    if len(chain) <= keep_recent or any(len(commit.parents) > 1 for commit in chain):
+        return 0
+
+    recent = list(reversed(chain[:keep_recent]))
+    old = list(reversed(chain[keep_recent:]))
+    buckets = []
+    for commit in old:
+        key = commit.committed_date // bucket_seconds
+        if buckets and buckets[-1][0] == key:
+            buckets[-1][1].append(commit)
+        else:
+            buckets.append((key, [commit]))
+    if len(buckets) == len(old):
+        return 0
+
+    parent = base
+    rewritten = False
+    for _, bucket in buckets:
+        last = bucket[-1]
+        if len(bucket) == 1 and not rewritten:
+            # Leading single-commit buckets are already in their final form
+            parent = last
+            continue
+        message = _squash_message(bucket) if len(bucket) > 1 else last.message
+        parent = _replay(repo, last, last.tree, message, parent)
+        rewritten = True
+    for commit in recent:
+        parent = _replay(repo, commit, commit.tree, commit.message, parent)
+
+    recorded = ''
+    tip_path = os.path.join(repo.git_dir, HISTORY_INDEX_TIP)
+    if os.path.exists(tip_path):
+        with open(tip_path, 'r') as f:
+            recorded = f.read().strip()
+    repo.heads[HISTORY_BRANCH].set_commit(parent, logmsg='maintenance: compact history')
+    if recorded == tip.hexsha:
+        # Same tree as the old tip, so the private history index is still valid
+        _record_history_tip(repo, parent)
+
+    squashed = len(chain) - len(buckets) - len(recent)
+    logger.info(f"Compacted history in {repo.working_tree_dir}: {len(chain)} -> {len(chain) - squashed} commits")
+    return squashed
+
+
+def object_stats(repo):
+    """Parse `git count-objects -v` into a dict of ints (sizes in KiB)"""
+    stats = {}
+    for line in repo.git.count_objects('-v').splitlines():
+        key, _, value = line.partition(':')
+        try:
+            stats[key.strip()] = int(value.strip())
+        except ValueError:
+            continue
+    return stats
+
+
+def estimate_loose_objects(location):
+    """
+    Cheap estimate of the number of loose objects, the way `git gc --auto` does:
+    count one of the 256 fan-out directories and scale up
+    """
+    try:
+        return len(os.listdir(os.path.join(location, '.git', 'objects', '17'))) * 256
+    except OSError:
+        return 0
+
+
+def maintenance_due(repository, record=None):
+    """Whether the repository's scheduled run has come, or its loose objects have piled up"""
+    if record is None:
+        record = RepositoryMaintenance.objects.filter(repository=repository).first()
+    if record is None or record.next_run_at is None or record.next_run_at <= timezone.now():
+        return True
+    return estimate_loose_objects(repository.location) >= _setting('GIT_MAINTENANCE_LOOSE_OBJECTS', 1000)
+
+
+def run_maintenance(repository, compact=True):
+    """
+    Compact the history branch and run whichever git housekeeping the repository needs
+
+    Loose objects beyond the threshold are packed incrementally, too many
+    packs (or a compaction that orphaned commits) trigger a full `git gc`, and
+    the commit-graph is refreshed whenever the object store changed. The
+    outcome is stored on the repository's RepositoryMaintenance row together
+    with the next scheduled run.
+
+    Returns:
+        RepositoryMaintenance: the updated stats row
+    """
+    record, _ = RepositoryMaintenance.objects.get_or_create(repository=repository)
+    started = time.monotonic()
+    actions = []
+    record.last_error = ''
+
+    try:
+        # Only the rewrite needs the repository lock; saves keep committing while gc runs
+        with git_repo(repository.location, write=True) as repo:
+            old_tip = repo.heads[HISTORY_BRANCH].commit.hexsha if HISTORY_BRANCH in repo.heads else None
+            squashed = compact_history(repo) if compact else 0
+            if squashed:
+                actions.append('compact')
+                record.commits_squashed += squashed
+                record.last_compacted_at = timezone.now()
+                # Let gc drop the replaced snapshots rather than keeping them alive through the reflog
+                repo.git.reflog('expire', '--expire-unreachable=now', f"refs/heads/{HISTORY_BRANCH}")
+                new_tip = repo.heads[HISTORY_BRANCH].commit.hexsha
+                Repository.objects.filter(id=repository.id, last_commit_hash=old_tip).update(last_commit_hash=new_tip)
+
+        with git_repo(repository.location) as repo:
+            stats = object_stats(repo)
+            if squashed or stats.get('packs', 0) >= _setting('GIT_MAINTENANCE_MAX_PACKS', 20):
+                # Objects newer than the prune expiry survive, so commits made meanwhile are safe
+                repo.git.gc('--quiet', f"--prune={_setting('GIT_MAINTENANCE_PRUNE_EXPIRE', '2.weeks.ago')}")
+                actions.append('gc')
+            elif stats.get('count', 0) >= _setting('GIT_MAINTENANCE_LOOSE_OBJECTS', 1000):
+                repo.git.repack('-d', '-l', '-q')
+                repo.git.commit_graph('write', '--reachable')
+                actions.extend(['repack', 'commit-graph'])
+            elif not os.path.exists(os.path.join(repo.git_dir, 'objects', 'info', 'commit-graph')):
+                repo.git.commit_graph('write', '--reachable')
+                actions.append('commit-graph')
+
+            if actions:
+                stats = object_stats(repo)
+    except (git.exc.GitError, OSError, ValueError) as e:
+        logger.error(f"Maintenance failed for {repository.location}: {str(e)}")
+        record.last_error = str(e)
+        stats = {}
+
+    now = timezone.now()
+    interval = _setting('GIT_MAINTENANCE_INTERVAL', 86400)
+    if record.last_error:
+        interval = min(interval, 3600)
+    record.last_run_at = now
+    record.next_run_at = now + timedelta(seconds=interval)
+    record.loose_objects = stats.get('count', record.loose_objects)
+    record.loose_size_kb = stats.get('size', record.loose_size_kb)
+    record.packs = stats.get('packs', record.packs)
+    record.pack_size_kb = stats.get('size-pack', record.pack_size_kb)
+    record.last_actions = ','.join(actions)
+    record.last_duration_ms = int((time.monotonic() - started) * 1000)
+    record.save()
+
+    if actions:
+        logger.info(f"Maintenance on {repository.location}: {record.last_actions} in {record.last_duration_ms}ms")
+    return record
+
+
+def run_maintenance_if_due(repository_id):
+    """Run maintenance for the repository when its schedule or loose object count says so"""
+    repository = Repository.objects.filter(id=repository_id).first()
+    if repository is None or not os.path.exists(repository.location):
+        return None
+    record, _ = RepositoryMaintenance.objects.get_or_create(
+        repository=repository,
+        defaults={'next_run_at': timezone.now() + timedelta(seconds=_setting('GIT_MAINTENANCE_INTERVAL', 86400))}
+    )
+    if not maintenance_due(repository, record):
+        return None
+    return run_maintenance(repository)
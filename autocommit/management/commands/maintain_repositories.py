@@ -0,0 +1,52 @@
+import os
+
+from django.core.management.base import BaseCommand
+
+from autocommit.maintenance import maintenance_due, run_maintenance
+from filesys.models import Repository
+
+
+class Command(BaseCommand):
+    help = 'Compact history branches and run git gc/repack/commit-graph on repositories that are due'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'slugs',
+            nargs='*',
+            help='Only maintain these repositories (owner/name); defaults to all'
+        )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Run even for repositories whose next scheduled run has not come yet'
+        )
+        parser.add_argument(
+            '--no-compact',
+            action='store_true',
+            help='Skip history-branch compaction and only run git housekeeping'
+        )
+
+    def handle(self, *args, **options):
+        repositories = Repository.objects.select_related('maintenance').order_by('id')
+        if options['slugs']:
+            repositories = repositories.filter(slug__in=options['slugs'])
+
+        ran = 0
+        for repository in repositories:
+            if not os.path.exists(repository.location):
+                continue
+            record = getattr(repository, 'maintenance', None)
+            if not options['force'] and record is not None and not maintenance_due(repository, record):
+                continue
+            record = run_maintenance(repository, compact=not options['no_compact'])
+            ran += 1
+            line = (
+                f"{repository.slug}: {record.last_actions or 'nothing to do'} "
+                f"({record.loose_objects} loose, {record.packs} pack(s), {record.last_duration_ms}ms)"
+            )
+            if record.last_error:
+                self.stderr.write(f"{line} - {record.last_error}")
+            else:
+                self.stdout.write(line)
+
+        self.stdout.write(self.style.SUCCESS(f"Maintained {ran} repositor{'y' if ran == 1 else 'ies'}"))
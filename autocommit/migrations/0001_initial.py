@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-19 04:21
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('filesys', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PendingAutoCommit',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('requested_at', models.DateTimeField()),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('repository', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='pending_autocommit', to='filesys.repository')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='RepositoryMaintenance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_run_at', models.DateTimeField(blank=True, null=True)),
+                ('next_run_at', models.DateTimeField(blank=True, db_index=True, null=True)),
+                ('last_compacted_at', models.DateTimeField(blank=True, null=True)),
+                ('commits_squashed', models.PositiveIntegerField(default=0)),
+                ('loose_objects', models.PositiveIntegerField(default=0)),
+                ('loose_size_kb', models.PositiveIntegerField(default=0)),
+                ('packs', models.PositiveIntegerField(default=0)),
+                ('pack_size_kb', models.PositiveIntegerField(default=0)),
+                ('last_actions', models.CharField(blank=True, max_length=255)),
+                ('last_duration_ms', models.PositiveIntegerField(default=0)),
+                ('last_error', models.TextField(blank=True)),
+                ('repository', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='maintenance', to='filesys.repository')),
+            ],
+        ),
+    ]
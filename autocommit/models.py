@@ -0,0 +1,43 @@
+from django.db import models
+from filesys.models import Repository
+
+
+class PendingAutoCommit(models.Model):
+    """
+    Crash-safe marker for a repository with an auto-commit still to run.
+    Created when the first trigger arrives and removed once the snapshot is taken,
+    so markers left behind by a crash are picked up again on the next start.
+    """
+    repository = models.OneToOneField(
+        Repository,
+        on_delete=models.CASCADE,
+        related_name='pending_autocommit'
+    )
+    requested_at = models.DateTimeField()
+    attempts = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"Pending auto-commit for {self.repository_id} since {self.requested_at}"
+
+
+class RepositoryMaintenance(models.Model):
+    """Per-repository git maintenance schedule and the stats from its last run"""
+    repository = models.OneToOneField(
+        Repository,
+        on_delete=models.CASCADE,
+        related_name='maintenance'
+    )
+    last_run_at = models.DateTimeField(blank=True, null=True)
+    next_run_at = models.DateTimeField(blank=True, null=True, db_index=True)
+    last_compacted_at = models.DateTimeField(blank=True, null=True)
+    commits_squashed = models.PositiveIntegerField(default=0)
+    loose_objects = models.PositiveIntegerField(default=0)
+    loose_size_kb = models.PositiveIntegerField(default=0)
+    packs = models.PositiveIntegerField(default=0)
+    pack_size_kb = models.PositiveIntegerField(default=0)
+    last_actions = models.CharField(max_length=255, blank=True)
+    last_duration_ms = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+
+    def __str__(self):
+        return f"Maintenance for {self.repository_id} (next run {self.next_run_at})"
@@ -0,0 +1,173 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import F
+from django.utils import timezone
+
+from .maintenance import run_maintenance_if_due
+from .models import PendingAutoCommit
+from .tasks import auto_commit_changes
+
+logger = logging.getLogger(__name__)
+
+
+class AutoCommitScheduler:
+    """
+    Runs auto_commit_changes in a background worker pool, debounced per repository
+
+    Triggers for a repository coalesce until no new one has arrived for the
+    debounce period, but a snapshot is never delayed more than the max latency
+    after the first pending trigger. At most one snapshot per repository runs
+    at a time; triggers arriving meanwhile schedule one follow-up run. A
+    PendingAutoCommit row marks each repository with outstanding work so
+    nothing is lost if the process dies before the snapshot is taken.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._executor = None
+        self._timers = {}
+        self._first_trigger = {}
+        self._running = set()
+        self._rerun = set()
+        self._recovered = False
+
+    @property
+    def debounce(self):
+        return getattr(settings, 'AUTOCOMMIT_DEBOUNCE', 5.0)
+
+    @property
+    def max_latency(self):
+        return getattr(settings, 'AUTOCOMMIT_MAX_LATENCY', 60.0)
+
+    def _get_executor(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'AUTOCOMMIT_WORKERS', 4),
+                thread_name_prefix='autocommit'
+            )
+        return self._executor
+
+    def schedule(self, repository_id):
+        """
+        Request an auto-commit for the repository; returns immediately
+
+        Only the in-memory deadline is updated under the lock. The pending
+        marker is written after releasing it, and only by the first trigger
+        of a debounce window (or the first one during a running commit).
+        """
+        with self._lock:
+            if repository_id in self._running:
+                first = repository_id not in self._rerun
+                self._rerun.add(repository_id)
+            else:
+                now = time.monotonic()
+                first = repository_id not in self._first_trigger
+                if first:
+                    self._first_trigger[repository_id] = now
+                waited = now - self._first_trigger[repository_id]
+                self._arm(repository_id, max(0, min(self.debounce, self.max_latency - waited)))
+        if first:
+            self._mark_pending(repository_id)
+
+    def _mark_pending(self, repository_id):
+        # requested_at moves forward so a run that started earlier never clears this marker
+        PendingAutoCommit.objects.update_or_create(
+            repository_id=repository_id,
+            defaults={'requested_at': timezone.now()}
+        )
+
+    def _arm(self, repository_id, delay):
+        # Caller holds self._lock
+        timer = self._timers.pop(repository_id, None)
+        if timer is not None:
+            timer.cancel()
+        timer = threading.Timer(delay, self._submit, args=(repository_id,))
+        timer.daemon = True
+        self._timers[repository_id] = timer
+        timer.start()
+
+    def _submit(self, repository_id):
+        with self._lock:
+            self._timers.pop(repository_id, None)
+            self._first_trigger.pop(repository_id, None)
+            if repository_id in self._running:
+                self._rerun.add(repository_id)
+                return
+            self._running.add(repository_id)
+        self._get_executor().submit(self._run, repository_id)
+
+    def _run(self, repository_id):
+        started_at = timezone.now()
+        try:
+            PendingAutoCommit.objects.filter(repository_id=repository_id).update(attempts=F('attempts') + 1)
+            auto_commit_changes(repository_id)
+        except Exception as e:
+            logger.error(f"Scheduled auto-commit failed for repository {repository_id}: {str(e)}")
+        try:
+            # Piggyback git maintenance on the worker that just wrote to the repository
+            run_maintenance_if_due(repository_id)
+        except Exception as e:
+            logger.error(f"Scheduled maintenance failed for repository {repository_id}: {str(e)}")
+        finally:
+            with self._lock:
+                self._running.discard(repository_id)
+                done = repository_id not in self._rerun and repository_id not in self._timers
+                if not done and repository_id in self._rerun:
+                    self._rerun.discard(repository_id)
+                    self._first_trigger[repository_id] = time.monotonic()
+                    self._arm(repository_id, self.debounce)
+            if done:
+                # A trigger after the run started has moved requested_at past started_at
+                PendingAutoCommit.objects.filter(
+                    repository_id=repository_id, requested_at__lte=started_at
+                ).delete()
+            connections.close_all()
+
+    def recover(self):
+        """
+        Schedule every repository left with a pending marker by a previous process
+
+        Called once at startup by AutocommitConfig.ready; later calls do nothing.
+        """
+        if self._recovered:
+            return
+        pending = list(PendingAutoCommit.objects.values_list('repository_id', flat=True))
+        with self._lock:
+            if self._recovered:
+                return
+            self._recovered = True
+            for repository_id in pending:
+                self._first_trigger.setdefault(repository_id, time.monotonic())
+                self._arm(repository_id, 0)
+        if pending:
+            logger.info(f"Recovered {len(pending)} pending auto-commit(s)")
+
+    def flush(self, timeout=None):
+        """Run every pending auto-commit now and wait for the worker pool to drain"""
+        with self._lock:
+            pending = list(self._timers)
+            for repository_id in pending:
+                self._timers[repository_id].cancel()
+        for repository_id in pending:
+            self._submit(repository_id)
+        deadline = time.monotonic() + timeout if timeout else None
+        while True:
+            with self._lock:
+                if not self._running and not self._timers:
+                    return True
+            if deadline and time.monotonic() > deadline:
+                return False
+            time.sleep(0.05)
+
+
+scheduler = AutoCommitScheduler()
+
+
+def schedule_auto_commit(repository_id):
+    """Debounced, non-blocking replacement for calling auto_commit_changes inline"""
+    scheduler.schedule(repository_id)
@@ -3,9 +3,110 @@ import git
 import logging
 from django.conf import settings
 from filesys.models import Repository
+from filesys.dirty import tracker as dirty_tracker
+from filesys.git_pool import drop_ignored, git_repo, stage_and_commit
 
 logger = logging.getLogger(__name__)
 
+HISTORY_BRANCH = 'history'
+# Private index for the history branch, so snapshots never touch the main index,
+# HEAD or the working tree. The sidecar records which history commit it matches.
+HISTORY_INDEX = 'history-index'
+HISTORY_INDEX_TIP = 'history-index.tip'
+
+def _history_tip(repo):
+    """Current history branch commit, or HEAD's commit when the branch does not exist yet"""
+    if HISTORY_BRANCH in repo.heads:
+        return repo.heads[HISTORY_BRANCH].commit
+    try:
+        return repo.head.commit
+    except ValueError:
+        return None
+
+def _load_history_index(repo, tip):
+    """Open the private history index, rebuilding it from `tip` if it is missing or stale"""
+    index_path = os.path.join(repo.git_dir, HISTORY_INDEX)
+    tip_path = os.path.join(repo.git_dir, HISTORY_INDEX_TIP)
+    tip_sha = tip.hexsha if tip else ''
+
+    recorded = ''
+    if os.path.exists(tip_path):
+        with open(tip_path, 'r') as f:
+            recorded = f.read().strip()
+
+    if os.path.exists(index_path) and recorded == tip_sha:
+        return git.IndexFile(repo, index_path)
+
+    if tip is not None:
+        index = git.IndexFile.from_tree(repo, tip)
+    else:
+        index = git.IndexFile(repo, index_path)
+        index.entries.clear()
+    index.write(index_path)
+    return git.IndexFile(repo, index_path)
+
+def _record_history_tip(repo, commit):
+    with open(os.path.join(repo.git_dir, HISTORY_INDEX_TIP), 'w') as f:
+        f.write(commit.hexsha)
+
+def get_history_changes(repo):
+    """
+    Paths whose working tree state differs from the history index
+    (modified, deleted and untracked files, honouring .gitignore)
+    """
+    index_path = os.path.join(repo.git_dir, HISTORY_INDEX)
+    output = repo.git.ls_files(
+        '-z', '--modified', '--deleted', '--others', '--exclude-standard',
+        env={'GIT_INDEX_FILE': index_path}
+    )
+    return list(dict.fromkeys(path for path in output.split('\0') if path))
+
+def commit_history_snapshot(repo, changed_files=None):
+    """
+    Record the working tree on the history branch using plumbing only
+
+    Changed paths are hashed into the private history index, the tree is
+    written from it and a commit is created on top of the current history tip;
+    the branch ref is then moved directly. HEAD, the main index and the
+    working tree are never touched, and only the changed paths are re-hashed.
+
+    Returns:
+        Commit: the new history commit, or None if nothing changed
+    """
+    tip = _history_tip(repo)
+    index = _load_history_index(repo, tip)
+    if changed_files is None:
+        changed_files = get_history_changes(repo)
+    if not changed_files:
+        return None
+
+    existing = [path for path in changed_files if os.path.lexists(os.path.join(repo.working_tree_dir, path))]
+    removed = [path for path in changed_files if path not in existing]
+    existing = drop_ignored(repo, index, existing)
+    if existing:
+        index.add(existing, write=False)
+    for path in removed:
+        index.entries.pop((path, 0), None)
+    index.write()
+
+    tree = index.write_tree()
+    if tip is not None and tip.tree.binsha == tree.binsha:
+        return None
+
+    commit = git.Commit.create_from_tree(
+        repo,
+        tree,
+        generate_commit_message(existing + removed),
+        parent_commits=[tip] if tip is not None else [],
+        head=False
+    )
+    if HISTORY_BRANCH in repo.heads:
+        repo.heads[HISTORY_BRANCH].set_commit(commit, logmsg='autocommit: snapshot')
+    else:
+        repo.create_head(HISTORY_BRANCH, commit)
+    _record_history_tip(repo, commit)
+    return commit
+
 def auto_commit_changes(repository_id):
     """
     Automatically commit changes for a specific repository on the history branch
@@ -20,42 +121,33 @@ def auto_commit_changes(repository_id):
             logger.warning(f"Repository path does not exist: {repo_path}")
             return
             
-        repo = git.Repo(repo_path)
-        changed_files = get_changed_files(repo)
+        # Only the paths our write paths marked dirty are staged, with a periodic
+        # full working tree scan to pick up changes made outside the API
+        dirty_paths, full_scan = dirty_tracker.take(repo_path, 'history')
 
-        if changed_files:
+        # Reuse a pooled handle; the repository lock serializes index access with the commit queue
+        with git_repo(repo_path, write=True) as repo:
             try:
-                # Ensure we're on the history branch
-                if 'history' not in repo.heads:
-                    # Create history branch if it doesn't exist
-                    history_branch = repo.create_head('history')
-                    history_branch.checkout()
-                else:
-                    # Switch to history branch
-                    repo.heads.history.checkout()
-
-                # Stage all changes
-                repo.git.add(A=True)
-                
-                # Generate commit message with file details
-                commit_message = generate_commit_message(changed_files)
-                
-                # Create commit
-                commit = repo.index.commit(commit_message)
-                
-                # Update repository last commit hash
-                repository.last_commit_hash = commit.hexsha
-                repository.save()
-                
-                logger.info(f"✅ Created commit in {repo_path} on history branch: {commit_message}")
-                return True
-                
+                changed_files = dirty_paths
+                if full_scan:
+                    changed_files = sorted(set(dirty_paths) | set(get_history_changes(repo)))
+                commit = commit_history_snapshot(repo, changed_files)
             except Exception as e:
+                dirty_tracker.restore(repo_path, 'history', dirty_paths)
                 logger.error(f"Failed to create commit: {str(e)}")
                 return False
-        else:
+        if full_scan:
+            dirty_tracker.mark_reconciled(repo_path, 'history')
+
+        if commit is None:
             logger.info(f"No changes detected in {repo_path}")
             return False
+
+        # Update repository last commit hash
+        Repository.objects.filter(id=repository.id).update(last_commit_hash=commit.hexsha)
+
+        logger.info(f"✅ Created commit in {repo_path} on history branch: {commit.summary}")
+        return True
             
     except Repository.DoesNotExist:
         logger.error(f"Repository with ID {repository_id} not found")
@@ -114,37 +206,47 @@ def commit_to_main(repository_id):
             logger.warning(f"Repository path does not exist: {repo_path}")
             return False
             
-        repo = git.Repo(repo_path)
-        changed_files = get_changed_files(repo)
+        with git_repo(repo_path, write=True) as repo:
+            main_branch = 'main' if 'main' in repo.heads else 'master'
+            if not repo.head.is_detached and repo.head.reference.name == HISTORY_BRANCH:
+                # Repositories from before history snapshots used plumbing were left with the
+                # history branch checked out; point HEAD back without touching the working tree
+                repo.head.reference = repo.heads[main_branch]
 
-        if changed_files:
-            try:
-                # Switch to main/master branch
-                main_branch = 'main' if 'main' in repo.heads else 'master'
-                repo.heads[main_branch].checkout()
+            dirty_paths, full_scan = dirty_tracker.take(repo_path, 'main')
+            changed_files = dirty_paths
+            if full_scan:
+                changed_files = sorted(set(dirty_paths) | set(get_changed_files(repo)))
+                dirty_tracker.mark_reconciled(repo_path, 'main')
 
-                # Stage all changes
-                repo.git.add(A=True)
-                
-                # Generate commit message
-                commit_message = generate_commit_message(changed_files)
+            if changed_files:
+                try:
+                    # Stage exactly the changed paths and commit in-process
+                    commit_message = generate_commit_message(changed_files)
+                    removed = [
+                        path for path in changed_files
+                        if not os.path.lexists(os.path.join(repo_path, path))
+                    ]
+                    existing = [path for path in changed_files if path not in removed]
+                    commit = stage_and_commit(repo, commit_message, existing, removed)
+                    if commit is None:
+                        logger.info(f"No changes detected in {repo_path}")
+                        return False
                 
-                # Create commit
-                commit = repo.index.commit(commit_message)
+                    # Update repository last commit hash
+                    repository.last_commit_hash = commit.hexsha
+                    repository.save()
                 
-                # Update repository last commit hash
-                repository.last_commit_hash = commit.hexsha
-                repository.save()
+                    logger.info(f"✅ Created commit in {repo_path} on {main_branch} branch: {commit_message}")
+                    return True
                 
-                logger.info(f"✅ Created commit in {repo_path} on {main_branch} branch: {commit_message}")
-                return True
-                
-            except Exception as e:
-                logger.error(f"Failed to create commit on main: {str(e)}")
+                except Exception as e:
+                    dirty_tracker.restore(repo_path, 'main', dirty_paths)
+                    logger.error(f"Failed to create commit on main: {str(e)}")
+                    return False
+            else:
+                logger.info(f"No changes detected in {repo_path}")
                 return False
-        else:
-            logger.info(f"No changes detected in {repo_path}")
-            return False
             
     except Repository.DoesNotExist:
         logger.error(f"Repository with ID {repository_id} not found")
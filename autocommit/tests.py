@@ -1,3 +1,277 @@
-from django.test import TestCase
+import os
+import shutil
+import tempfile
+from datetime import datetime, timedelta, timezone as dt_timezone
+from unittest import mock
 
-# Create your tests here.
+import git
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from filesys.dirty import DirtyTracker, mark_dirty, tracker as dirty_tracker
+from filesys.git_pool import pool
+from filesys.models import Repository
+from .maintenance import compact_history, run_maintenance
+from .models import PendingAutoCommit
+from .scheduler import AutoCommitScheduler
+from .tasks import HISTORY_BRANCH, HISTORY_INDEX, auto_commit_changes, commit_history_snapshot
+
+START = datetime(2024, 1, 1, tzinfo=dt_timezone.utc)
+
+
+class HistoryCompactionTests(TestCase):
+    """
+    Compaction rewrites only the history branch: old snapshots are squashed
+    per time bucket, the newest ones are replayed unchanged, and the tip keeps
+    its tree.
+    """
+
+    def setUp(self):
+        self.location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.location, ignore_errors=True)
+        self.repo = git.Repo.init(self.location)
+        self.addCleanup(self.repo.close)
+        with self.repo.config_writer() as config:
+            config.set_value('user', 'name', 'owner')
+            config.set_value('user', 'email', 'owner@example.com')
+        self.base = self._commit('base', 'initial', START - timedelta(days=1), head=True)
+        self.repo.create_head(HISTORY_BRANCH, self.base)
+
+    def _commit(self, content, message, when, head=False):
+        with open(os.path.join(self.location, 'main.py'), 'w') as f:
+            f.write(content)
+        self.repo.index.add(['main.py'])
+        tree = self.repo.index.write_tree()
+        parent = self.repo.heads[HISTORY_BRANCH].commit if HISTORY_BRANCH in self.repo.heads else None
+        date = f'{int(when.timestamp())} +0000'
+        commit = git.Commit.create_from_tree(
+            self.repo, tree, message, parent_commits=[parent] if parent else [], head=head,
+            author_date=date, commit_date=date
+        )
+        if not head:
+            self.repo.heads[HISTORY_BRANCH].set_commit(commit)
+        return commit
+
+    def _snapshots(self, count, spacing):
+        for i in range(count):
+            self._commit(f'print({i})\n', f'Auto-commit {i}\n\n- main.py', START + i * spacing)
+
+    def _history(self):
+        return list(self.repo.iter_commits(f'{self.base.hexsha}..{HISTORY_BRANCH}', first_parent=True))
+
+    def test_squashes_old_snapshots_per_bucket(self):
+        # The six oldest of eight snapshots 20 minutes apart fall into two hourly buckets
+        self._snapshots(8, timedelta(minutes=20))
+        tip = self.repo.heads[HISTORY_BRANCH].commit
+
+        squashed = compact_history(self.repo, keep_recent=2, bucket_seconds=3600)
+
+        history = self._history()
+        self.assertEqual(squashed, 4)
+        self.assertEqual(len(history), 4)
+        self.assertEqual(history[0].tree.hexsha, tip.tree.hexsha)
+        # The recent snapshots keep their messages and dates
+        self.assertEqual([c.message for c in history[:2]], [c.message for c in (tip, tip.parents[0])])
+        self.assertEqual(history[0].committed_date, tip.committed_date)
+        self.assertTrue(history[-1].message.startswith('chore: squashed'))
+        self.assertEqual(history[-1].parents, (self.base,))
+        # The main branch is never rewritten
+        self.assertEqual(self.repo.head.commit, self.base)
+
+    def test_nothing_to_squash(self):
+        self._snapshots(5, timedelta(hours=2))
+        tip = self.repo.heads[HISTORY_BRANCH].commit
+        self.assertEqual(compact_history(self.repo, keep_recent=2, bucket_seconds=3600), 0)
+        self.assertEqual(self.repo.heads[HISTORY_BRANCH].commit, tip)
+        self.assertEqual(compact_history(self.repo, keep_recent=10, bucket_seconds=10 ** 9), 0)
+
+    def test_run_maintenance_records_compaction(self):
+        self._snapshots(6, timedelta(minutes=1))
+        old_tip = self.repo.heads[HISTORY_BRANCH].commit.hexsha
+        user = get_user_model().objects.create_user('owner', 'owner@example.com', 'pw')
+        repository = Repository.objects.create(
+            user=user, name='proj', location=self.location, git_initialized=True, last_commit_hash=old_tip
+        )
+        self.addCleanup(pool.discard, self.location)
+
+        with override_settings(AUTOCOMMIT_HISTORY_KEEP_RECENT=1, AUTOCOMMIT_HISTORY_BUCKET=3600):
+            record = run_maintenance(repository)
+
+        new_tip = self.repo.heads[HISTORY_BRANCH].commit
+        self.assertEqual(record.last_error, '')
+        self.assertEqual(record.commits_squashed, 4)
+        self.assertIn('compact', record.last_actions)
+        self.assertIn('gc', record.last_actions)
+        self.assertEqual(len(self._history()), 2)
+        repository.refresh_from_db()
+        self.assertEqual(repository.last_commit_hash, new_tip.hexsha)
+        self.assertEqual(self.repo.git.fsck('--no-dangling'), '')
+
+
+class SchedulerMarkerTests(TestCase):
+    """
+    The pending marker is written outside the scheduler lock, once per debounce
+    window, and a finished run only clears markers older than its own start.
+    """
+
+    def setUp(self):
+        user = get_user_model().objects.create_user('owner', 'owner@example.com', 'pw')
+        self.repository = Repository.objects.create(user=user, name='proj', location=tempfile.gettempdir())
+        self.scheduler = AutoCommitScheduler()
+        # No timers: the tests drive _run directly
+        patcher = mock.patch.object(AutoCommitScheduler, '_arm')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_marker_written_without_lock_once_per_window(self):
+        held = []
+        original = PendingAutoCommit.objects.update_or_create
+
+        def record(*args, **kwargs):
+            held.append(self.scheduler._lock.locked())
+            return original(*args, **kwargs)
+
+        with mock.patch.object(PendingAutoCommit.objects, 'update_or_create', side_effect=record):
+            for _ in range(3):
+                self.scheduler.schedule(self.repository.id)
+
+        self.assertEqual(held, [False])
+        self.assertTrue(PendingAutoCommit.objects.filter(repository=self.repository).exists())
+
+    @mock.patch('autocommit.scheduler.run_maintenance_if_due')
+    @mock.patch('autocommit.scheduler.auto_commit_changes')
+    def test_run_clears_marker_unless_newer_trigger(self, auto_commit, maintenance):
+        self.scheduler.schedule(self.repository.id)
+        self.scheduler._first_trigger.clear()
+        with mock.patch('autocommit.scheduler.connections'):
+            self.scheduler._run(self.repository.id)
+        self.assertFalse(PendingAutoCommit.objects.filter(repository=self.repository).exists())
+
+        # A trigger written while the run was in progress survives its cleanup
+        def late_trigger(repository_id):
+            PendingAutoCommit.objects.create(
+                repository_id=repository_id, requested_at=timezone.now() + timedelta(seconds=1)
+            )
+
+        auto_commit.side_effect = late_trigger
+        with mock.patch('autocommit.scheduler.connections'):
+            self.scheduler._run(self.repository.id)
+        self.assertTrue(PendingAutoCommit.objects.filter(repository=self.repository).exists())
+
+
+class HistorySnapshotTests(SimpleTestCase):
+    """Snapshots go to the history branch through a private index; HEAD, the main index and the tree stay put"""
+
+    def setUp(self):
+        self.location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.location, ignore_errors=True)
+        self.repo = git.Repo.init(self.location)
+        self.addCleanup(self.repo.close)
+        with self.repo.config_writer() as config:
+            config.set_value('user', 'name', 'owner')
+            config.set_value('user', 'email', 'owner@example.com')
+        self._write('.gitignore', 'build/\n')
+        self._write('main.py', 'print(1)\n')
+        self.repo.index.add(['.gitignore', 'main.py'])
+        self.head = self.repo.index.commit('initial')
+
+    def _write(self, path, content):
+        full_path = os.path.join(self.location, path)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        with open(full_path, 'w') as f:
+            f.write(content)
+
+    def _read_index(self):
+        with open(os.path.join(self.repo.git_dir, 'index'), 'rb') as f:
+            return f.read()
+
+    def _history_files(self):
+        return {blob.path for blob in self.repo.heads[HISTORY_BRANCH].commit.tree.traverse() if blob.type == 'blob'}
+
+    def test_snapshot_leaves_head_index_and_tree_alone(self):
+        self._write('main.py', 'print(2)\n')
+        self._write('util.py', 'x = 1\n')
+        self._write('build/out.o', 'binary')
+        index_before = self._read_index()
+
+        commit = commit_history_snapshot(self.repo)
+        self.assertEqual(list(commit.parents), [self.head])
+        self.assertEqual(self._history_files(), {'.gitignore', 'main.py', 'util.py'})
+        self.assertEqual(self.repo.head.commit, self.head)
+        self.assertNotEqual(self.repo.active_branch.name, HISTORY_BRANCH)
+        self.assertEqual(self._read_index(), index_before)
+        self.assertTrue(os.path.exists(os.path.join(self.repo.git_dir, HISTORY_INDEX)))
+        self.assertEqual(self.repo.git.diff('HEAD', '--name-only'), 'main.py')
+
+        # Nothing new to record
+        self.assertIsNone(commit_history_snapshot(self.repo))
+
+    def test_snapshot_of_given_paths_records_removals(self):
+        commit_history_snapshot(self.repo, ['main.py'])
+        os.remove(os.path.join(self.location, 'main.py'))
+        self._write('other.py', 'y = 2\n')
+        # Only the listed path is looked at; other.py waits for its own trigger
+        commit = commit_history_snapshot(self.repo, ['main.py'])
+        self.assertEqual(commit.summary, 'chore: auto-commit 1 file(s)')
+        self.assertEqual(self._history_files(), {'.gitignore'})
+
+
+class DirtyTrackingTests(TestCase):
+    """Auto-commits stage the paths the write paths marked, with a periodic full scan for the rest"""
+
+    def setUp(self):
+        self.location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.location, ignore_errors=True)
+        with git.Repo.init(self.location) as repo:
+            with repo.config_writer() as config:
+                config.set_value('user', 'name', 'owner')
+                config.set_value('user', 'email', 'owner@example.com')
+            self._write('main.py', 'print(1)\n')
+            repo.index.add(['main.py'])
+            repo.index.commit('initial')
+        user = get_user_model().objects.create_user('owner', 'owner@example.com', 'pw')
+        self.repository = Repository.objects.create(
+            user=user, name='proj', location=self.location, git_initialized=True
+        )
+        self.addCleanup(pool.discard, self.location)
+        self.addCleanup(dirty_tracker.forget, self.location)
+
+    def _write(self, path, content):
+        with open(os.path.join(self.location, path), 'w') as f:
+            f.write(content)
+
+    def _history_files(self):
+        with git.Repo(self.location) as repo:
+            return {blob.path: blob.data_stream.read() for blob in repo.heads[HISTORY_BRANCH].commit.tree.traverse()}
+
+    def test_tracker_per_consumer(self):
+        tracker = DirtyTracker()
+        tracker.mark('/repo', ['a.py', 'b.py', ''])
+        self.assertEqual(tracker.take('/repo', 'history'), (['a.py', 'b.py'], True))
+        tracker.mark_reconciled('/repo', 'history')
+        self.assertEqual(tracker.take('/repo', 'history'), ([], False))
+        # The main consumer still has its own copy
+        self.assertEqual(tracker.take('/repo', 'main')[0], ['a.py', 'b.py'])
+        tracker.restore('/repo', 'history', ['a.py'])
+        self.assertEqual(tracker.take('/repo', 'history'), (['a.py'], False))
+        with override_settings(FILESYS_DIRTY_RECONCILE_INTERVAL=0):
+            self.assertTrue(tracker.take('/repo', 'history')[1])
+
+    def test_only_marked_paths_between_reconciles(self):
+        # The first run reconciles the whole tree
+        self._write('outside.py', 'a = 1\n')
+        self.assertTrue(auto_commit_changes(self.repository.id))
+        self.assertIn('outside.py', self._history_files())
+
+        # Changed behind the API's back: not picked up until the next reconcile
+        self._write('outside.py', 'a = 2\n')
+        self._write('main.py', 'print(2)\n')
+        mark_dirty(self.repository, ['main.py'])
+        self.assertTrue(auto_commit_changes(self.repository.id))
+        files = self._history_files()
+        self.assertEqual((files['main.py'], files['outside.py']), (b'print(2)\n', b'a = 1\n'))
+
+        with override_settings(FILESYS_DIRTY_RECONCILE_INTERVAL=0):
+            self.assertTrue(auto_commit_changes(self.repository.id))
+        self.assertEqual(self._history_files()['outside.py'], b'a = 2\n')
@@ -5,4 +5,7 @@ urlpatterns = [
     re_path(r'^(?P<repository_slug>[\w-]+/[\w-]+)/commit-main/$',
          views.commit_to_main_branch, 
          name='commit-to-main'),
+    re_path(r'^(?P<repository_slug>[\w-]+/[\w-]+)/maintenance/$',
+         views.repository_maintenance_stats,
+         name='repository-maintenance'),
 ]
\ No newline at end of file
@@ -5,6 +5,7 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import status
 from .tasks import commit_to_main
+from .models import RepositoryMaintenance
 from filesys.models import Repository
 import logging
 
@@ -63,3 +64,41 @@ def commit_to_main_branch(request, repository_slug):
             {"error": "An unexpected error occurred", "details": str(e)},
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
+
+@api_view(['GET'])
+@authentication_classes([TokenAuthentication])
+@permission_classes([IsAuthenticated])
+def repository_maintenance_stats(request, repository_slug):
+    """
+    API endpoint returning the git maintenance stats and schedule of a repository
+    """
+    try:
+        repository = Repository.objects.get(slug=repository_slug)
+    except Repository.DoesNotExist:
+        return Response(
+            {"error": f"Repository not found with slug: {repository_slug}"},
+            status=status.HTTP_404_NOT_FOUND
+        )
+    if not repository.user_has_access(request.user):
+        return Response(
+            {"message": "You don't have permission to access this repository"},
+            status=status.HTTP_403_FORBIDDEN
+        )
+
+    record = RepositoryMaintenance.objects.filter(repository=repository).first()
+    if record is None:
+        return Response({"repository": repository.slug, "last_run_at": None, "next_run_at": None})
+    return Response({
+        "repository": repository.slug,
+        "last_run_at": record.last_run_at,
+        "next_run_at": record.next_run_at,
+        "last_compacted_at": record.last_compacted_at,
+        "commits_squashed": record.commits_squashed,
+        "loose_objects": record.loose_objects,
+        "loose_size_kb": record.loose_size_kb,
+        "packs": record.packs,
+        "pack_size_kb": record.pack_size_kb,
+        "last_actions": record.last_actions.split(',') if record.last_actions else [],
+        "last_duration_ms": record.last_duration_ms,
+        "last_error": record.last_error,
+    })
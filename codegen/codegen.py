@@ -7,6 +7,8 @@ from difflib import unified_diff
 import google.generativeai as genai
 from google.generativeai.types import HarmCategory, HarmBlockThreshold
 
+from filesys.atomic import atomic_write
+
 # Configuration
 API_KEY = "#"  # Replace with your actual API key or set GEMINI_API_KEY env variable
 MODEL_NAME = "gemini-1.5-pro"  # Verify this is a valid model
@@ -369,12 +371,10 @@ Output should be organized, well-documented, and ready for direct integration in
                 block = file_info["blocks"][block_index]
                 lines = file_info["content"].split('\n')
                 new_lines = lines[:block["start_line"] + 1] + generated_code.split('\n') + lines[block["end_line"]:]
-                with open(file_path, 'w', encoding='utf-8') as f:
-                    f.write('\n'.join(new_lines))
+                atomic_write(str(file_path), '\n'.join(new_lines))
                 return {"success": True, "message": f"Updated block {block_index} in {file_path}"}
             else:
-                with open(file_path, 'w', encoding='utf-8') as f:
-                    f.write(generated_code)
+                atomic_write(str(file_path), generated_code)
                 return {"success": True, "message": f"Updated entire file {file_path}"}
         except Exception as e:
             return {"success": False, "message": f"Error updating file: {str(e)}"}
\ No newline at end of file
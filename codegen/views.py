@@ -7,6 +7,7 @@ from .codegen import CodeGenerationSystem
 from django.conf import settings
 import os
 import google.generativeai as genai
+from filesys.atomic import atomic_write
 
 API_KEY = os.environ.get("GEMINI_API_KEY", "#")
 MODEL_NAME = "gemini-2.0-flash"
@@ -119,8 +120,7 @@ class GenerateDocsView(APIView):
 
             # Save README.md
             readme_path = os.path.join(repo_path, 'README.md')
-            with open(readme_path, 'w', encoding='utf-8') as f:
-                f.write(generated_content)
+            atomic_write(readme_path, generated_content)
 
             return JsonResponse({
                 'success': True,
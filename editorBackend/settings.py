@@ -223,6 +223,151 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REPOSITORIES_ROOT = os.path.join(BASE_DIR, 'repositories')
 
+# Largest line window the file window endpoint returns in one response
+FILESYS_MAX_LINE_WINDOW = 5000
+
+# Delegate file downloads to the front-end server: 'X-Sendfile' (Apache/lighttpd)
+# or 'X-Accel-Redirect' (nginx, served from FILESYS_SENDFILE_ROOT). None streams from Django.
+FILESYS_SENDFILE_HEADER = None
+FILESYS_SENDFILE_ROOT = '/protected/c3/'
+
+# File saves are committed to git in groups: after this many seconds without a new
+# change, once this many paths are pending, or when the oldest change is this old.
+# A failed group commit is retried with exponential backoff from FILESYS_COMMIT_RETRY_DELAY
+FILESYS_COMMIT_QUIET_PERIOD = 2.0
+FILESYS_COMMIT_MAX_BATCH = 50
+FILESYS_COMMIT_MAX_DELAY = 30.0
+FILESYS_COMMIT_RETRY_DELAY = 5.0
+FILESYS_COMMIT_MAX_RETRY_DELAY = 300.0
+
+# Pooled git.Repo handles (each keeps persistent cat-file workers): how many idle
+# handles are kept, and how many idle seconds before one is closed
+GIT_POOL_MAX_OPEN = 32
+GIT_POOL_IDLE_TIMEOUT = 300
+
+# Paths checked against .gitignore are fed to one `git check-ignore --stdin` process
+# per this many paths
+GIT_CHECK_IGNORE_BATCH = 5000
+
+# Commit log pages are cached per ref tip for this many seconds; the log endpoint
+# returns at most GIT_LOG_MAX_LIMIT commits per page
+GIT_LOG_CACHE_TIMEOUT = 3600
+GIT_LOG_MAX_LIMIT = 200
+
+# Blob contents read for history views are kept in a process-wide LRU of this many
+# bytes; files larger than GIT_DIFF_MAX_BYTES are reported in diffs without hunks
+GIT_BLOB_CACHE_BYTES = 64 * 1024 * 1024
+GIT_DIFF_MAX_BYTES = 1024 * 1024
+
+# History-branch auto-commits run in a background pool, debounced per repository:
+# a snapshot is taken once saves pause for AUTOCOMMIT_DEBOUNCE seconds, and never
+# later than AUTOCOMMIT_MAX_LATENCY seconds after the first pending save
+AUTOCOMMIT_DEBOUNCE = 5.0
+AUTOCOMMIT_MAX_LATENCY = 60.0
+AUTOCOMMIT_WORKERS = 4
+
+# Server processes start their background workers (auto-commit recovery, the trash
+# reaper) BACKGROUND_STARTUP_DELAY seconds after startup; management commands other
+# than runserver never do
+BACKGROUND_WORKERS_ON_STARTUP = True
+BACKGROUND_STARTUP_DELAY = 1.0
+
+# Deleted repositories are moved into FILESYS_TRASH_DIR (default: BASE_DIR/c3/~trash)
+# and removed by a background reaper, which retries failures with exponential
+# backoff starting at FILESYS_TRASH_RETRY_DELAY seconds. Trash entries without a row
+# are only removed once they are FILESYS_TRASH_ORPHAN_GRACE seconds old, so an entry
+# whose delete has not committed yet is never swept
+FILESYS_TRASH_DIR = None
+FILESYS_TRASH_RETRY_DELAY = 5.0
+FILESYS_TRASH_MAX_RETRY_DELAY = 600.0
+FILESYS_TRASH_ORPHAN_GRACE = 3600.0
+
+# Prebuilt repository skeletons (python, node, empty) new repositories are copied
+# from; defaults to BASE_DIR/c3/~templates so objects can be hardlinked
+FILESYS_TEMPLATE_DIR = None
+
+# Seconds a user's set of accessible repositories stays cached; collaborator
+# changes invalidate it immediately in the process that makes them
+FILESYS_ACCESS_CACHE_TTL = 60
+
+# Default and maximum ?page_size for the cursor-paginated repository listing
+FILESYS_REPOSITORY_PAGE_SIZE = 50
+FILESYS_REPOSITORY_MAX_PAGE_SIZE = 200
+
+# Code search: files larger than FILESYS_SEARCH_MAX_FILE_BYTES are indexed by path
+# only, at most FILESYS_SEARCH_MAX_CANDIDATES index hits are verified per query, and
+# each result shows up to FILESYS_SEARCH_SNIPPET_LINES matching lines. Verification
+# stops after FILESYS_SEARCH_TIMEOUT seconds and returns what it has found
+FILESYS_SEARCH_MAX_FILE_BYTES = 1024 * 1024
+FILESYS_SEARCH_MAX_CANDIDATES = 5000
+FILESYS_SEARCH_SNIPPET_LINES = 3
+FILESYS_SEARCH_TIMEOUT = 5.0
+FILESYS_SEARCH_MAX_PAGE_SIZE = 100
+
+# Symbol index: files larger than this are not parsed; lookups return at most
+# FILESYS_SYMBOLS_MAX_RESULTS rows, and bulk re-indexing writes the rows of
+# FILESYS_SYMBOLS_BATCH_SIZE files per transaction. Writes are indexed on
+# FILESYS_SYMBOLS_WORKERS background threads (0 indexes on commit in the request)
+FILESYS_SYMBOLS_MAX_FILE_BYTES = 512 * 1024
+FILESYS_SYMBOLS_MAX_RESULTS = 500
+FILESYS_SYMBOLS_BATCH_SIZE = 500
+FILESYS_SYMBOLS_WORKERS = 1
+
+# Archive imports write File rows in batches of FILESYS_IMPORT_BATCH_SIZE and refuse
+# archives with more files or bytes than the limits below; entries up to
+# FILESYS_IMPORT_MAX_TEXT_BYTES that decode as UTF-8 are also stored as text
+FILESYS_IMPORT_BATCH_SIZE = 500
+FILESYS_IMPORT_MAX_FILES = 20000
+FILESYS_IMPORT_MAX_FILE_BYTES = 100 * 1024 * 1024
+FILESYS_IMPORT_MAX_BYTES = 1024 * 1024 * 1024
+FILESYS_IMPORT_MAX_TEXT_BYTES = 1024 * 1024
+
+# Import jobs are ImportJob rows. An active job that has not reported progress for
+# FILESYS_IMPORT_STALE_AFTER seconds (its process died) no longer blocks a new import;
+# finished jobs are deleted FILESYS_IMPORT_KEEP_FINISHED seconds after they end
+FILESYS_IMPORT_STALE_AFTER = 3600
+FILESYS_IMPORT_KEEP_FINISHED = 86400
+
+# Durability of working tree writes. Every write goes through a temp file and a rename,
+# so readers never see partial content. 'fsync' syncs each write before it returns,
+# 'group' does too but lets concurrent writes share their fsyncs, and 'none' leaves
+# flushing to the OS
+FILESYS_WRITE_DURABILITY = 'group'
+
+# Forks hardlink the immutable git objects and copy the working tree. Setting
+# FILESYS_FORK_LINK_WORKTREE hardlinks working tree files as well, which is only safe
+# if nothing ever changes them in place (outside git commands, editors, chmod). One
+# request may fork a repository for at most FILESYS_FORK_MAX_USERS users
+FILESYS_FORK_LINK_WORKTREE = False
+FILESYS_FORK_MAX_USERS = 500
+
+# Async file endpoints (/fs/async/...): disk work runs on FILESYS_ASYNC_IO_WORKERS
+# threads, at most FILESYS_ASYNC_REPOSITORY_CONCURRENCY operations per repository at
+# once; a request waiting longer than FILESYS_ASYNC_QUEUE_TIMEOUT seconds gets a 503
+FILESYS_ASYNC_IO_WORKERS = 8
+FILESYS_ASYNC_REPOSITORY_CONCURRENCY = 4
+FILESYS_ASYNC_QUEUE_TIMEOUT = 10.0
+
+# Commits stage only the paths the API wrote; a full working tree scan still runs
+# the first time a repository is committed in a process and then every N seconds
+FILESYS_DIRTY_RECONCILE_INTERVAL = 600
+
+# Smaller commits hash and compress each file in-process through GitPython; from this
+# many paths on, one native `git add` stages them all, which is faster for large batches
+GIT_BULK_STAGE_THRESHOLD = 100
+
+# History maintenance: snapshots beyond the newest AUTOCOMMIT_HISTORY_KEEP_RECENT are
+# squashed into one commit per AUTOCOMMIT_HISTORY_BUCKET seconds. Each repository gets
+# git housekeeping every GIT_MAINTENANCE_INTERVAL seconds, or sooner once it has about
+# GIT_MAINTENANCE_LOOSE_OBJECTS loose objects; more than GIT_MAINTENANCE_MAX_PACKS packs
+# forces a full gc
+AUTOCOMMIT_HISTORY_KEEP_RECENT = 100
+AUTOCOMMIT_HISTORY_BUCKET = 3600
+GIT_MAINTENANCE_INTERVAL = 86400
+GIT_MAINTENANCE_LOOSE_OBJECTS = 1000
+GIT_MAINTENANCE_MAX_PACKS = 20
+GIT_MAINTENANCE_PRUNE_EXPIRE = '2.weeks.ago'
+
 # Email Configuration
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
 EMAIL_HOST = 'smtp.gmail.com'  # Or your SMTP server
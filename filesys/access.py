@@ -0,0 +1,110 @@
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Repository, RepositoryAccess
+
+logger = logging.getLogger(__name__)
+
+# Attribute the per-request copy of the access map is memoized under
+REQUEST_ATTR = '_repository_access_map'
+
+
+def _cache_key(user_id):
+    return f"repo-access:{user_id}"
+
+
+def load_access_map(user_id):
+    """{repository id: role} for every repository the user owns or collaborates on, from the database"""
+    return dict(RepositoryAccess.objects.filter(user_id=user_id).values_list('repository_id', 'role'))
+
+
+def get_access_map(user, request=None):
+    """
+    {repository id: role} for `user`, memoized on the request and cached for a short TTL
+
+    Anonymous users get an empty map. Changes to ownership or collaborators
+    invalidate the affected users' cache entries (see invalidate_users), so
+    the TTL only bounds staleness across processes.
+    """
+    if request is not None:
+        cached = getattr(request, REQUEST_ATTR, None)
+        if cached is not None:
+            return cached
+    if user is None or not user.is_authenticated:
+        return {}
+
+    key = _cache_key(user.pk)
+    access_map = cache.get(key)
+    if access_map is None:
+        access_map = load_access_map(user.pk)
+        cache.set(key, access_map, getattr(settings, 'FILESYS_ACCESS_CACHE_TTL', 60))
+    if request is not None:
+        setattr(request, REQUEST_ATTR, access_map)
+    return access_map
+
+
+def get_role(request, repository_id):
+    """The requesting user's role on a repository, or None without access"""
+    return get_access_map(request.user, request).get(repository_id)
+
+
+def accessible_repositories(request):
+    """Queryset of the live repositories the requesting user owns or collaborates on"""
+    return Repository.objects.filter(pk__in=list(get_access_map(request.user, request)))
+
+
+def invalidate_users(user_ids):
+    """Drop cached access maps, now and again once the surrounding transaction commits"""
+    keys = [_cache_key(user_id) for user_id in set(user_ids)]
+    if not keys:
+        return
+    cache.delete_many(keys)
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def grant(repository, user_ids, role):
+    """Give users a role on a repository, never demoting the owner"""
+    user_ids = [user_id for user_id in user_ids if user_id != repository.user_id or role == RepositoryAccess.OWNER]
+    existing = set(
+        RepositoryAccess.objects.filter(repository=repository, user_id__in=user_ids).values_list('user_id', flat=True)
+    )
+    RepositoryAccess.objects.bulk_create(
+        [RepositoryAccess(repository=repository, user_id=user_id, role=role) for user_id in user_ids if user_id not in existing],
+        ignore_conflicts=True
+    )
+    invalidate_users(user_ids)
+
+
+def revoke(repository, user_ids):
+    """Remove collaborator rows; the owner's row stays"""
+    user_ids = [user_id for user_id in user_ids if user_id != repository.user_id]
+    RepositoryAccess.objects.filter(repository=repository, user_id__in=user_ids).delete()
+    invalidate_users(user_ids)
+
+
+def rebuild_access(repositories=None):
+    """
+    Recompute RepositoryAccess rows from Repository.user and collaborators
+
+    Returns:
+        int: number of rows written
+    """
+    repositories = repositories if repositories is not None else Repository.all_objects.all()
+    written = 0
+    for repository in repositories.prefetch_related('collaborators').iterator(chunk_size=500):
+        rows = {repository.user_id: RepositoryAccess.OWNER}
+        for collaborator in repository.collaborators.all():
+            rows.setdefault(collaborator.pk, RepositoryAccess.COLLABORATOR)
+        with transaction.atomic():
+            previous = set(repository.access_entries.values_list('user_id', flat=True))
+            repository.access_entries.all().delete()
+            RepositoryAccess.objects.bulk_create([
+                RepositoryAccess(repository=repository, user_id=user_id, role=role)
+                for user_id, role in rows.items()
+            ])
+            invalidate_users(previous | set(rows))
+        written += len(rows)
+    return written
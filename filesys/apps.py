@@ -4,3 +4,22 @@ from django.apps import AppConfig
 class FilesysConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'filesys'
+
+    def ready(self):
+        from django.db.models.signals import post_migrate
+
+        from . import signals  # noqa: F401
+        from .search import create_search_table
+        from .startup import run_at_startup
+        from .trash import reaper
+
+        # The FTS5 table is not a model, so it is created alongside the migrated schema
+        post_migrate.connect(
+            lambda using, **kwargs: create_search_table(using),
+            sender=self,
+            dispatch_uid='filesys.create_search_table',
+            weak=False
+        )
+
+        # Reclaim repositories deleted before the last shutdown without waiting for the next delete
+        run_at_startup('trash-reaper', reaper.wake)
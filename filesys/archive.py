@@ -0,0 +1,166 @@
+import gzip
+import logging
+import os
+import subprocess
+import tarfile
+import time
+import zipfile
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_FORMATS = {
+    'zip': ('application/zip', 'zip'),
+    'tar.gz': ('application/gzip', 'tar.gz'),
+}
+
+# Bytes read from disk, or from `git archive`, per chunk
+CHUNK_SIZE = 64 * 1024
+
+
+class _Sink:
+    """Write-only, unseekable buffer the archive writers append to and the generator drains"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _in_prefix(path, prefix):
+    return not prefix or path == prefix or path.startswith(prefix + '/')
+
+
+def worktree_files(location, prefix=''):
+    """
+    [(path, absolute path)] for the working tree files git would see: tracked or
+    untracked but not ignored, below `prefix`
+
+    Raises:
+        subprocess.CalledProcessError: if `location` is not a git working tree
+    """
+    command = ['git', '-C', location, 'ls-files', '-z', '--cached', '--others', '--exclude-standard']
+    if prefix:
+        command += ['--', prefix]
+    output = subprocess.run(command, capture_output=True, check=True).stdout
+    files = []
+    seen = set()
+    for path in output.decode('utf-8', 'surrogateescape').split('\0'):
+        if not path or path in seen or not _in_prefix(path, prefix):
+            continue
+        seen.add(path)
+        abs_path = os.path.join(location, path)
+        if os.path.isfile(abs_path):
+            files.append((path, abs_path))
+    return files
+
+
+def _read_chunks(abs_path, limit=None):
+    with open(abs_path, 'rb') as f:
+        remaining = limit
+        while remaining is None or remaining > 0:
+            chunk = f.read(CHUNK_SIZE if remaining is None else min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            if remaining is not None:
+                remaining -= len(chunk)
+            yield chunk
+
+
+def _stream_zip(files, root):
+    sink = _Sink()
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for path, abs_path in files:
+            try:
+                st = os.stat(abs_path)
+            except OSError:
+                continue
+            info = zipfile.ZipInfo(f"{root}/{path}", date_time=time.localtime(st.st_mtime)[:6])
+            info.compress_type = zipfile.ZIP_DEFLATED
+            info.external_attr = (st.st_mode & 0xFFFF) << 16
+            try:
+                with archive.open(info, 'w', force_zip64=st.st_size >= zipfile.ZIP64_LIMIT) as entry:
+                    for chunk in _read_chunks(abs_path):
+                        entry.write(chunk)
+                        yield sink.drain()
+            except OSError as e:
+                logger.warning(f"Skipping {abs_path} in archive: {str(e)}")
+            yield sink.drain()
+    yield sink.drain()
+
+
+def _stream_tar_gz(files, root):
+    """
+    A tar.gz written entry by entry
+
+    Headers and padding are written by hand instead of through TarFile.addfile
+    so file bodies pass through in chunks rather than one buffer per file.
+    """
+    sink = _Sink()
+    with gzip.GzipFile(fileobj=sink, mode='wb') as archive:
+        for path, abs_path in files:
+            try:
+                st = os.stat(abs_path)
+            except OSError:
+                continue
+            info = tarfile.TarInfo(f"{root}/{path}")
+            info.size = st.st_size
+            info.mtime = int(st.st_mtime)
+            info.mode = st.st_mode & 0o7777
+            archive.write(info.tobuf(format=tarfile.PAX_FORMAT))
+            written = 0
+            try:
+                for chunk in _read_chunks(abs_path, limit=info.size):
+                    archive.write(chunk)
+                    written += len(chunk)
+                    yield sink.drain()
+            except OSError as e:
+                logger.warning(f"Truncated {abs_path} in archive: {str(e)}")
+            # The header promised st_size bytes; a file that shrank meanwhile is zero-filled
+            archive.write(b'\0' * (info.size - written))
+            archive.write(b'\0' * (-info.size % tarfile.BLOCKSIZE))
+            yield sink.drain()
+        archive.write(b'\0' * (2 * tarfile.BLOCKSIZE))
+    yield sink.drain()
+
+
+def stream_worktree_archive(files, fmt, root):
+    """
+    Yield a zip or tar.gz of working tree `files` in chunks, with every entry under `root`/
+
+    Memory use is bounded by the chunk size, not by file or repository size.
+    """
+    writer = _stream_zip if fmt == 'zip' else _stream_tar_gz
+    for data in writer(files, root):
+        if data:
+            yield data
+
+
+def stream_git_archive(location, commit, fmt, root, prefix=''):
+    """Yield the output of `git archive` for a commit as it is produced"""
+    command = ['git', '-C', location, 'archive', f"--format={fmt}", f"--prefix={root}/", commit]
+    if prefix:
+        command += ['--', prefix]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    try:
+        for chunk in iter(lambda: process.stdout.read(CHUNK_SIZE), b''):
+            yield chunk
+        process.wait()
+        if process.returncode:
+            logger.error(f"git archive of {location} at {commit} failed: {process.stderr.read().decode(errors='replace')}")
+    finally:
+        # The client may disconnect mid-download; do not leave git running
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+        process.stdout.close()
+        process.stderr.close()
@@ -0,0 +1,294 @@
+import asyncio
+import functools
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.http import Http404, JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_http_methods
+from rest_framework import exceptions, serializers
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from .access import accessible_repositories, get_role
+from .atomic import atomic_write
+from .commit_queue import enqueue_commit
+from .conditional import file_etag, not_modified_response, repository_etag, set_validators, worktree_signature
+from .dirty import mark_dirty
+from .models import File, RepositoryAccess
+from .serializers import FileSerializer
+from .worktree import manifest_entries, untracked_texts
+
+from autocommit.scheduler import schedule_auto_commit
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+class RepositoryBusy(Exception):
+    """Raised when a repository's concurrency limit stays saturated for the queue timeout"""
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=getattr(settings, 'FILESYS_ASYNC_IO_WORKERS', 8),
+            thread_name_prefix='filesys-io'
+        )
+    return _executor
+
+
+async def run_io(func, *args, **kwargs):
+    """Run blocking disk or git work on the bounded I/O pool and await its result"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_executor(), functools.partial(func, *args, **kwargs))
+
+
+class RepositoryLimiter:
+    """
+    Per-repository semaphores, created on first use and dropped once idle
+
+    Only touched from the event loop, so no locking is needed.
+    """
+
+    def __init__(self):
+        self._slots = {}
+
+    @asynccontextmanager
+    async def slot(self, repository_id):
+        entry = self._slots.get(repository_id)
+        if entry is None:
+            entry = self._slots[repository_id] = [
+                asyncio.Semaphore(getattr(settings, 'FILESYS_ASYNC_REPOSITORY_CONCURRENCY', 4)), 0
+            ]
+        entry[1] += 1
+        try:
+            try:
+                await asyncio.wait_for(entry[0].acquire(), getattr(settings, 'FILESYS_ASYNC_QUEUE_TIMEOUT', 10.0))
+            except asyncio.TimeoutError:
+                raise RepositoryBusy(f"Too many concurrent operations on repository {repository_id}")
+            try:
+                yield
+            finally:
+                entry[0].release()
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._slots[repository_id]
+
+
+limiter = RepositoryLimiter()
+
+
+def _error(message, status):
+    return JsonResponse({'error': message}, status=status)
+
+
+def _authenticate(request):
+    """
+    Authenticate with the project's DRF authentication classes
+
+    Session authentication enforces CSRF itself, which is why the views are csrf_exempt.
+    """
+    drf_request = Request(request, authenticators=[auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES])
+    if not drf_request.user.is_authenticated:
+        raise exceptions.NotAuthenticated()
+    return drf_request
+
+
+def _resolve(request, repository_slug, pk=None):
+    """(DRF request, repository, file or None) for the URL, raising Http404 without access"""
+    drf_request = _authenticate(request)
+    repository = accessible_repositories(drf_request).select_related('user').filter(
+        slug=repository_slug.replace('%2F', '/')
+    ).first()
+    if repository is None:
+        raise Http404("Repository not found or access denied")
+    file_obj = None
+    if pk is not None:
+        file_obj = File.objects.filter(repository=repository, pk=pk).select_related('blob').first()
+        if file_obj is None:
+            raise Http404("File not found")
+        file_obj.repository = repository
+    return drf_request, repository, file_obj
+
+
+def async_endpoint(view):
+    """Turn the errors the views raise into the same JSON responses the DRF viewsets give"""
+
+    @csrf_exempt
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        try:
+            return await view(request, *args, **kwargs)
+        except serializers.ValidationError as e:
+            return JsonResponse(e.detail, status=e.status_code, safe=False)
+        except (exceptions.NotAuthenticated, exceptions.AuthenticationFailed) as e:
+            # Like DRF: 401 only when the first authentication class can issue a challenge
+            response = JsonResponse({'detail': str(e.detail)}, status=403)
+            challenge = api_settings.DEFAULT_AUTHENTICATION_CLASSES[0]().authenticate_header(request)
+            if challenge:
+                response.status_code = e.status_code
+                response['WWW-Authenticate'] = challenge
+            return response
+        except exceptions.APIException as e:
+            return JsonResponse({'detail': str(e.detail)}, status=e.status_code)
+        except Http404 as e:
+            return _error(str(e), 404)
+        except RepositoryBusy as e:
+            response = _error(str(e), 503)
+            response['Retry-After'] = '1'
+            return response
+
+    return wrapper
+
+
+def _read_text(file_path):
+    with open(file_path, 'r', encoding='utf-8') as f:
+        return f.read()
+
+
+def _parse_json(request):
+    try:
+        return json.loads(request.body or b'{}')
+    except (ValueError, UnicodeDecodeError):
+        raise exceptions.ParseError()
+
+
+def _record_changes(repository, path):
+    """Hand the written path to the group commit, the dirty-path tracker and the auto-commit scheduler"""
+    enqueue_commit(repository, [path], (), f'Update {path}')
+    mark_dirty(repository, [path])
+    schedule_auto_commit(repository.id)
+
+
+async def _retrieve(request, repository, file_obj):
+    file_path = os.path.join(repository.location, file_obj.path)
+    async with limiter.slot(repository.pk):
+        if not await run_io(os.path.exists, file_path):
+            return _error('File not found on disk', 404)
+        try:
+            # Answer conditional requests before touching the file body
+            etag, last_modified = await run_io(file_etag, file_obj, file_path)
+            not_modified = not_modified_response(request, etag, last_modified)
+            if not_modified is not None:
+                return not_modified
+            content = await run_io(_read_text, file_path)
+        except UnicodeDecodeError:
+            logger.warning(f"Binary file detected: {file_path}")
+            return _error('Cannot read binary file', 400)
+        except OSError as e:
+            logger.error(f"Error reading file {file_path}: {str(e)}")
+            return _error(f'Error reading file: {str(e)}', 500)
+    data = FileSerializer(file_obj).data
+    data['content'] = content
+    return set_validators(JsonResponse(data), etag, last_modified)
+
+
+async def _update(request, drf_request, repository, file_obj, partial):
+    if get_role(drf_request, repository.pk) != RepositoryAccess.OWNER:
+        raise exceptions.PermissionDenied()
+    file_path = os.path.join(repository.location, file_obj.path)
+    if not file_path.startswith(repository.location):
+        raise serializers.ValidationError({'error': 'Invalid file path'})
+
+    data = await run_io(_parse_json, request)
+    serializer = FileSerializer(
+        file_obj, data=data, partial=partial, context={'request': drf_request, 'repository': repository}
+    )
+    await sync_to_async(serializer.is_valid)(raise_exception=True)
+    content = serializer.validated_data.get('content', file_obj.get_content())
+
+    async with limiter.slot(repository.pk):
+        try:
+            await run_io(atomic_write, file_path, content or '')
+        except OSError as e:
+            raise serializers.ValidationError({'error': f'File operation failed: {str(e)}'})
+
+    def save():
+        with transaction.atomic():
+            serializer.save()
+            transaction.on_commit(lambda: _record_changes(repository, file_obj.path))
+        return serializer.data
+
+    return JsonResponse(await sync_to_async(save)())
+
+
+@require_http_methods(['GET', 'PUT', 'PATCH'])
+@async_endpoint
+async def file_detail(request, repository_slug, pk):
+    """
+    Async file retrieve (GET) and update (PUT/PATCH), with the same payloads as FileViewSet
+
+    Database work goes through sync_to_async; disk reads and writes run on a
+    pool of FILESYS_ASYNC_IO_WORKERS threads, at most
+    FILESYS_ASYNC_REPOSITORY_CONCURRENCY at a time per repository, so big
+    saves never tie up the threads the websocket consumers need.
+    """
+    drf_request, repository, file_obj = await sync_to_async(_resolve)(request, repository_slug, pk)
+    if request.method == 'GET':
+        return await _retrieve(request, repository, file_obj)
+    return await _update(request, drf_request, repository, file_obj, partial=request.method == 'PATCH')
+
+
+@require_http_methods(['GET'])
+@async_endpoint
+async def manifest(request, repository_slug):
+    """Async RepositoryViewSet.get_manifest"""
+    _, repository, _ = await sync_to_async(_resolve)(request, repository_slug)
+
+    async with limiter.slot(repository.pk):
+        signature = await run_io(worktree_signature, repository.location)
+        etag, last_modified = await sync_to_async(repository_etag)(repository, signature)
+        not_modified = not_modified_response(request, etag, last_modified)
+        if not_modified is not None:
+            return not_modified
+        file_ids = await sync_to_async(
+            lambda: dict(File.objects.filter(repository=repository).values_list('path', 'id'))
+        )()
+        entries = await run_io(manifest_entries, repository.location, file_ids)
+
+    response = JsonResponse({'repo_id': repository.id, 'name': repository.name, 'files': entries})
+    return set_validators(response, etag, last_modified)
+
+
+@require_http_methods(['GET'])
+@async_endpoint
+async def contents(request, repository_slug):
+    """Async RepositoryViewSet.get_contents"""
+    _, repository, _ = await sync_to_async(_resolve)(request, repository_slug)
+
+    async with limiter.slot(repository.pk):
+        signature = await run_io(worktree_signature, repository.location)
+        etag, last_modified = await sync_to_async(repository_etag)(repository, signature)
+        not_modified = not_modified_response(request, etag, last_modified)
+        if not_modified is not None:
+            return not_modified
+
+        def database_files():
+            return [
+                {
+                    'path': file.path,
+                    'content': file.get_content(),
+                    'language': file.language or file.detect_language()
+                } for file in File.objects.filter(repository=repository).select_related('blob')
+            ]
+
+        db_files = await sync_to_async(database_files)()
+        fs_files = await run_io(untracked_texts, repository, {f['path'] for f in db_files})
+
+    response = JsonResponse({
+        'repo_id': repository.id,
+        'name': repository.name,
+        'description': repository.description,
+        'files': db_files + fs_files
+    })
+    return set_validators(response, etag, last_modified)
@@ -0,0 +1,274 @@
+import io
+import logging
+import os
+import tempfile
+import threading
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+DEFAULT_FILE_MODE = 0o644
+
+# FILESYS_WRITE_DURABILITY values:
+#   none  - rename only; flushing is left to the OS
+#   fsync - the temp file is fsynced before the rename and its directory after it
+#   group - the same order, but concurrent writers share their fsyncs: each write still
+#           returns only once it is durable
+DURABILITY_MODES = ('none', 'fsync', 'group')
+
+
+# Temp files of writes inside a git working tree go into its .git directory, which is
+# on the same filesystem but never part of a commit, so a crash leaves nothing to pick up
+TEMP_PREFIX = '.write-'
+
+
+def durability_mode(durability=None):
+    """The given durability, or FILESYS_WRITE_DURABILITY; unknown values fall back to fsync"""
+    mode = durability or getattr(settings, 'FILESYS_WRITE_DURABILITY', 'group')
+    if mode not in DURABILITY_MODES:
+        logger.warning(f"Unknown FILESYS_WRITE_DURABILITY {mode!r}, using fsync")
+        return 'fsync'
+    return mode
+
+
+def fsync_path(path):
+    """fsync a file or directory by path; a path that has since gone is not an error"""
+    flags = os.O_RDONLY | (os.O_DIRECTORY if os.path.isdir(path) else 0)
+    try:
+        fd = os.open(path, flags)
+    except FileNotFoundError:
+        return
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def fsync_paths(paths):
+    """
+    fsync each path, file or directory; failures are logged and returned
+
+    Returns:
+        dict: path -> OSError for the paths that could not be synced
+    """
+    failures = {}
+    for path in paths:
+        try:
+            fsync_path(path)
+        except OSError as e:
+            logger.error(f"fsync of {path} failed: {str(e)}")
+            failures[path] = e
+    return failures
+
+
+class GroupSync:
+    """
+    Group commit for `group` mode writes
+
+    A writer queues its paths and blocks until a sync round that started
+    after they were queued has finished. A writer that finds no round
+    running syncs everything queued so far, so writers arriving during one
+    round share the next instead of each paying for their own fsyncs.
+    """
+
+    # Rounds whose failures are kept for their waiters to pick up
+    KEEP_FAILED_ROUNDS = 64
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._pending = set()
+        self._started = 0
+        self._finished = 0
+        self._syncing = False
+        self._failures = {}
+
+    def sync(self, paths):
+        """
+        Block until `paths` are synced
+
+        Raises:
+            OSError: if one of `paths` could not be synced
+        """
+        with self._condition:
+            self._pending.update(paths)
+            # The next round to start takes everything pending, including `paths`
+            round_needed = self._started + 1
+            while self._finished < round_needed:
+                if self._syncing:
+                    self._condition.wait()
+                    continue
+                files, self._pending = self._pending, set()
+                self._started += 1
+                self._syncing = True
+                self._condition.release()
+                failures = {}
+                try:
+                    failures = fsync_paths(files)
+                finally:
+                    self._condition.acquire()
+                    self._syncing = False
+                    self._finished += 1
+                    if failures:
+                        self._failures[self._finished] = failures
+                        for old_round in [r for r in self._failures if r <= self._finished - self.KEEP_FAILED_ROUNDS]:
+                            del self._failures[old_round]
+                    self._condition.notify_all()
+            failures = self._failures.get(round_needed, {})
+            for path in paths:
+                if path in failures:
+                    raise failures[path]
+
+
+group_sync = GroupSync()
+
+
+def sync_files(paths, durability=None):
+    """
+    Get the data of files written with durability='none', e.g. the temp files of a batch, to disk in one go
+
+    Call it before the files are renamed into place, then publish them with
+    durability='none' and finish with sync_directories().
+    """
+    mode = durability_mode(durability)
+    if mode == 'group':
+        group_sync.sync(paths)
+    elif mode == 'fsync':
+        for path in paths:
+            fsync_path(path)
+
+
+def sync_directories(paths, durability=None):
+    """Make the renames that published `paths` durable by syncing each of their directories once"""
+    mode = durability_mode(durability)
+    directories = {os.path.dirname(path) for path in paths}
+    if mode == 'group':
+        group_sync.sync(directories)
+    elif mode == 'fsync':
+        for directory in directories:
+            fsync_path(directory)
+
+
+def _target_mode(file_path):
+    # mkstemp creates 0600 files; keep the existing file's mode or use the usual default
+    try:
+        return os.stat(file_path).st_mode & 0o777
+    except FileNotFoundError:
+        return DEFAULT_FILE_MODE
+
+
+def _temp_dir(directory):
+    """The .git directory of the working tree `directory` belongs to, or `directory` itself"""
+    base_dir = os.path.realpath(settings.BASE_DIR)
+    current = os.path.realpath(directory)
+    while current != base_dir and os.path.dirname(current) != current:
+        if os.path.basename(current) == '.git':
+            # Objects and refs keep their temp files beside them, as git does
+            return directory
+        git_dir = os.path.join(current, '.git')
+        if os.path.isdir(git_dir):
+            return git_dir
+        current = os.path.dirname(current)
+    return directory
+
+
+def _open_temp(file_path):
+    directory = os.path.dirname(file_path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=_temp_dir(directory), prefix=TEMP_PREFIX, suffix='.tmp')
+    return os.fdopen(fd, 'wb'), tmp_path
+
+
+def discard_temp(tmp_path):
+    """Remove a temp file from write_temp() that will not be published"""
+    try:
+        os.unlink(tmp_path)
+    except OSError:
+        pass
+
+
+def publish(tmp_path, file_path, durability=None):
+    """
+    Rename a temp file from write_temp() over file_path, then make the rename durable
+
+    The temp file's data is already on disk unless durability is 'none', so
+    a crash after the rename can never leave a truncated file under the
+    final name; only the directory entry is synced here, in group mode
+    together with whatever other writers have pending.
+    """
+    os.replace(tmp_path, file_path)
+    sync_directories([file_path], durability)
+
+
+def write_temp_stream(file_path, stream, chunk_size=CHUNK_SIZE, durability=None):
+    """
+    Copy a file-like stream to a temp file for file_path; only one chunk is held in memory
+
+    Unless durability is 'none' the data is synced before this returns.
+
+    Returns:
+        tuple: (temp path, number of bytes written)
+    """
+    mode = durability_mode(durability)
+    tmp, tmp_path = _open_temp(file_path)
+    written = 0
+    try:
+        with tmp:
+            os.fchmod(tmp.fileno(), _target_mode(file_path))
+            for chunk in iter(lambda: stream.read(chunk_size), b''):
+                tmp.write(chunk)
+                written += len(chunk)
+            if mode == 'fsync':
+                tmp.flush()
+                os.fsync(tmp.fileno())
+        if mode == 'group':
+            group_sync.sync([tmp_path])
+    except BaseException:
+        discard_temp(tmp_path)
+        raise
+    return tmp_path, written
+
+
+def atomic_write_stream(file_path, stream, chunk_size=CHUNK_SIZE, durability=None):
+    """
+    Copy a file-like stream to file_path through a temp file on the same filesystem
+
+    The temp file is renamed over the target once fully written and synced,
+    so readers never observe a partially written file. Only one chunk is
+    held in memory.
+
+    Returns:
+        int: Number of bytes written
+    """
+    tmp_path, written = write_temp_stream(file_path, stream, chunk_size, durability)
+    try:
+        publish(tmp_path, file_path, durability)
+    except BaseException:
+        discard_temp(tmp_path)
+        raise
+    return written
+
+
+def write_temp(file_path, data, durability=None):
+    """
+    Write `data` (str or bytes) to a temp file for file_path and return the temp path
+
+    Unless durability is 'none' the data is synced before this returns.
+    Callers rename it over the target with publish() once they are ready to
+    go live, which lets several files be staged before any becomes visible.
+    """
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    tmp_path, _ = write_temp_stream(file_path, io.BytesIO(data), max(len(data), 1), durability)
+    return tmp_path
+
+
+def atomic_write(file_path, data, durability=None):
+    """Replace file_path with `data` so readers see either the old or the new content, never a mix"""
+    tmp_path = write_temp(file_path, data, durability)
+    try:
+        publish(tmp_path, file_path, durability)
+    except BaseException:
+        discard_temp(tmp_path)
+        raise
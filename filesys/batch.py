@@ -0,0 +1,146 @@
+import logging
+import os
+from collections import Counter
+
+from django.db import transaction
+from django.utils import timezone
+from rest_framework import serializers
+
+from .atomic import publish, sync_directories, sync_files, write_temp
+from .blobs import acquire_contents, content_hash, release_blobs
+from .commit_queue import commit_now
+from .models import File
+from .search import index_files
+from .symbols import schedule_symbol_index
+
+logger = logging.getLogger(__name__)
+
+
+def _batch_message(created, updated, deleted):
+    summary = []
+    if created:
+        summary.append(f"add {len(created)}")
+    if updated:
+        summary.append(f"update {len(updated)}")
+    if deleted:
+        summary.append(f"delete {len(deleted)}")
+    message = f"Batch: {', '.join(summary)} file(s)\n"
+    for prefix, paths in (('A', created), ('M', updated), ('D', deleted)):
+        for path in paths:
+            message += f"\n{prefix} {path}"
+    return message
+
+
+def apply_file_batch(repository, operations, resolve_path, message=None, allow_delete=True):
+    """
+    Apply many file creates, updates and deletes as one unit
+
+    New content is staged in temp files first, the database changes run in a
+    single transaction with bulk_create/bulk_update, and only then are the
+    temp files renamed into place. Everything lands in one git commit.
+
+    Args:
+        repository: Repository the operations apply to
+        operations: Validated FileBatchOperationSerializer data
+        resolve_path: Callable mapping a relative path to a safe absolute path
+        message: Optional commit message
+        allow_delete: Whether delete operations are permitted for the caller
+
+    Returns:
+        dict: created and updated File instances and the deleted paths
+    """
+    by_op = {'create': [], 'update': [], 'delete': []}
+    for operation in operations:
+        by_op[operation['op']].append(operation)
+
+    if by_op['delete'] and not allow_delete:
+        raise serializers.ValidationError({'error': 'Only repository owner can delete files'})
+
+    paths = [operation['path'] for operation in operations]
+    existing = {
+        file_obj.path: file_obj
+        for file_obj in File.objects.filter(repository=repository, path__in=paths)
+    }
+    errors = {}
+    for operation in by_op['create']:
+        if operation['path'] in existing:
+            errors[operation['path']] = 'A file with this path already exists in the repository.'
+    for operation in by_op['update'] + by_op['delete']:
+        if operation['path'] not in existing:
+            errors[operation['path']] = 'File not found in repository.'
+    if errors:
+        raise serializers.ValidationError({'errors': errors})
+
+    absolute = {operation['path']: resolve_path(operation['path']) for operation in operations}
+
+    # Stage every new body before any database or working tree change
+    staged = {}
+    try:
+        for operation in by_op['create'] + by_op['update']:
+            staged[operation['path']] = write_temp(absolute[operation['path']], operation['content'], durability='none')
+        # One sync for every body, before any of them is renamed into place
+        sync_files(list(staged.values()))
+
+        now = timezone.now()
+        with transaction.atomic():
+            blobs = acquire_contents([op['content'] for op in by_op['create'] + by_op['update']])
+
+            created = []
+            for operation in by_op['create']:
+                file_obj = File(
+                    repository=repository,
+                    path=operation['path'],
+                    blob=blobs[content_hash(operation['content'])]
+                )
+                file_obj.language = file_obj.language_from_path() if operation['content'] else None
+                created.append(file_obj)
+            created = File.objects.bulk_create(created)
+
+            updated = []
+            released = Counter()
+            for operation in by_op['update']:
+                file_obj = existing[operation['path']]
+                released[file_obj.blob_id] += 1
+                file_obj.blob = blobs[content_hash(operation['content'])]
+                file_obj.content = None
+                file_obj.language = file_obj.language_from_path() if operation['content'] else None
+                file_obj.updated_at = now
+                updated.append(file_obj)
+            if updated:
+                File.objects.bulk_update(updated, ['blob', 'content', 'language', 'updated_at'])
+                release_blobs(released)
+
+            # bulk_create/bulk_update skip the save signals that keep the search and symbol indexes current
+            index_files(created + updated)
+            schedule_symbol_index(created + updated)
+
+            deleted = [operation['path'] for operation in by_op['delete']]
+            if deleted:
+                File.objects.filter(id__in=[existing[path].id for path in deleted]).delete()
+
+        # Go live together, then sync the renames at once
+        for path, tmp_path in list(staged.items()):
+            publish(tmp_path, absolute[path], durability='none')
+            del staged[path]
+        sync_directories([absolute[operation['path']] for operation in by_op['create'] + by_op['update']])
+    finally:
+        for tmp_path in staged.values():
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+
+    for path in deleted:
+        try:
+            os.remove(absolute[path])
+        except FileNotFoundError:
+            pass
+
+    changed = [file_obj.path for file_obj in created + updated]
+    commit_now(
+        repository,
+        message or _batch_message([f.path for f in created], [f.path for f in updated], deleted),
+        changed_paths=changed,
+        removed_paths=deleted
+    )
+    return {'created': created, 'updated': updated, 'deleted': deleted}
@@ -0,0 +1,112 @@
+import hashlib
+import logging
+from collections import Counter
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Exists, F, OuterRef
+
+from .models import Blob, File
+
+logger = logging.getLogger(__name__)
+
+
+def content_hash(content):
+    """sha256 hexdigest used as the blob key for a piece of text content"""
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+def acquire_blob(content):
+    """
+    Return the Blob holding `content`, creating it if needed, and take a reference on it
+
+    The reference is taken before the row is returned so a concurrent
+    collect_garbage() never deletes a blob that is about to be referenced.
+    """
+    key = content_hash(content)
+    for _ in range(2):
+        if Blob.objects.filter(pk=key).update(ref_count=F('ref_count') + 1):
+            return Blob(pk=key, content=content, size=len(content.encode('utf-8')))
+        try:
+            with transaction.atomic():
+                return Blob.objects.create(
+                    pk=key,
+                    content=content,
+                    size=len(content.encode('utf-8')),
+                    ref_count=1
+                )
+        except IntegrityError:
+            # Another writer created the same blob first; take a reference on theirs
+            continue
+    raise IntegrityError(f"Could not acquire blob {key}")
+
+
+def release_blob(blob_id):
+    """Drop one reference from a blob; unreferenced blobs are removed by collect_garbage()"""
+    if blob_id:
+        Blob.objects.filter(pk=blob_id).update(ref_count=F('ref_count') - 1)
+
+
+def acquire_blobs(blob_counts):
+    """Add references in bulk, `blob_counts` mapping blob id -> number of new references"""
+    by_count = {}
+    for blob_id, count in blob_counts.items():
+        by_count.setdefault(count, []).append(blob_id)
+    for count, blob_ids in by_count.items():
+        Blob.objects.filter(pk__in=blob_ids).update(ref_count=F('ref_count') + count)
+
+
+def acquire_contents(contents):
+    """
+    Take one blob reference per entry in `contents`, in a constant number of queries
+
+    Missing blobs are inserted with no references and every reference is then
+    added by one UPDATE per distinct count. Call it inside a transaction, so
+    collect_garbage() never sees the new rows before their references.
+
+    Returns:
+        dict: blob id -> Blob
+    """
+    blobs = {}
+    for content in contents:
+        key = content_hash(content)
+        if key not in blobs:
+            blobs[key] = Blob(pk=key, content=content, size=len(content.encode('utf-8')))
+    if not blobs:
+        return blobs
+    existing = set()
+    keys = list(blobs)
+    for start in range(0, len(keys), 500):
+        existing.update(Blob.objects.filter(pk__in=keys[start:start + 500]).values_list('pk', flat=True))
+    # A concurrent writer may create the same blob; its row is just as good
+    Blob.objects.bulk_create(
+        [Blob(pk=key, content=blob.content, size=blob.size, ref_count=0) for key, blob in blobs.items() if key not in existing],
+        ignore_conflicts=True,
+        batch_size=500
+    )
+    acquire_blobs(Counter(content_hash(content) for content in contents))
+    return blobs
+
+
+def release_blobs(blob_counts):
+    """Bulk counterpart of release_blob(), `blob_counts` mapping blob id -> references dropped"""
+    acquire_blobs({blob_id: -count for blob_id, count in blob_counts.items() if blob_id})
+
+
+def reconcile_ref_counts():
+    """Recompute every blob's ref_count from the File rows that point at it"""
+    fixed = 0
+    for blob in Blob.objects.annotate(actual=Count('files')).exclude(ref_count=F('actual')):
+        Blob.objects.filter(pk=blob.pk).update(ref_count=blob.actual)
+        fixed += 1
+    if fixed:
+        logger.warning(f"Corrected ref_count on {fixed} blob(s)")
+    return fixed
+
+
+def collect_garbage():
+    """Delete blobs that have no references left. Returns the number of blobs removed."""
+    referenced = File.objects.filter(blob=OuterRef('pk'))
+    deleted, _ = Blob.objects.filter(ref_count__lte=0).exclude(Exists(referenced)).delete()
+    if deleted:
+        logger.info(f"Garbage collected {deleted} unreferenced blob(s)")
+    return deleted
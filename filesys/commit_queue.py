@@ -0,0 +1,223 @@
+import atexit
+import logging
+import os
+import threading
+import time
+
+import git
+from django.conf import settings
+
+from .git_pool import git_repo, repository_lock, stage_and_commit
+
+logger = logging.getLogger(__name__)
+
+
+def _commit_paths(location, message, changed_paths=(), removed_paths=()):
+    # A path queued as changed may have been deleted since; stage it as a removal
+    removed_paths = list(removed_paths) + [
+        path for path in changed_paths if not os.path.lexists(os.path.join(location, path))
+    ]
+    changed_paths = [path for path in changed_paths if os.path.lexists(os.path.join(location, path))]
+    removed_paths = [path for path in removed_paths if not os.path.lexists(os.path.join(location, path))]
+    with git_repo(location, write=True) as repo:
+        return stage_and_commit(repo, message, changed_paths, removed_paths) is not None
+
+
+class CommitQueue:
+    """
+    Collects file changes for one repository and commits them together
+
+    A flush happens once no change has arrived for the quiet period, when the
+    number of pending paths reaches the batch limit, or when the oldest pending
+    change has waited for the maximum delay. All git index access for the
+    repository goes through the shared repository lock, so parallel saves
+    never race on index.lock, in this process or another worker's.
+
+    A commit that fails puts its paths back in the queue and is retried with
+    exponential backoff. The queue lives in memory only: paths pending when
+    the process dies are still in the working tree, and the first auto-commit
+    after a restart scans the whole tree and commits them.
+    """
+
+    def __init__(self, location):
+        self.location = location
+        self.commit_lock = repository_lock(location)
+        self._lock = threading.Lock()
+        self._changed = {}
+        self._removed = {}
+        self._timer = None
+        self._first_enqueued = None
+        self._failures = 0
+        self._retry_at = None
+
+    @property
+    def quiet_period(self):
+        return getattr(settings, 'FILESYS_COMMIT_QUIET_PERIOD', 2.0)
+
+    @property
+    def max_batch(self):
+        return getattr(settings, 'FILESYS_COMMIT_MAX_BATCH', 50)
+
+    @property
+    def max_delay(self):
+        return getattr(settings, 'FILESYS_COMMIT_MAX_DELAY', 30.0)
+
+    @property
+    def retry_delay(self):
+        return getattr(settings, 'FILESYS_COMMIT_RETRY_DELAY', 5.0)
+
+    @property
+    def max_retry_delay(self):
+        return getattr(settings, 'FILESYS_COMMIT_MAX_RETRY_DELAY', 300.0)
+
+    def pending(self):
+        with self._lock:
+            return len(self._changed) + len(self._removed)
+
+    def enqueue(self, changed_paths=(), removed_paths=(), message=None):
+        with self._lock:
+            for path in changed_paths:
+                self._removed.pop(path, None)
+                self._changed[path] = message
+            for path in removed_paths:
+                self._changed.pop(path, None)
+                self._removed[path] = message
+
+            now = time.monotonic()
+            if self._first_enqueued is None:
+                self._first_enqueued = now
+            waited = now - self._first_enqueued
+
+            if len(self._changed) + len(self._removed) >= self.max_batch:
+                delay = 0
+            else:
+                delay = max(0, min(self.quiet_period, self.max_delay - waited))
+            if self._retry_at is not None:
+                # New saves do not cut a failed commit's backoff short
+                delay = max(delay, self._retry_at - now)
+            self._schedule(delay)
+
+    def _schedule(self, delay):
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = threading.Timer(delay, self.flush)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _take(self):
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            changed, removed = self._changed, self._removed
+            self._changed, self._removed = {}, {}
+            self._first_enqueued = None
+            return changed, removed
+
+    def flush(self, changed_paths=(), removed_paths=(), message=None):
+        """
+        Commit everything pending, plus any extra paths given, as one commit
+
+        Returns:
+            bool: True if a commit was created
+        """
+        with self.commit_lock:
+            changed, removed = self._take()
+            for path in changed_paths:
+                removed.pop(path, None)
+                changed[path] = message
+            for path in removed_paths:
+                changed.pop(path, None)
+                removed[path] = message
+
+            committed = False
+            if changed or removed:
+                try:
+                    committed = _commit_paths(
+                        self.location,
+                        message or _group_message(changed, removed),
+                        changed_paths=list(changed),
+                        removed_paths=list(removed)
+                    )
+                except (git.exc.GitError, OSError, ValueError) as e:
+                    self._requeue(changed, removed, e)
+                    return False
+                with self._lock:
+                    self._failures = 0
+                    self._retry_at = None
+                if committed:
+                    logger.info(f"Group commit of {len(changed) + len(removed)} path(s) in {self.location}")
+        return committed
+
+    def _requeue(self, changed, removed, error):
+        with self._lock:
+            # Anything queued again since the take is newer and wins
+            for path, message in changed.items():
+                if path not in self._changed and path not in self._removed:
+                    self._changed[path] = message
+            for path, message in removed.items():
+                if path not in self._changed and path not in self._removed:
+                    self._removed[path] = message
+            self._failures += 1
+            delay = min(self.retry_delay * (2 ** (self._failures - 1)), self.max_retry_delay)
+            now = time.monotonic()
+            self._retry_at = now + delay
+            if self._first_enqueued is None:
+                self._first_enqueued = now
+            self._schedule(delay)
+            attempts = self._failures
+        logger.warning(
+            f"Group commit in {self.location} failed (attempt {attempts}, retrying in {delay:.0f}s): {str(error)}"
+        )
+
+
+def _group_message(changed, removed):
+    messages = [m for m in list(changed.values()) + list(removed.values()) if m]
+    unique = list(dict.fromkeys(messages))
+    if len(unique) == 1:
+        return unique[0]
+    message = f"Save {len(changed) + len(removed)} file(s)\n"
+    for m in unique:
+        message += f"\n- {m}"
+    return message
+
+
+_queues = {}
+_queues_lock = threading.Lock()
+
+
+def get_queue(location):
+    with _queues_lock:
+        queue = _queues.get(location)
+        if queue is None:
+            queue = _queues[location] = CommitQueue(location)
+        return queue
+
+
+def enqueue_commit(repository, changed_paths=(), removed_paths=(), message=None):
+    """Queue file changes for the repository's next group commit"""
+    get_queue(repository.location).enqueue(changed_paths, removed_paths, message)
+
+
+def commit_now(repository, message, changed_paths=(), removed_paths=()):
+    """Commit the given paths immediately, folding in anything already queued for the repository"""
+    return get_queue(repository.location).flush(changed_paths, removed_paths, message)
+
+
+def discard_queue(location):
+    """Drop everything queued for a repository without committing it, e.g. when it is deleted"""
+    with _queues_lock:
+        queue = _queues.pop(location, None)
+    if queue is not None:
+        queue._take()
+
+
+def flush_all():
+    with _queues_lock:
+        queues = list(_queues.values())
+    for queue in queues:
+        if queue.pending():
+            queue.flush()
+
+
+atexit.register(flush_all)
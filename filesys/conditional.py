@@ -0,0 +1,127 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+
+# path -> (mtime_ns, size, sha256 hexdigest). Content is only re-hashed when
+# the stat signature of the file changes.
+_DIGEST_CACHE = OrderedDict()
+_DIGEST_CACHE_SIZE = 4096
+_digest_lock = threading.Lock()
+
+
+def file_digest(file_path, st=None):
+    """Return the sha256 hexdigest of a file, reusing the cached value while mtime and size are unchanged"""
+    st = st or os.stat(file_path)
+    signature = (st.st_mtime_ns, st.st_size)
+    with _digest_lock:
+        cached = _DIGEST_CACHE.get(file_path)
+        if cached and cached[:2] == signature:
+            _DIGEST_CACHE.move_to_end(file_path)
+            return cached[2]
+
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(64 * 1024), b''):
+            digest.update(chunk)
+    hexdigest = digest.hexdigest()
+
+    with _digest_lock:
+        _DIGEST_CACHE[file_path] = (*signature, hexdigest)
+        _DIGEST_CACHE.move_to_end(file_path)
+        while len(_DIGEST_CACHE) > _DIGEST_CACHE_SIZE:
+            _DIGEST_CACHE.popitem(last=False)
+    return hexdigest
+
+
+def file_etag(file_instance, file_path, st=None):
+    """
+    Strong ETag and Last-Modified timestamp for a File and its on-disk body
+
+    The tag is built from the file's inode, mtime and size plus the row's
+    updated_at, without reading the file, so a request after an append to a
+    large log costs a stat. A rename gives the file a new inode and an
+    in-place write moves its mtime, so a changed file gets a new tag.
+    """
+    st = st or os.stat(file_path)
+    updated = file_instance.updated_at.isoformat() if file_instance.updated_at else ''
+    signature = f"{st.st_ino}:{st.st_mtime_ns}:{st.st_size}:{updated}"
+    return quote_etag(hashlib.sha256(signature.encode('utf-8')).hexdigest()), int(st.st_mtime)
+
+
+def range_applies(request, etag, last_modified=None):
+    """
+    Whether a Range header may be honoured, per the request's If-Range
+
+    If-Range carries either an ETag, compared strongly, or an HTTP date that
+    must equal Last-Modified. When it no longer matches, the client's partial
+    copy is stale and the whole representation must be sent instead.
+    """
+    if_range = request.headers.get('If-Range')
+    if not if_range:
+        return True
+    if if_range.startswith(('"', 'W/')):
+        return not if_range.startswith('W/') and if_range == etag
+    return last_modified is not None and parse_http_date_safe(if_range) == last_modified
+
+
+def walk_repository(location):
+    """Yield (rel_path, abs_path, stat_result) for every working tree file outside .git"""
+    git_dir = os.path.join(location, '.git')
+    for root, dirs, filenames in os.walk(location):
+        if root.startswith(git_dir):
+            continue
+        dirs[:] = [d for d in dirs if os.path.join(root, d) != git_dir]
+        for filename in filenames:
+            abs_path = os.path.join(root, filename)
+            try:
+                st = os.stat(abs_path)
+            except OSError:
+                continue
+            yield os.path.relpath(abs_path, location), abs_path, st
+
+
+def worktree_signature(location):
+    """(sha256 of every working tree file's path, mtime and size, newest mtime) without reading any file"""
+    digest = hashlib.sha256()
+    last_modified = 0
+    if location and os.path.exists(location):
+        for rel_path, _, st in sorted(walk_repository(location)):
+            digest.update(f"{rel_path}\0{st.st_mtime_ns}\0{st.st_size}\n".encode('utf-8'))
+            last_modified = max(last_modified, int(st.st_mtime))
+    return digest.hexdigest(), last_modified
+
+
+def repository_etag(repository, signature=None):
+    """
+    Strong ETag and Last-Modified timestamp for the repository manifest
+
+    Built from the stat signature of the working tree plus the File rows'
+    count and latest update, so nothing has to be read from disk. Callers
+    that already computed worktree_signature() off the request thread pass it in.
+    """
+    worktree_digest, last_modified = signature or worktree_signature(repository.location)
+    digest = hashlib.sha256(worktree_digest.encode('utf-8'))
+    stats = repository.files.aggregate(count=Count('id'), latest=Max('updated_at'))
+    digest.update(f"{stats['count']}:{stats['latest']}".encode('utf-8'))
+    digest.update(f"{repository.name}:{repository.description}".encode('utf-8'))
+    if stats['latest']:
+        last_modified = max(last_modified, int(stats['latest'].timestamp()))
+    return quote_etag(digest.hexdigest()), last_modified or None
+
+
+def not_modified_response(request, etag, last_modified=None):
+    """Return a 304/412 response if the request's conditional headers match, else None"""
+    return get_conditional_response(request, etag=etag, last_modified=last_modified)
+
+
+def set_validators(response, etag, last_modified=None):
+    """Attach ETag and Last-Modified headers to a response"""
+    response['ETag'] = etag
+    if last_modified:
+        response['Last-Modified'] = http_date(last_modified)
+    return response
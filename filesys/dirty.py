@@ -0,0 +1,76 @@
+import threading
+import time
+
+from django.conf import settings
+
+# Each consumer drains its own copy of the dirty set: 'history' for auto-commit
+# snapshots and 'main' for explicit commits to the main branch.
+CONSUMERS = ('history', 'main')
+
+
+class DirtyTracker:
+    """
+    Per-repository sets of paths written since each consumer last committed
+
+    The filesys write paths mark what they touch, so committers can stage just
+    those paths instead of scanning the whole working tree. Changes made behind
+    our back (a shell, a previous process) are caught by a full reconcile the
+    first time a consumer sees a repository and every reconcile interval after.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._dirty = {}
+        self._reconciled_at = {}
+
+    @property
+    def reconcile_interval(self):
+        return getattr(settings, 'FILESYS_DIRTY_RECONCILE_INTERVAL', 600)
+
+    def mark(self, location, paths):
+        paths = [path for path in paths if path]
+        if not paths:
+            return
+        with self._lock:
+            for consumer in CONSUMERS:
+                self._dirty.setdefault((location, consumer), set()).update(paths)
+
+    def take(self, location, consumer):
+        """
+        Remove and return the consumer's dirty paths for a repository
+
+        Returns:
+            tuple: (sorted list of paths, whether a full reconcile scan is due)
+        """
+        key = (location, consumer)
+        with self._lock:
+            paths = self._dirty.pop(key, set())
+            reconciled_at = self._reconciled_at.get(key)
+        full_scan = reconciled_at is None or time.monotonic() - reconciled_at >= self.reconcile_interval
+        return sorted(paths), full_scan
+
+    def restore(self, location, consumer, paths):
+        """Put paths back after a failed commit so the next attempt picks them up"""
+        if not paths:
+            return
+        with self._lock:
+            self._dirty.setdefault((location, consumer), set()).update(paths)
+
+    def mark_reconciled(self, location, consumer):
+        with self._lock:
+            self._reconciled_at[(location, consumer)] = time.monotonic()
+
+    def forget(self, location):
+        """Drop all state for a repository, e.g. once it has been deleted"""
+        with self._lock:
+            for consumer in CONSUMERS:
+                self._dirty.pop((location, consumer), None)
+                self._reconciled_at.pop((location, consumer), None)
+
+
+tracker = DirtyTracker()
+
+
+def mark_dirty(repository, paths):
+    """Record that the given repository-relative paths changed on disk"""
+    tracker.mark(repository.location, paths)
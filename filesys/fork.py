@@ -0,0 +1,140 @@
+import logging
+import os
+import shutil
+import tempfile
+
+import git
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.utils import timezone
+
+from .commit_queue import get_queue
+from .models import Blob, File, Repository
+from .repo_templates import git_ident, link_or_copy
+from .search import copy_index
+from .symbols import copy_symbols
+
+logger = logging.getLogger(__name__)
+
+# Per-clone hooks and reflogs are not carried over; neither are *.lock files of a running git
+_SKIP_GIT_ENTRIES = {'hooks', 'logs'}
+
+
+class ForkError(Exception):
+    """Raised when a repository cannot be forked"""
+
+
+def clone_tree(source, target, link_worktree=False):
+    """
+    Recreate a repository directory at `target` without copying git objects
+
+    Objects and packs are immutable, so they are hardlinked. The refs,
+    config and index are small and rewritten in place by git, and working
+    tree files may be changed in place by anything outside this app, so
+    they are copied. `link_worktree` hardlinks working tree files too, for
+    deployments where every writer replaces files by rename.
+    """
+    git_dir = os.path.join(source, '.git')
+    objects_dir = os.path.join(git_dir, 'objects')
+    for root, dirs, filenames in os.walk(source):
+        if root == git_dir:
+            dirs[:] = [d for d in dirs if d not in _SKIP_GIT_ENTRIES]
+        in_git = root == git_dir or root.startswith(git_dir + os.sep)
+        in_objects = root == objects_dir or root.startswith(objects_dir + os.sep)
+        dest_root = os.path.join(target, os.path.relpath(root, source))
+        os.makedirs(dest_root, exist_ok=True)
+        for filename in filenames:
+            if in_git and filename.endswith('.lock'):
+                continue
+            src = os.path.join(root, filename)
+            dst = os.path.join(dest_root, filename)
+            if os.path.islink(src):
+                os.symlink(os.readlink(src), dst)
+            elif in_objects or (link_worktree and not in_git):
+                link_or_copy(src, dst)
+            else:
+                shutil.copy2(src, dst)
+
+
+def _copy_files(source, target):
+    """Copy every File row of `source` to `target` in one INSERT ... SELECT and take their blob references"""
+    now = timezone.now()
+    quote = connection.ops.quote_name
+    table = quote(File._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {table} (repository_id, path, content, blob_id, language, symbols_blob, created_at, updated_at) "
+            f"SELECT %s, path, content, blob_id, language, symbols_blob, %s, %s FROM {table} WHERE repository_id = %s",
+            [target.pk, now, now, source.pk]
+        )
+        copied = cursor.rowcount
+    # One reference per copied file, counted and applied by the database
+    per_blob = File.objects.filter(repository=target, blob_id=OuterRef('pk')).values('blob_id').annotate(
+        count=Count('id')
+    ).values('count')
+    Blob.objects.filter(pk__in=File.objects.filter(repository=target).values('blob_id')).update(
+        ref_count=F('ref_count') + Subquery(per_blob)
+    )
+    return copied
+
+
+def fork_repository(source, user, name=None, description=None):
+    """
+    Fork `source` into a new repository owned by `user`
+
+    The directory is cloned into a staging directory (git objects are
+    hardlinked, see clone_tree) and renamed into place. File rows, blob
+    references, search index rows and symbols are copied with a few
+    INSERT ... SELECT queries, so the database cost grows with the number
+    of files, not their size.
+
+    Returns:
+        Repository: the fork
+
+    Raises:
+        ForkError: if the name is taken or the source cannot be cloned
+    """
+    name = name or source.name
+    if Repository.objects.filter(user=user, name=name).exists():
+        raise ForkError(f"A repository named {name} already exists for {user.username}.")
+    user_dir = os.path.join(settings.BASE_DIR, 'c3', user.username)
+    repo_dir = os.path.join(user_dir, name)
+    if os.path.exists(repo_dir):
+        raise ForkError(f"A directory for {user.username}/{name} already exists.")
+    if not source.location or not os.path.isdir(os.path.join(source.location, '.git')):
+        raise ForkError('The repository has no git directory to fork.')
+
+    # Land queued saves in the source first, so the fork starts from its latest commit
+    get_queue(source.location).flush()
+
+    os.makedirs(user_dir, exist_ok=True)
+    staging = tempfile.mkdtemp(prefix=f".{name}-fork-", dir=user_dir)
+    try:
+        clone_tree(source.location, staging, getattr(settings, 'FILESYS_FORK_LINK_WORKTREE', False))
+        with git.Repo(staging) as repo, repo.config_writer() as config:
+            config.set_value('user', 'name', git_ident(user.username))
+            config.set_value('user', 'email', git_ident(user.email or ''))
+        os.replace(staging, repo_dir)
+    except (OSError, git.exc.GitError) as e:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise ForkError(f"Could not clone the repository: {str(e)}")
+
+    try:
+        with transaction.atomic():
+            fork = Repository.objects.create(
+                user=user,
+                name=name,
+                description=source.description if description is None else description,
+                location=repo_dir,
+                git_initialized=source.git_initialized,
+                last_commit_hash=source.last_commit_hash
+            )
+            copied = _copy_files(source, fork)
+            copy_index(source, fork)
+            copy_symbols(source, fork)
+    except Exception:
+        shutil.rmtree(repo_dir, ignore_errors=True)
+        raise
+    logger.info(f"Forked {source.slug} into {fork.slug} ({copied} file(s))")
+    return fork
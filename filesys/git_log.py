@@ -0,0 +1,95 @@
+import hashlib
+import logging
+import re
+
+import git
+from django.conf import settings
+from django.core.cache import cache
+
+from .git_pool import git_repo
+
+logger = logging.getLogger(__name__)
+
+# One NUL-separated field per placeholder; with -z records are NUL-terminated too,
+# so the output splits into fixed-size groups whatever the commit messages contain
+LOG_FIELDS = ('commit', 'parents', 'author', 'author_email', 'date', 'message', 'body')
+LOG_FORMAT = '%x00'.join(('%H', '%P', '%an', '%ae', '%ad', '%s', '%b'))
+
+COMMIT_RE = re.compile(r'^[0-9a-f]{7,40}$')
+
+
+class InvalidRevision(ValueError):
+    """Raised when a ref or cursor does not name a commit in the repository"""
+
+
+def _parse_log(output):
+    parts = output.split('\0')
+    count = len(LOG_FIELDS)
+    commits = []
+    for start in range(0, len(parts) - count + 1, count):
+        entry = dict(zip(LOG_FIELDS, parts[start:start + count]))
+        entry['commit'] = entry['commit'].strip()
+        entry['parents'] = entry['parents'].split()
+        entry['body'] = entry['body'].strip()
+        commits.append(entry)
+    return commits
+
+
+def _cache_key(location, start, path, limit):
+    digest = hashlib.sha1(f"{location}\0{start}\0{path or ''}\0{limit}".encode('utf-8')).hexdigest()
+    return f"gitlog:{digest}"
+
+
+def log_etag(tip, after=None, path=None, limit=50):
+    """ETag for a log page: it only changes when the ref tip moves"""
+    digest = hashlib.sha1(f"{after or ''}\0{path or ''}\0{limit}".encode('utf-8')).hexdigest()[:16]
+    return f'"{tip}-{digest}"'
+
+
+def resolve_commit(repo, rev):
+    """Full hexsha of the commit `rev` names, read in-process"""
+    try:
+        return repo.commit(rev).hexsha
+    except (git.exc.BadName, git.exc.BadObject, ValueError, IndexError) as e:
+        raise InvalidRevision(f"Unknown revision: {rev}") from e
+
+
+def read_log(location, ref=None, after=None, path=None, limit=50):
+    """
+    One page of `git log` for a repository, newest first
+
+    The first page is cached under the hash of the ref's current tip, so it is
+    served from the cache until the next commit moves the ref. Later pages
+    start from the `after` cursor commit, whose ancestry never changes, so
+    they are cached under that commit alone.
+
+    Returns:
+        dict: {'tip', 'commits', 'next'} where `next` is the cursor for the following page
+    """
+    ref = ref or 'HEAD'
+    if after is not None and not COMMIT_RE.match(after):
+        raise InvalidRevision(f"Invalid cursor: {after}")
+
+    with git_repo(location) as repo:
+        tip = resolve_commit(repo, ref)
+        start = resolve_commit(repo, after) if after else tip
+        key = _cache_key(location, start, path, limit)
+        page = cache.get(key)
+        if page is None:
+            args = [start, '-z', f'--format={LOG_FORMAT}', f'--max-count={limit + 1}']
+            if after:
+                args.append('--skip=1')
+            if path:
+                args.extend(['--', path])
+            try:
+                commits = _parse_log(repo.git.log(*args))
+            except git.exc.GitCommandError as e:
+                logger.error(f"Git log command failed: {str(e)}")
+                raise InvalidRevision(str(e)) from e
+            page = {
+                'commits': commits[:limit],
+                'next': commits[limit - 1]['commit'] if len(commits) > limit else None,
+            }
+            cache.set(key, page, getattr(settings, 'GIT_LOG_CACHE_TIMEOUT', 3600))
+
+    return {'tip': tip, **page}
@@ -0,0 +1,332 @@
+import difflib
+import hashlib
+import logging
+import os
+import stat
+import threading
+from collections import OrderedDict
+
+import git
+from django.conf import settings
+
+from .git_pool import check_ignored
+
+logger = logging.getLogger(__name__)
+
+# Bytes sniffed for a NUL when deciding whether content is binary, as git does
+BINARY_SNIFF = 8000
+
+
+class BlobCache:
+    """
+    Byte-budgeted LRU of blob contents keyed by blob SHA
+
+    A blob SHA always names the same bytes, so entries never go stale and one
+    cache is shared by every repository in the process.
+    """
+
+    def __init__(self, max_bytes=None):
+        self._max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    @property
+    def max_bytes(self):
+        return self._max_bytes or getattr(settings, 'GIT_BLOB_CACHE_BYTES', 64 * 1024 * 1024)
+
+    def get(self, hexsha):
+        with self._lock:
+            data = self._entries.get(hexsha)
+            if data is not None:
+                self._entries.move_to_end(hexsha)
+            return data
+
+    def put(self, hexsha, data):
+        # A single blob may take at most an eighth of the budget
+        if len(data) > self.max_bytes // 8:
+            return
+        with self._lock:
+            if hexsha in self._entries:
+                self._entries.move_to_end(hexsha)
+                return
+            self._entries[hexsha] = data
+            self._size += len(data)
+            while self._size > self.max_bytes and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self._size, 'max_bytes': self.max_bytes}
+
+
+blob_cache = BlobCache()
+
+
+def read_blob(repo, hexsha):
+    """
+    Raw bytes of a blob, from the cache or the pooled repo's persistent `cat-file --batch` worker
+    """
+    data = blob_cache.get(hexsha)
+    if data is None:
+        data = repo.odb.stream(bytes.fromhex(hexsha)).read()
+        blob_cache.put(hexsha, data)
+    return data
+
+
+def is_binary(data):
+    return b'\0' in data[:BINARY_SNIFF]
+
+
+def blob_at(repo, commit, path):
+    """
+    The blob stored at `path` in `commit`
+
+    Raises:
+        KeyError: if the path does not exist in that commit or is not a file
+    """
+    entry = commit.tree / path.strip('/')
+    if entry.type != 'blob':
+        raise KeyError(path)
+    return entry
+
+
+# abs path -> (mtime_ns, size, git blob sha1) for working tree files
+_WORKTREE_SHA_CACHE = OrderedDict()
+_WORKTREE_SHA_CACHE_SIZE = 8192
+_worktree_lock = threading.Lock()
+
+
+def worktree_blob_sha(abs_path, st=None):
+    """git's blob id for a working tree file, re-hashed only when its mtime or size changes"""
+    st = st or os.stat(abs_path)
+    signature = (st.st_mtime_ns, st.st_size)
+    with _worktree_lock:
+        cached = _WORKTREE_SHA_CACHE.get(abs_path)
+        if cached and cached[:2] == signature:
+            _WORKTREE_SHA_CACHE.move_to_end(abs_path)
+            return cached[2]
+
+    digest = hashlib.sha1(f"blob {st.st_size}\0".encode('ascii'))
+    with open(abs_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(64 * 1024), b''):
+            digest.update(chunk)
+    hexsha = digest.hexdigest()
+
+    with _worktree_lock:
+        _WORKTREE_SHA_CACHE[abs_path] = (*signature, hexsha)
+        _WORKTREE_SHA_CACHE.move_to_end(abs_path)
+        while len(_WORKTREE_SHA_CACHE) > _WORKTREE_SHA_CACHE_SIZE:
+            _WORKTREE_SHA_CACHE.popitem(last=False)
+    return hexsha
+
+
+def _in_scope(path, prefix):
+    return not prefix or path == prefix or path.startswith(prefix + '/')
+
+
+def _tree_blobs(tree):
+    """{path: blob hexsha} for every blob below `tree`"""
+    blobs = {}
+    for item in tree.traverse():
+        if item.type == 'blob':
+            blobs[item.path] = item.hexsha
+    return blobs
+
+
+def _tree_changes(old_tree, new_tree, scope=''):
+    """
+    {path: (old hexsha or None, new hexsha or None)} for blobs that differ between two trees
+
+    Subtrees with identical ids are skipped without being read, so the cost
+    follows the size of the change rather than the size of the repository.
+    """
+    changes = {}
+    old_items = {item.name: item for item in old_tree} if old_tree is not None else {}
+    new_items = {item.name: item for item in new_tree} if new_tree is not None else {}
+    for name in old_items.keys() | new_items.keys():
+        old, new = old_items.get(name), new_items.get(name)
+        if old is not None and new is not None and old.binsha == new.binsha:
+            continue
+        item = new if new is not None else old
+        if scope and not (_in_scope(item.path, scope) or scope.startswith(item.path + '/')):
+            continue
+        old_is_tree = old is not None and old.type == 'tree'
+        new_is_tree = new is not None and new.type == 'tree'
+        if old_is_tree or new_is_tree:
+            changes.update(_tree_changes(old if old_is_tree else None, new if new_is_tree else None, scope))
+        old_blob = old.hexsha if old is not None and old.type == 'blob' else None
+        new_blob = new.hexsha if new is not None and new.type == 'blob' else None
+        if (old_blob or new_blob) and _in_scope(item.path, scope):
+            changes[item.path] = (old_blob, new_blob)
+    return changes
+
+
+def _tracked_dirs(paths):
+    """Every directory that has a tracked path somewhere below it"""
+    dirs = set()
+    for path in paths:
+        while '/' in path:
+            path = path.rsplit('/', 1)[0]
+            if path in dirs:
+                break
+            dirs.add(path)
+    return dirs
+
+
+def _walk_worktree(repo, old_blobs, scope=''):
+    """
+    {rel path: (abs path, stat)} for the working tree files in `scope` that git would see
+
+    The tree is walked one directory level at a time; the untracked files and
+    directories of a level are checked against .gitignore in one batched
+    `git check-ignore`, and ignored directories are never entered, so a
+    node_modules or build directory costs one path instead of its contents.
+    """
+    location = repo.working_tree_dir
+    tracked_dirs = _tracked_dirs(old_blobs)
+    current = {}
+    level = ['']
+    while level:
+        files, dirs = [], []
+        for rel_dir in level:
+            try:
+                with os.scandir(os.path.join(location, rel_dir)) as scan:
+                    entries = list(scan)
+            except OSError:
+                continue
+            for entry in entries:
+                rel_path = f"{rel_dir}/{entry.name}" if rel_dir else entry.name
+                if rel_path == '.git':
+                    continue
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if _in_scope(rel_path, scope) or scope.startswith(rel_path + '/'):
+                            dirs.append(rel_path)
+                        continue
+                    if not _in_scope(rel_path, scope):
+                        continue
+                    st = os.stat(entry.path)
+                except OSError:
+                    continue
+                # Symlinks to directories are not walked, as in walk_repository
+                if not stat.S_ISDIR(st.st_mode):
+                    files.append((rel_path, entry.path, st))
+
+        untracked = [path for path, _, _ in files if path not in old_blobs]
+        untracked += [path for path in dirs if path not in tracked_dirs]
+        ignored = set()
+        if untracked:
+            try:
+                ignored = check_ignored(repo, untracked)
+            except git.exc.GitCommandError:
+                pass
+        for rel_path, abs_path, st in files:
+            if rel_path not in ignored:
+                current[rel_path] = (abs_path, st)
+        level = [path for path in dirs if path not in ignored]
+    return current
+
+
+def _worktree_changes(repo, old_tree, scope=''):
+    """Like _tree_changes, comparing `old_tree` against the working tree (honouring .gitignore)"""
+    old_blobs = {path: sha for path, sha in _tree_blobs(old_tree).items() if _in_scope(path, scope)}
+    current = _walk_worktree(repo, old_blobs, scope)
+
+    changes = {}
+    for path, (abs_path, st) in current.items():
+        try:
+            new_sha = worktree_blob_sha(abs_path, st)
+        except OSError:
+            continue
+        if old_blobs.get(path) != new_sha:
+            changes[path] = (old_blobs.get(path), new_sha)
+    for path, old_sha in old_blobs.items():
+        if path not in current:
+            changes[path] = (old_sha, None)
+    return changes
+
+
+def blob_size(repo, hexsha):
+    """Size of a blob from the object header, without reading its body"""
+    data = blob_cache.get(hexsha)
+    if data is not None:
+        return len(data)
+    return repo.odb.info(bytes.fromhex(hexsha)).size
+
+
+def _file_diff(repo, path, old_sha, new_sha, new_reader, new_size, context):
+    status = 'added' if old_sha is None else 'deleted' if new_sha is None else 'modified'
+    entry = {'path': path, 'status': status, 'old_sha': old_sha, 'new_sha': new_sha, 'binary': False}
+
+    # Sizes come from object headers and stat, so oversized files are never read
+    max_bytes = getattr(settings, 'GIT_DIFF_MAX_BYTES', 1024 * 1024)
+    if (old_sha and blob_size(repo, old_sha) > max_bytes) or (new_sha and new_size(path, new_sha) > max_bytes):
+        entry['too_large'] = True
+        return entry
+    old_data = read_blob(repo, old_sha) if old_sha else b''
+    new_data = new_reader(path, new_sha) if new_sha else b''
+    if len(new_data) > max_bytes:
+        # The working tree file grew after it was stat'ed
+        entry['too_large'] = True
+        return entry
+    if is_binary(old_data) or is_binary(new_data):
+        entry['binary'] = True
+        return entry
+    try:
+        old_lines = old_data.decode('utf-8').splitlines(keepends=True)
+        new_lines = new_data.decode('utf-8').splitlines(keepends=True)
+    except UnicodeDecodeError:
+        entry['binary'] = True
+        return entry
+
+    lines = difflib.unified_diff(
+        old_lines,
+        new_lines,
+        fromfile=f"a/{path}" if old_sha else '/dev/null',
+        tofile=f"b/{path}" if new_sha else '/dev/null',
+        n=context
+    )
+    # Mark a missing final newline the way git does instead of gluing lines together
+    entry['diff'] = ''.join(
+        line if line.endswith('\n') else f"{line}\n\\ No newline at end of file\n"
+        for line in lines
+    )
+    return entry
+
+
+def diff_revisions(repo, old_commit, new_commit=None, path=None, context=3):
+    """
+    Per-file unified diffs between two commits, or a commit and the working tree
+
+    Trees and blobs are read through the pooled repo's persistent cat-file
+    worker and the blob cache; diffs are computed in-process with difflib.
+
+    Returns:
+        list: one dict per changed file with path, status, old/new blob ids and `diff`
+        (omitted for binary or oversized files)
+    """
+    scope = (path or '').strip('/')
+    if new_commit is not None:
+        changes = _tree_changes(old_commit.tree, new_commit.tree, scope)
+
+        def new_reader(changed_path, sha):
+            return read_blob(repo, sha)
+
+        def new_size(changed_path, sha):
+            return blob_size(repo, sha)
+    else:
+        changes = _worktree_changes(repo, old_commit.tree, scope)
+
+        def new_reader(changed_path, sha):
+            with open(os.path.join(repo.working_tree_dir, changed_path), 'rb') as f:
+                return f.read()
+
+        def new_size(changed_path, sha):
+            return os.path.getsize(os.path.join(repo.working_tree_dir, changed_path))
+
+    return [
+        _file_diff(repo, changed, old_sha, new_sha, new_reader, new_size, context)
+        for changed, (old_sha, new_sha) in sorted(changes.items())
+    ]
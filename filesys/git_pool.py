@@ -0,0 +1,338 @@
+import logging
+import os
+import subprocess
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import git
+from django.conf import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows: only threads of one process are serialized
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Taken with flock by whichever process writes the repository's index or refs
+LOCK_FILE = 'editor-index.lock'
+
+# One lock per repository location, kept for the life of the process so that
+# evicting a handle never hands out a second lock for the same repository.
+_repository_locks = {}
+_repository_locks_guard = threading.Lock()
+
+
+class RepositoryLock:
+    """
+    Re-entrant lock serializing index and ref writes to one repository
+
+    Threads of this process queue on an RLock; the outermost holder also
+    takes an flock on .git/editor-index.lock, so worker processes serving
+    the same repositories do not race each other on git's index.lock.
+    """
+
+    def __init__(self, location):
+        self.location = location
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._fd = None
+
+    def _lock_file(self):
+        git_dir = os.path.join(self.location, '.git')
+        if fcntl is None or not os.path.isdir(git_dir):
+            return None
+        fd = os.open(os.path.join(git_dir, LOCK_FILE), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+        except BaseException:
+            os.close(fd)
+            raise
+        return fd
+
+    def acquire(self):
+        self._lock.acquire()
+        if self._depth == 0:
+            try:
+                self._fd = self._lock_file()
+            except BaseException:
+                self._lock.release()
+                raise
+        self._depth += 1
+        return True
+
+    def release(self):
+        self._depth -= 1
+        if self._depth == 0 and self._fd is not None:
+            # Closing the descriptor drops the flock
+            os.close(self._fd)
+            self._fd = None
+        self._lock.release()
+
+    def __enter__(self):
+        return self.acquire()
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+def repository_lock(location):
+    """Lock serializing all index/ref access to the repository at `location`, across processes"""
+    with _repository_locks_guard:
+        lock = _repository_locks.get(location)
+        if lock is None:
+            lock = _repository_locks[location] = RepositoryLock(location)
+        return lock
+
+
+class _Handle:
+    def __init__(self, location, epoch):
+        self.location = location
+        # GitPython keeps long-lived `git cat-file --batch`/`--batch-check` workers per Repo,
+        # so object reads through a pooled handle never fork
+        self.repo = git.Repo(location)
+        self.epoch = epoch
+        self.last_used = time.monotonic()
+
+    def close(self):
+        try:
+            self.repo.close()
+        except Exception as e:
+            logger.warning(f"Failed to close git handle for {self.location}: {str(e)}")
+
+
+class GitPool:
+    """
+    LRU of open git.Repo handles for hot repositories
+
+    A handle serves one caller at a time, since its cat-file workers are
+    not thread-safe, so concurrent readers of a repository each check out
+    their own and never wait for each other. At most `max_open` idle handles
+    are kept; the least recently used is closed when that is exceeded, and
+    a reaper thread closes handles idle for `idle_timeout` seconds.
+    """
+
+    def __init__(self, max_open=None, idle_timeout=None):
+        self._max_open = max_open
+        self._idle_timeout = idle_timeout
+        # location -> idle handles, most recently used last
+        self._idle = OrderedDict()
+        self._in_use = 0
+        # Bumped by discard(), so handles checked out before it are closed on return
+        self._epochs = {}
+        self._lock = threading.Lock()
+        self._reaper = None
+
+    @property
+    def max_open(self):
+        return self._max_open or getattr(settings, 'GIT_POOL_MAX_OPEN', 32)
+
+    @property
+    def idle_timeout(self):
+        return self._idle_timeout or getattr(settings, 'GIT_POOL_IDLE_TIMEOUT', 300)
+
+    @contextmanager
+    def open(self, location, write=False):
+        """
+        Yield a pooled git.Repo for `location`, checked out for this caller alone
+
+        Reads take no lock. With `write` set the repository lock is held for
+        the whole block; use it for anything that writes the index or refs.
+
+        Raises:
+            git.exc.InvalidGitRepositoryError / git.exc.NoSuchPathError for bad locations
+        """
+        location = os.path.normpath(location)
+        if write:
+            with repository_lock(location), self._checkout(location) as repo:
+                yield repo
+        else:
+            with self._checkout(location) as repo:
+                yield repo
+        self._ensure_reaper()
+
+    @contextmanager
+    def _checkout(self, location):
+        with self._lock:
+            epoch = self._epochs.get(location, 0)
+            handles = self._idle.get(location)
+            handle = handles.pop() if handles else None
+            if handles == []:
+                del self._idle[location]
+            self._in_use += 1
+        try:
+            if handle is None:
+                handle = _Handle(location, epoch)
+        except BaseException:
+            with self._lock:
+                self._in_use -= 1
+            raise
+        try:
+            yield handle.repo
+        finally:
+            with self._lock:
+                self._in_use -= 1
+                handle.last_used = time.monotonic()
+                if handle.epoch != self._epochs.get(location, 0):
+                    # The repository was discarded while this handle was out
+                    to_close = [handle]
+                else:
+                    self._idle.setdefault(location, []).append(handle)
+                    self._idle.move_to_end(location)
+                    to_close = self._evict()
+            for old in to_close:
+                old.close()
+
+    def _evict(self):
+        # Caller holds self._lock; returns the handles to close
+        evicted = []
+        excess = sum(len(handles) for handles in self._idle.values()) - self.max_open
+        while excess > 0 and self._idle:
+            location, handles = next(iter(self._idle.items()))
+            evicted.append(handles.pop(0))
+            if not handles:
+                del self._idle[location]
+            excess -= 1
+        return evicted
+
+    def discard(self, location):
+        """Close and forget the handles for `location`, e.g. before the repository is moved or deleted"""
+        location = os.path.normpath(location)
+        with repository_lock(location):
+            with self._lock:
+                self._epochs[location] = self._epochs.get(location, 0) + 1
+                handles = self._idle.pop(location, [])
+            for handle in handles:
+                handle.close()
+
+    def reap_idle(self):
+        """Close handles idle for longer than idle_timeout. Returns the number closed."""
+        cutoff = time.monotonic() - self.idle_timeout
+        closed = []
+        with self._lock:
+            for location, handles in list(self._idle.items()):
+                closed += [handle for handle in handles if handle.last_used < cutoff]
+                handles[:] = [handle for handle in handles if handle.last_used >= cutoff]
+                if not handles:
+                    del self._idle[location]
+        for handle in closed:
+            handle.close()
+        if closed:
+            logger.debug(f"Reaped {len(closed)} idle git handle(s)")
+        return len(closed)
+
+    def stats(self):
+        with self._lock:
+            idle = sum(len(handles) for handles in self._idle.values())
+            return {
+                'open': idle + self._in_use,
+                'in_use': self._in_use,
+                'max_open': self.max_open,
+            }
+
+    def _ensure_reaper(self):
+        if self._reaper is not None and self._reaper.is_alive():
+            return
+        with self._lock:
+            if self._reaper is not None and self._reaper.is_alive():
+                return
+            self._reaper = threading.Thread(target=self._reap_forever, name='git-pool-reaper', daemon=True)
+            self._reaper.start()
+
+    def _reap_forever(self):
+        while True:
+            time.sleep(max(1, self.idle_timeout / 2))
+            try:
+                self.reap_idle()
+            except Exception as e:
+                logger.error(f"Git pool reaper failed: {str(e)}")
+
+
+pool = GitPool()
+
+
+def git_repo(location, write=False):
+    """Context manager yielding a pooled git.Repo; pass write=True around index or ref writes"""
+    return pool.open(location, write)
+
+
+def check_ignored(repo, paths):
+    """
+    The subset of `paths` that .gitignore excludes
+
+    Paths go to one `git check-ignore --stdin` process in batches of
+    GIT_CHECK_IGNORE_BATCH, so no command line grows with the number of paths.
+    """
+    ignored = set()
+    batch_size = getattr(settings, 'GIT_CHECK_IGNORE_BATCH', 5000)
+    command = ['git', '-C', repo.working_tree_dir, 'check-ignore', '--stdin', '-z']
+    for start in range(0, len(paths), batch_size):
+        batch = paths[start:start + batch_size]
+        result = subprocess.run(command, input=''.join(f'{path}\0' for path in batch).encode('utf-8'), capture_output=True)
+        # 1 means none of the paths is ignored
+        if result.returncode not in (0, 1):
+            raise git.exc.GitCommandError(command, result.returncode, result.stderr)
+        ignored.update(path for path in result.stdout.decode('utf-8').split('\0') if path)
+    return ignored
+
+
+def drop_ignored(repo, index, paths):
+    """
+    Drop paths that are not in `index` and that .gitignore excludes, as `git add` would
+
+    Only untracked paths are checked, so the usual case of re-saving tracked
+    files does not spawn git at all.
+    """
+    candidates = [path for path in paths if (path, 0) not in index.entries]
+    if not candidates:
+        return list(paths)
+    try:
+        ignored = check_ignored(repo, candidates)
+    except git.exc.GitCommandError:
+        ignored = set()
+    return [path for path in paths if path not in ignored]
+
+
+def _bulk_add(repo, paths):
+    """Stage many paths with a single `git add` rather than one hash-object process per file"""
+    command = [
+        'git', '--literal-pathspecs', '-C', repo.working_tree_dir,
+        'add', '--pathspec-from-file=-', '--pathspec-file-nul'
+    ]
+    result = subprocess.run(command, input='\0'.join(paths).encode('utf-8'), capture_output=True)
+    if result.returncode:
+        raise git.exc.GitCommandError(command, result.returncode, result.stderr)
+
+
+def stage_and_commit(repo, message, changed_paths=(), removed_paths=()):
+    """
+    Stage the given paths in the repository's index and commit
+
+    The index, tree and commit are written in-process. GitPython hashes and
+    compresses each changed file in Python, so past GIT_BULK_STAGE_THRESHOLD
+    paths they are staged by one native `git add` instead. Returns the new
+    Commit, or None when the resulting tree is identical to HEAD's.
+    """
+    index = repo.index
+    changed_paths = drop_ignored(repo, index, changed_paths)
+    if len(changed_paths) >= getattr(settings, 'GIT_BULK_STAGE_THRESHOLD', 100):
+        _bulk_add(repo, changed_paths)
+        # Re-read the index git just wrote
+        index = repo.index
+    elif changed_paths:
+        index.add(changed_paths, write=False)
+    removed = [(path, 0) for path in removed_paths if (path, 0) in index.entries]
+    for key in removed:
+        del index.entries[key]
+    index.write()
+
+    tree = index.write_tree()
+    try:
+        head_tree = repo.head.commit.tree
+    except ValueError:
+        head_tree = None
+    if head_tree is not None and head_tree.binsha == tree.binsha:
+        return None
+    return git.Commit.create_from_tree(repo, tree, message, head=True)
@@ -0,0 +1,381 @@
+import logging
+import os
+import tarfile
+import tempfile
+import threading
+import zipfile
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, connections, transaction
+from django.utils import timezone
+
+from .atomic import atomic_write_stream, discard_temp, publish, sync_directories, sync_files, write_temp_stream
+from .blobs import acquire_contents, content_hash, release_blobs
+from .commit_queue import commit_now
+from .dirty import mark_dirty
+from .git_pool import git_repo
+from .models import File, ImportJob
+from .search import index_files
+from .symbols import schedule_symbol_index
+
+from autocommit.scheduler import schedule_auto_commit
+
+logger = logging.getLogger(__name__)
+
+# Accepted ?type values; tar covers tar.gz, tar.bz2 and tar.xz
+IMPORT_TYPES = ('zip', 'tar')
+
+
+
+class ArchiveImportError(Exception):
+    """Raised when an uploaded archive cannot be imported"""
+
+
+class ImportInProgress(ArchiveImportError):
+    """Raised when the repository already has an import running"""
+
+
+class UploadTooLarge(ArchiveImportError):
+    """Raised when the uploaded archive is larger than FILESYS_IMPORT_MAX_BYTES"""
+
+
+# Progress fields stored on the ImportJob row, by progress key
+_JOB_FIELDS = {
+    'state': 'state', 'type': 'archive_type', 'total': 'total', 'processed': 'processed',
+    'created': 'created', 'updated': 'updated', 'skipped': 'skipped', 'commit': 'commit',
+    'error': 'error', 'started_at': 'started_at', 'finished_at': 'finished_at',
+}
+
+
+def get_progress(job_id, repository):
+    """Progress of one of `repository`'s import jobs, or None"""
+    job = ImportJob.objects.filter(pk=job_id, repository=repository).select_related('repository').first()
+    return job.as_progress() if job is not None else None
+
+
+def _save_progress(progress):
+    fields = {column: progress[key] for key, column in _JOB_FIELDS.items() if key in progress}
+    for column in ('commit', 'error'):
+        if column in fields:
+            fields[column] = fields[column] or ''
+    ImportJob.objects.filter(pk=progress['job']).update(updated_at=timezone.now(), **fields)
+
+
+def clean_path(name, strip=0):
+    """
+    Repository-relative path for an archive member name, or None if it must be skipped
+
+    Absolute paths, `..` components and anything inside .git are rejected so
+    an archive can never write outside the working tree or into git's metadata.
+    """
+    parts = [part for part in name.replace('\\', '/').split('/') if part not in ('', '.')]
+    if name.startswith(('/', '\\')) or (parts and ':' in parts[0]):
+        return None
+    if '..' in parts or '.git' in parts:
+        return None
+    parts = parts[strip:]
+    return '/'.join(parts) if parts else None
+
+
+class _CountingReader:
+    """Wraps an archive member stream, enforcing a size limit and keeping small bodies for the database"""
+
+    def __init__(self, stream, max_bytes, keep_bytes, error=None):
+        self._stream = stream
+        self._max_bytes = max_bytes
+        self._keep_bytes = keep_bytes
+        self._error = error or ArchiveImportError("Entry is larger than the import size limits allow")
+        self._kept = []
+        self.size = 0
+
+    def read(self, size=-1):
+        chunk = self._stream.read(size)
+        self.size += len(chunk)
+        if self.size > self._max_bytes:
+            raise self._error
+        if self.size <= self._keep_bytes:
+            self._kept.append(chunk)
+        else:
+            self._kept = None
+        return chunk
+
+    def text(self):
+        """Body as text, or None for binary or oversized entries"""
+        if self._kept is None:
+            return None
+        try:
+            return b''.join(self._kept).decode('utf-8')
+        except UnicodeDecodeError:
+            return None
+
+
+def _members(archive_path, archive_type):
+    """
+    Yield (name, declared size, opener) for every regular file in the archive
+
+    Links and devices are skipped. The size comes from the entry header and
+    is only a claim; the bytes actually read are limited separately.
+    """
+    if archive_type == 'zip':
+        with zipfile.ZipFile(archive_path) as archive:
+            for info in archive.infolist():
+                # Symlinks are stored with S_IFLNK in the upper bits of external_attr
+                if info.is_dir() or (info.external_attr >> 28) == 0o12:
+                    continue
+                yield info.filename, info.file_size, lambda info=info: archive.open(info)
+    else:
+        with tarfile.open(archive_path, mode='r:*') as archive:
+            for member in archive:
+                if member.isfile():
+                    yield member.name, member.size, lambda member=member: archive.extractfile(member)
+
+
+def _scan(archive_path, archive_type, max_files, max_bytes):
+    """
+    (number of regular files, the single top-level directory every entry sits in or None)
+
+    Archives claiming more than `max_files` files or `max_bytes` uncompressed
+    are refused here, from the headers alone, before anything is extracted.
+    """
+    total = 0
+    total_bytes = 0
+    roots = set()
+    for name, size, _ in _members(archive_path, archive_type):
+        total += 1
+        total_bytes += size
+        if total > max_files:
+            raise ArchiveImportError(f"Archive has more than {max_files} files")
+        if total_bytes > max_bytes:
+            raise ArchiveImportError(f"Archive expands to more than {max_bytes} bytes")
+        parts = [part for part in name.replace('\\', '/').split('/') if part not in ('', '.')]
+        roots.add(parts[0] if len(parts) > 1 else None)
+    root = roots.pop() if len(roots) == 1 else None
+    return total, root
+
+
+def detect_type(archive_path):
+    if zipfile.is_zipfile(archive_path):
+        return 'zip'
+    try:
+        with tarfile.open(archive_path, mode='r:*'):
+            return 'tar'
+    except tarfile.TarError:
+        raise ArchiveImportError('Upload is not a zip or tar archive')
+
+
+def spool_upload(stream, length=None):
+    """
+    Copy the request body to a temp file; archives are read after the request returns
+
+    Raises:
+        UploadTooLarge: if the declared `length` or the bytes read exceed FILESYS_IMPORT_MAX_BYTES
+    """
+    max_bytes = getattr(settings, 'FILESYS_IMPORT_MAX_BYTES', 1024 * 1024 * 1024)
+    error = UploadTooLarge(f"Uploads are limited to {max_bytes} bytes")
+    if length is not None and length > max_bytes:
+        raise error
+    fd, path = tempfile.mkstemp(prefix='repo-import-', suffix='.upload')
+    os.close(fd)
+    try:
+        # A scratch copy; nothing is lost if it does not survive a crash
+        atomic_write_stream(path, _CountingReader(stream, max_bytes, 0, error), durability='none')
+    except BaseException:
+        os.unlink(path)
+        raise
+    return path
+
+
+def _publish_batch(staged):
+    """Sync the staged temp files ({path: (target, temp path)}) in one go, then rename each into place"""
+    sync_files([tmp_path for _, tmp_path in staged.values()])
+    for path, (target, tmp_path) in list(staged.items()):
+        publish(tmp_path, target, durability='none')
+        del staged[path]
+
+
+def _record_batch(repository, batch):
+    """Create or update the File rows for one batch ({path: text or None}) in one transaction"""
+    now = timezone.now()
+    with transaction.atomic():
+        existing = {
+            file_obj.path: file_obj
+            for file_obj in File.objects.filter(repository=repository, path__in=list(batch))
+        }
+        blobs = acquire_contents([content for content in batch.values() if content is not None])
+        created, updated = [], []
+        released = Counter()
+        for path, content in batch.items():
+            file_obj = existing.get(path)
+            if file_obj is None:
+                file_obj = File(repository=repository, path=path)
+                created.append(file_obj)
+            else:
+                released[file_obj.blob_id] += 1
+                file_obj.updated_at = now
+                updated.append(file_obj)
+            file_obj.blob = blobs[content_hash(content)] if content is not None else None
+            file_obj.content = None
+            file_obj.language = file_obj.language_from_path() if content else None
+        created = File.objects.bulk_create(created)
+        if updated:
+            File.objects.bulk_update(updated, ['blob', 'content', 'language', 'updated_at'])
+            release_blobs(released)
+        index_files(created + updated)
+        schedule_symbol_index(created + updated)
+    return len(created), len(updated)
+
+
+def run_import(repository, archive_path, archive_type, job_id, strip='auto', message=None):
+    """
+    Unpack an archive into the repository's working tree and record its files
+
+    Entries are streamed to disk one at a time, File rows are written with
+    bulk_create/bulk_update every FILESYS_IMPORT_BATCH_SIZE entries, and the
+    whole import lands in a single git commit. Progress is written to the
+    job's ImportJob row for the status endpoint.
+    """
+    progress = {'job': job_id, 'repository': repository.slug}
+    progress.update({
+        'state': ImportJob.RUNNING, 'processed': 0, 'created': 0, 'updated': 0,
+        'skipped': [], 'started_at': timezone.now()
+    })
+    _save_progress(progress)
+
+    batch_size = getattr(settings, 'FILESYS_IMPORT_BATCH_SIZE', 500)
+    max_files = getattr(settings, 'FILESYS_IMPORT_MAX_FILES', 20000)
+    max_file_bytes = getattr(settings, 'FILESYS_IMPORT_MAX_FILE_BYTES', 100 * 1024 * 1024)
+    max_total_bytes = getattr(settings, 'FILESYS_IMPORT_MAX_BYTES', 1024 * 1024 * 1024)
+    text_bytes = getattr(settings, 'FILESYS_IMPORT_MAX_TEXT_BYTES', 1024 * 1024)
+    location = os.path.realpath(repository.location)
+    # Ordered set; an archive may contain the same path twice and the last copy wins
+    written_paths = {}
+    total_bytes = 0
+    # {path: (target, temp path)} for the current batch, renamed into place together
+    staged = {}
+
+    try:
+        progress['total'], root = _scan(archive_path, archive_type, max_files, max_total_bytes)
+        _save_progress(progress)
+        if strip == 'auto':
+            # Project downloads (GitHub archives, our own exports) wrap everything in one
+            # directory; a directory the repository already has is imported as is
+            strip = 1 if root and not os.path.isdir(os.path.join(location, root)) else 0
+        batch = {}
+        for name, _, opener in _members(archive_path, archive_type):
+            path = clean_path(name, strip)
+            if path is None:
+                progress['skipped'].append(name)
+                continue
+            if len(written_paths) >= max_files:
+                raise ArchiveImportError(f"Archive has more than {max_files} files")
+            target = os.path.realpath(os.path.join(location, *path.split('/')))
+            # A symlinked directory already in the working tree must not redirect the write
+            if not target.startswith(location + os.sep):
+                progress['skipped'].append(name)
+                continue
+
+            with opener() as member:
+                reader = _CountingReader(member, min(max_file_bytes, max_total_bytes - total_bytes), text_bytes)
+                # Entries are synced a batch at a time rather than one fsync each
+                tmp_path, _ = write_temp_stream(target, reader, durability='none')
+            if path in staged:
+                discard_temp(staged[path][1])
+            staged[path] = (target, tmp_path)
+            total_bytes += reader.size
+            written_paths[path] = None
+            # Keyed by path so a repeated entry replaces the earlier one instead of inserting twice
+            batch[path] = reader.text()
+
+            if len(batch) >= batch_size:
+                _publish_batch(staged)
+                created, updated = _record_batch(repository, batch)
+                progress['created'] += created
+                progress['updated'] += updated
+                progress['processed'] = len(written_paths)
+                _save_progress(progress)
+                batch = {}
+        if batch:
+            _publish_batch(staged)
+            created, updated = _record_batch(repository, batch)
+            progress['created'] += created
+            progress['updated'] += updated
+        progress['processed'] = len(written_paths)
+
+        progress['state'] = ImportJob.COMMITTING
+        _save_progress(progress)
+        sync_directories([os.path.join(location, *path.split('/')) for path in written_paths])
+        commit = None
+        if written_paths and commit_now(
+            repository,
+            message or f"Import {len(written_paths)} file(s) from archive",
+            changed_paths=list(written_paths)
+        ):
+            with git_repo(repository.location) as repo:
+                commit = repo.head.commit.hexsha
+        if written_paths:
+            mark_dirty(repository, list(written_paths))
+            schedule_auto_commit(repository.id)
+        progress.update({'state': ImportJob.DONE, 'commit': commit})
+        logger.info(f"Imported {len(written_paths)} file(s) ({total_bytes} bytes) into {repository.slug}")
+    except Exception as e:
+        # Files written before the failure stay on disk and in the database; a retry overwrites them
+        progress.update({'state': ImportJob.FAILED, 'error': str(e), 'processed': len(written_paths)})
+        logger.error(f"Archive import into {repository.slug} failed: {str(e)}")
+    finally:
+        for _, tmp_path in staged.values():
+            discard_temp(tmp_path)
+        progress['finished_at'] = timezone.now()
+        progress['skipped'] = progress['skipped'][:100]
+        # Finishing the job releases the repository for the next import
+        _save_progress(progress)
+        try:
+            os.unlink(archive_path)
+        except OSError:
+            pass
+    return progress
+
+
+def start_import(repository, archive_path, archive_type=None, strip='auto', message=None):
+    """
+    Queue an import on a background thread
+
+    Jobs left active by a process that died are failed once they have not
+    reported progress for FILESYS_IMPORT_STALE_AFTER seconds, and finished
+    jobs are kept for FILESYS_IMPORT_KEEP_FINISHED seconds.
+
+    Returns:
+        dict: the initial progress record, including the job id
+
+    Raises:
+        ArchiveImportError: if the upload is not a zip or tar archive
+        ImportInProgress: if the repository already has an import running
+    """
+    archive_type = archive_type or detect_type(archive_path)
+    now = timezone.now()
+    jobs = ImportJob.objects.filter(repository=repository)
+    jobs.filter(
+        state__in=ImportJob.ACTIVE_STATES,
+        updated_at__lt=now - timedelta(seconds=getattr(settings, 'FILESYS_IMPORT_STALE_AFTER', 3600))
+    ).update(state=ImportJob.FAILED, error='Interrupted', finished_at=now, updated_at=now)
+    jobs.filter(
+        finished_at__lt=now - timedelta(seconds=getattr(settings, 'FILESYS_IMPORT_KEEP_FINISHED', 86400))
+    ).delete()
+    try:
+        with transaction.atomic():
+            job = ImportJob.objects.create(repository=repository, archive_type=archive_type)
+    except IntegrityError:
+        raise ImportInProgress('An import is already running for this repository')
+    job.repository = repository
+    job_id = job.id.hex
+    progress = job.as_progress()
+
+    def work():
+        try:
+            run_import(repository, archive_path, archive_type, job_id, strip=strip, message=message)
+        finally:
+            connections.close_all()
+
+    threading.Thread(target=work, name=f"repo-import-{job_id[:8]}", daemon=True).start()
+    return progress
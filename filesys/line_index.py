@@ -0,0 +1,159 @@
+import mmap
+import os
+import re
+import threading
+from array import array
+from collections import OrderedDict
+
+# path -> (mtime_ns, size, offsets). offsets[i] is the byte offset where line
+# i + 1 starts; a trailing entry marks the end of the file.
+_OFFSET_CACHE = OrderedDict()
+_OFFSET_CACHE_SIZE = 64
+_offset_lock = threading.Lock()
+
+_RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+RANGE_CHUNK_SIZE = 64 * 1024
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+class MappedFile:
+    """Read-only memory map of a file; empty files map to an empty bytes object"""
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self._file = None
+        self.data = b''
+
+    def __enter__(self):
+        self._file = open(self.file_path, 'rb')
+        self.stat = os.fstat(self._file.fileno())
+        if self.stat.st_size:
+            self.data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self
+
+    def __exit__(self, *exc):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+        self._file.close()
+        return False
+
+
+def _build_offsets(data, size):
+    offsets = array('Q', [0])
+    pos = data.find(b'\n')
+    while pos != -1:
+        offsets.append(pos + 1)
+        pos = data.find(b'\n', pos + 1)
+    if offsets[-1] != size:
+        offsets.append(size)
+    return offsets
+
+
+def line_offsets(mapped):
+    """Return the cached line-offset index for a mapped file, rebuilding it when the file changed"""
+    signature = (mapped.stat.st_mtime_ns, mapped.stat.st_size)
+    with _offset_lock:
+        cached = _OFFSET_CACHE.get(mapped.file_path)
+        if cached and cached[:2] == signature:
+            _OFFSET_CACHE.move_to_end(mapped.file_path)
+            return cached[2]
+
+    offsets = _build_offsets(mapped.data, mapped.stat.st_size)
+
+    with _offset_lock:
+        _OFFSET_CACHE[mapped.file_path] = (*signature, offsets)
+        _OFFSET_CACHE.move_to_end(mapped.file_path)
+        while len(_OFFSET_CACHE) > _OFFSET_CACHE_SIZE:
+            _OFFSET_CACHE.popitem(last=False)
+    return offsets
+
+
+def read_line_window(file_path, start_line, end_line):
+    """
+    Read lines start_line..end_line (1-based, inclusive) without loading the whole file
+
+    Returns:
+        dict: content, the clamped start/end lines, total_lines and size in bytes
+    """
+    with MappedFile(file_path) as mapped:
+        offsets = line_offsets(mapped)
+        total_lines = len(offsets) - 1
+        start_line = max(1, start_line)
+        end_line = min(end_line, total_lines)
+        if start_line > end_line:
+            content = ''
+        else:
+            chunk = mapped.data[offsets[start_line - 1]:offsets[end_line]]
+            content = chunk.decode('utf-8')
+        return {
+            'start_line': start_line,
+            'end_line': max(end_line, start_line - 1),
+            'total_lines': total_lines,
+            'size': mapped.stat.st_size,
+            'content': content,
+        }
+
+
+def parse_range_header(header, size):
+    """
+    Parse a single-range HTTP Range header into inclusive (start, end) byte offsets
+
+    Returns None when there is no usable header: multi-range and malformed
+    headers are ignored, so the whole file is served with a 200. Raises
+    RangeNotSatisfiable when a valid range lies outside the file.
+    """
+    if not header:
+        return None
+    match = _RANGE_RE.match(header.strip())
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range: the final N bytes
+        length = int(last)
+        if length == 0 or size == 0:
+            raise RangeNotSatisfiable(header)
+        return max(0, size - length), size - 1
+    start = int(first)
+    if last and int(last) < start:
+        return None
+    if start >= size:
+        raise RangeNotSatisfiable(header)
+    end = min(int(last), size - 1) if last else size - 1
+    return start, end
+
+
+class ByteRangeReader:
+    """
+    Iterates over bytes start..end (inclusive) of a file in chunks of at most chunk_size
+
+    The file is opened up front, so the range is read from the file that was
+    current when the response was built even if it is replaced meanwhile.
+    close() is called by StreamingHttpResponse once the body is sent.
+    """
+
+    def __init__(self, file_path, start, end, chunk_size=RANGE_CHUNK_SIZE):
+        self._file = open(file_path, 'rb')
+        self._file.seek(start)
+        self._remaining = end - start + 1
+        self.chunk_size = chunk_size
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._remaining <= 0:
+            raise StopIteration
+        chunk = self._file.read(min(self.chunk_size, self._remaining))
+        if not chunk:
+            raise StopIteration
+        self._remaining -= len(chunk)
+        return chunk
+
+    def close(self):
+        self._file.close()
@@ -0,0 +1,59 @@
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+
+from filesys.repo_templates import DEFAULT_TEMPLATE, TEMPLATES, create_from_template
+
+
+def _create_with_git_cli(repo_dir, user, gitignore):
+    """The per-step git invocations repository creation used before templates, for comparison"""
+    os.makedirs(repo_dir, exist_ok=True)
+    subprocess.run(['git', 'init'], cwd=repo_dir, check=True, capture_output=True, text=True)
+    with open(os.path.join(repo_dir, '.gitignore'), 'w') as f:
+        f.write(gitignore)
+    subprocess.run(['git', 'add', '.'], cwd=repo_dir, check=True)
+    subprocess.run(['git', 'config', '--local', 'user.email', user.email], cwd=repo_dir, check=True)
+    subprocess.run(['git', 'config', '--local', 'user.name', user.username], cwd=repo_dir, check=True)
+    status = subprocess.run(['git', 'status', '--porcelain'], cwd=repo_dir, capture_output=True, text=True)
+    if status.stdout.strip():
+        subprocess.run(['git', 'commit', '-q', '-m', 'Initial commit'], cwd=repo_dir, check=True)
+
+
+class Command(BaseCommand):
+    help = 'Time repository creation from a template against the git CLI sequence it replaced'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=50, help='Repositories created per method')
+        parser.add_argument('--template', choices=sorted(TEMPLATES), default=DEFAULT_TEMPLATE)
+
+    def handle(self, *args, **options):
+        count = options['count']
+        user = get_user_model()(username='benchmark', email='benchmark@example.com')
+        gitignore = TEMPLATES[DEFAULT_TEMPLATE]['.gitignore']
+        scratch = tempfile.mkdtemp(prefix='repo-bench-')
+        try:
+            with override_settings(BASE_DIR=scratch):
+                # Build the skeleton outside the timed loop, as a running server would have
+                create_from_template(os.path.join(scratch, 'c3', 'warmup'), user, options['template'])
+
+                started = time.perf_counter()
+                for i in range(count):
+                    _create_with_git_cli(os.path.join(scratch, 'c3', 'cli', str(i)), user, gitignore)
+                cli = (time.perf_counter() - started) / count
+
+                started = time.perf_counter()
+                for i in range(count):
+                    create_from_template(os.path.join(scratch, 'c3', 'template', str(i)), user, options['template'])
+                templated = (time.perf_counter() - started) / count
+        finally:
+            shutil.rmtree(scratch, ignore_errors=True)
+
+        self.stdout.write(f"git CLI:  {cli * 1000:.1f} ms per repository")
+        self.stdout.write(f"template: {templated * 1000:.1f} ms per repository")
+        self.stdout.write(self.style.SUCCESS(f"{cli / templated:.1f}x faster over {count} repositories"))
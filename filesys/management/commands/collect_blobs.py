@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from filesys.blobs import collect_garbage, reconcile_ref_counts
+from filesys.models import File
+
+
+class Command(BaseCommand):
+    help = 'Move legacy inline file content into blobs and delete unreferenced blobs'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--reconcile',
+            action='store_true',
+            help='Recompute blob reference counts from File rows before collecting'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Number of legacy File rows converted per transaction'
+        )
+
+    def handle(self, *args, **options):
+        migrated = 0
+        legacy = File.objects.filter(blob__isnull=True, content__isnull=False).order_by('id')
+        while True:
+            with transaction.atomic():
+                batch = list(legacy[:options['batch_size']])
+                if not batch:
+                    break
+                for file_obj in batch:
+                    file_obj.set_content(file_obj.content)
+                File.objects.bulk_update(batch, ['blob', 'content'])
+                migrated += len(batch)
+        if migrated:
+            self.stdout.write(f"Moved {migrated} file(s) into the blob store")
+
+        if options['reconcile']:
+            fixed = reconcile_ref_counts()
+            self.stdout.write(f"Corrected reference counts on {fixed} blob(s)")
+
+        deleted = collect_garbage()
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} unreferenced blob(s)"))
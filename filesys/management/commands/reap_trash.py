@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from filesys.trash import reaper
+
+
+class Command(BaseCommand):
+    help = 'Reclaim disk space and rows of deleted repositories waiting in the trash'
+
+    def handle(self, *args, **options):
+        reclaimed = reaper.reap()
+        stats = reaper.stats()
+        self.stdout.write(
+            f"{stats['pending']} still pending, {stats['failures']} failure(s), "
+            f"{stats['orphans_removed']} orphaned trash entr{'y' if stats['orphans_removed'] == 1 else 'ies'} removed"
+        )
+        if stats['last_error']:
+            self.stderr.write(f"Last error: {stats['last_error']}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Reclaimed {reclaimed} repositor{'y' if reclaimed == 1 else 'ies'} ({stats['reclaimed_bytes']} bytes)"
+        ))
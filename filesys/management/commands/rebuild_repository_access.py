@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from filesys.access import rebuild_access
+from filesys.models import Repository
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the denormalized repository access table from owners and collaborators'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'slugs',
+            nargs='*',
+            help='Only rebuild these repositories (owner/name); defaults to all'
+        )
+
+    def handle(self, *args, **options):
+        repositories = Repository.all_objects.all()
+        if options['slugs']:
+            repositories = repositories.filter(slug__in=options['slugs'])
+        written = rebuild_access(repositories)
+        self.stdout.write(self.style.SUCCESS(f"Wrote {written} access row(s)"))
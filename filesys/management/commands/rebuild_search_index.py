@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from filesys.models import Repository
+from filesys.search import ensure_search_table, rebuild_index
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the code search index, e.g. for files written before it existed'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'slugs',
+            nargs='*',
+            help='Only rebuild these repositories (owner/name); defaults to all'
+        )
+
+    def handle(self, *args, **options):
+        if not ensure_search_table():
+            self.stdout.write(self.style.WARNING('No trigram index on this database; search scans file contents'))
+            return
+        repositories = Repository.objects.all()
+        if options['slugs']:
+            repositories = repositories.filter(slug__in=options['slugs'])
+        total = 0
+        for repository in repositories.iterator():
+            total += rebuild_index(repository)
+        self.stdout.write(self.style.SUCCESS(f"Indexed {total} file(s)"))
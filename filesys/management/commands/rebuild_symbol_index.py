@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from filesys.models import File
+from filesys.symbols import index_symbols
+
+
+class Command(BaseCommand):
+    help = 'Build the symbol index for files whose content changed since they were last indexed'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'slugs',
+            nargs='*',
+            help='Only index these repositories (owner/name); defaults to all'
+        )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Re-index every file, even if its content is unchanged'
+        )
+
+    def handle(self, *args, **options):
+        files = File.objects.filter(repository__deleted_at__isnull=True).select_related('blob')
+        if options['slugs']:
+            files = files.filter(repository__slug__in=options['slugs'])
+        indexed = index_symbols(files.iterator(chunk_size=500), force=options['force'])
+        self.stdout.write(self.style.SUCCESS(f"Indexed {indexed} file(s)"))
@@ -0,0 +1,124 @@
+# Generated by Django 5.2.18 on 2026-10-19 04:21
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Blob',
+            fields=[
+                ('sha256', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('content', models.TextField(blank=True)),
+                ('size', models.PositiveBigIntegerField(default=0)),
+                ('ref_count', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='File',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('path', models.CharField(max_length=500)),
+                ('content', models.TextField(blank=True, null=True)),
+                ('language', models.CharField(blank=True, max_length=50, null=True)),
+                ('symbols_blob', models.CharField(blank=True, default='', max_length=64)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('blob', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='files', to='filesys.blob')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Repository',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255)),
+                ('slug', models.SlugField(blank=True, max_length=500, unique=True)),
+                ('description', models.TextField(blank=True, null=True)),
+                ('location', models.CharField(blank=True, max_length=500, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('git_initialized', models.BooleanField(default=False)),
+                ('last_commit_hash', models.CharField(blank=True, max_length=40)),
+                ('deleted_at', models.DateTimeField(blank=True, db_index=True, null=True)),
+                ('collaborators', models.ManyToManyField(blank=True, related_name='collaborative_repositories', to=settings.AUTH_USER_MODEL)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='FileImport',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('module', models.CharField(max_length=500)),
+                ('target', models.CharField(max_length=500)),
+                ('line', models.PositiveIntegerField()),
+                ('file', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='imports', to='filesys.file')),
+                ('repository', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='imports', to='filesys.repository')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='file',
+            name='repository',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='files', to='filesys.repository'),
+        ),
+        migrations.CreateModel(
+            name='RepositoryAccess',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('role', models.CharField(choices=[('owner', 'Owner'), ('collaborator', 'Collaborator')], max_length=20)),
+                ('repository', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='access_entries', to='filesys.repository')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='repository_access', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Symbol',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255)),
+                ('kind', models.CharField(blank=True, max_length=20)),
+                ('role', models.CharField(choices=[('definition', 'Definition'), ('reference', 'Reference')], max_length=20)),
+                ('container', models.CharField(blank=True, max_length=255)),
+                ('line', models.PositiveIntegerField()),
+                ('column', models.PositiveIntegerField(default=0)),
+                ('file', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='symbols', to='filesys.file')),
+                ('repository', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='symbols', to='filesys.repository')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='repository',
+            index=models.Index(fields=['-created_at', '-id'], name='filesys_rep_created_d61469_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='repository',
+            unique_together={('user', 'name')},
+        ),
+        migrations.AddIndex(
+            model_name='fileimport',
+            index=models.Index(fields=['repository', 'target'], name='filesys_fil_reposit_4202a3_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='file',
+            unique_together={('repository', 'path')},
+        ),
+        migrations.AddIndex(
+            model_name='repositoryaccess',
+            index=models.Index(fields=['repository', 'role'], name='filesys_rep_reposit_d61abb_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='repositoryaccess',
+            unique_together={('user', 'repository')},
+        ),
+        migrations.AddIndex(
+            model_name='symbol',
+            index=models.Index(fields=['repository', 'name', 'role'], name='filesys_sym_reposit_4f5dec_idx'),
+        ),
+    ]
@@ -0,0 +1,40 @@
+from django.db import migrations
+
+OWNER = 'owner'
+COLLABORATOR = 'collaborator'
+BATCH_SIZE = 500
+
+
+def backfill_access(apps, schema_editor):
+    """Create the RepositoryAccess rows for repositories that predate the table, like rebuild_access"""
+    Repository = apps.get_model('filesys', 'Repository')
+    RepositoryAccess = apps.get_model('filesys', 'RepositoryAccess')
+    db_alias = schema_editor.connection.alias
+
+    # Historical models get a plain manager, so tombstoned repositories are included too
+    rows = {
+        (repository_id, user_id): OWNER
+        for repository_id, user_id in Repository.objects.using(db_alias).values_list('pk', 'user_id')
+    }
+    collaborators = Repository.collaborators.through.objects.using(db_alias).values_list('repository_id', 'user_id')
+    for key in collaborators:
+        rows.setdefault(key, COLLABORATOR)
+    existing = set(RepositoryAccess.objects.using(db_alias).values_list('repository_id', 'user_id'))
+    RepositoryAccess.objects.using(db_alias).bulk_create(
+        [
+            RepositoryAccess(repository_id=repository_id, user_id=user_id, role=role)
+            for (repository_id, user_id), role in rows.items() if (repository_id, user_id) not in existing
+        ],
+        batch_size=BATCH_SIZE
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('filesys', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_access, migrations.RunPython.noop),
+    ]
@@ -1,13 +1,22 @@
-import json
 import logging
+import uuid
+
+import git
 from django.db import models
 from django.conf import settings
-import subprocess
 import magic  # Works with python-magic-bin on Windows
 from django.utils.text import slugify
+from .git_pool import git_repo
 
 logger = logging.getLogger(__name__)
 
+class RepositoryManager(models.Manager):
+    """Default manager: hides repositories that have been deleted but not yet reaped"""
+
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at__isnull=True)
+
+
 class Repository(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     name = models.CharField(max_length=255)
@@ -23,9 +32,17 @@ class Repository(models.Model):
         related_name='collaborative_repositories',
         blank=True
     )
+    # Set when the repository is deleted; the row and its trashed directory are
+    # removed later by the trash reaper
+    deleted_at = models.DateTimeField(blank=True, null=True, db_index=True)
+
+    objects = RepositoryManager()
+    all_objects = models.Manager()
 
     class Meta:
         unique_together = ('user', 'name')
+        # Backs the cursor-paginated repository listing
+        indexes = [models.Index(fields=['-created_at', '-id'])]
 
     def __str__(self):
         return f"{self.user.username}/{self.name}"
@@ -37,12 +54,9 @@ class Repository(models.Model):
 
     def get_git_status(self):
         try:
-            result = subprocess.run(['git', 'status'], 
-                                   cwd=self.location,
-                                   capture_output=True, 
-                                   text=True)
-            return result.stdout
-        except subprocess.CalledProcessError:
+            with git_repo(self.location) as repo:
+                return repo.git.status()
+        except (git.exc.GitError, OSError):
             return "Git status unavailable"
 
     def get_git_logs(self, count=10, branch=None):
@@ -51,48 +65,63 @@ class Repository(models.Model):
         
         Args:
             count (int): Number of commits to fetch
-            branch (str): Branch name. If None, shows all history
+            branch (str): Branch name. If None, shows the history of HEAD
             
         Returns:
             list: List of commit dictionaries containing hash, author, date, and message
         """
+        from .git_log import InvalidRevision, read_log
         try:
-            cmd = ['git', 'log', f'-{count}', 
-                  '--pretty=format:{%n  "commit": "%H",%n  "author": "%an",%n  "date": "%ad",%n  "message": "%s"%n},']
-            
-            if branch:
-                cmd.append(branch)
-                
-            result = subprocess.run(
-                cmd,
-                cwd=self.location,
-                capture_output=True,
-                text=True,
-                check=True
-            )
-            
-            if result.stdout:
-                # Format the output as proper JSON
-                json_str = f"[{result.stdout.rstrip(',')}]"
-                return json.loads(json_str)
-            return []
-            
-        except subprocess.CalledProcessError as e:
-            logger.error(f"Git log command failed: {e.stderr}")
-            return []
-        except json.JSONDecodeError as e:
-            logger.error(f"Failed to parse git log output: {e}")
+            return read_log(self.location, ref=branch, limit=count)['commits']
+        except (InvalidRevision, git.exc.GitError, OSError) as e:
+            logger.error(f"Git log command failed: {str(e)}")
             return []
 
     def user_has_access(self, user):
         """Check if user has access (owner or collaborator)"""
-        return user == self.user or self.collaborators.filter(id=user.id).exists()
+        from .access import get_access_map
+        return self.user_id == user.pk or self.pk in get_access_map(user)
+
+class RepositoryAccess(models.Model):
+    """
+    Denormalized (user, repository, role) rows mirroring Repository.user and
+    Repository.collaborators, so access checks are a single indexed lookup
+    """
+    OWNER = 'owner'
+    COLLABORATOR = 'collaborator'
+    ROLE_CHOICES = [(OWNER, 'Owner'), (COLLABORATOR, 'Collaborator')]
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='repository_access')
+    repository = models.ForeignKey(Repository, on_delete=models.CASCADE, related_name='access_entries')
+    role = models.CharField(max_length=20, choices=ROLE_CHOICES)
+
+    class Meta:
+        unique_together = ('user', 'repository')
+        indexes = [models.Index(fields=['repository', 'role'])]
+
+    def __str__(self):
+        return f"{self.user_id} {self.role} of {self.repository_id}"
+
+class Blob(models.Model):
+    """Content-addressed file content, shared by every File with identical text"""
+    sha256 = models.CharField(max_length=64, primary_key=True)
+    content = models.TextField(blank=True)
+    size = models.PositiveBigIntegerField(default=0)
+    ref_count = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.sha256[:12]} ({self.size} bytes, {self.ref_count} refs)"
 
 class File(models.Model):
     repository = models.ForeignKey(Repository, on_delete=models.CASCADE, related_name='files')
     path = models.CharField(max_length=500)
+    # Legacy inline content; new writes go through `blob`
     content = models.TextField(blank=True, null=True)
+    blob = models.ForeignKey(Blob, on_delete=models.PROTECT, related_name='files', blank=True, null=True)
     language = models.CharField(max_length=50, blank=True, null=True)
+    # Blob the symbol index was last built from; equal to blob_id when it is current
+    symbols_blob = models.CharField(max_length=64, blank=True, default='')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -102,30 +131,177 @@ class File(models.Model):
     def __str__(self):
         return f"{self.path} ({self.repository.name})"
 
+    def get_content(self):
+        """Return the file text from its blob, falling back to legacy inline content."""
+        if self.blob_id:
+            return self.blob.content
+        return self.content
+
+    def set_content(self, content):
+        """
+        Point this file at the blob for `content`, moving the blob reference counts.
+        Saving the row is left to the caller.
+        """
+        from .blobs import acquire_blob, content_hash, release_blob
+
+        previous_blob_id = self.blob_id
+        if content is not None and previous_blob_id == content_hash(content):
+            # Unchanged content: keep the existing reference
+            self.content = None
+            return
+        if content is None:
+            self.blob = None
+        else:
+            self.blob = acquire_blob(content)
+        self.content = None
+        if previous_blob_id:
+            release_blob(previous_blob_id)
+
     def detect_language(self):
         """Detect the programming language of the file based on its extension or content."""
-        if not self.content:
+        content = self.get_content()
+        if not content:
             return None
         
         # Use python-magic-bin compatible detection
         mime_detector = magic.Magic(mime=True)
-        file_type = mime_detector.from_buffer(self.content.encode('utf-8'))
+        file_type = mime_detector.from_buffer(content.encode('utf-8'))
         
+        return self.language_from_path()
+
+    def language_from_path(self):
+        """Map the file extension to a language name, without looking at the content."""
         # Simple mapping based on extension or MIME type
         extension = self.path.split('.')[-1].lower() if '.' in self.path else ''
         language_map = {
             'py': 'python',
             'js': 'javascript',
+            'jsx': 'javascript',
+            'ts': 'typescript',
+            'tsx': 'typescript',
             'md': 'markdown',
             'html': 'html',
             'css': 'css',
             'java': 'java',
             'c': 'c',
+            'h': 'c',
             'cpp': 'cpp',
+            'cc': 'cpp',
+            'hpp': 'cpp',
+            'cs': 'csharp',
             'txt': 'plaintext',
         }
         return language_map.get(extension, 'plaintext')  # Default to plaintext if unknown
 
     def user_has_access(self, user):
         """Check if user has access through repository permissions"""
-        return self.repository.user_has_access(user)
\ No newline at end of file
+        from .access import get_access_map
+        return self.repository_id in get_access_map(user)
+
+class Symbol(models.Model):
+    """A definition or reference of a name in a file, extracted by filesys.symbols"""
+    DEFINITION = 'definition'
+    REFERENCE = 'reference'
+    ROLE_CHOICES = [(DEFINITION, 'Definition'), (REFERENCE, 'Reference')]
+
+    repository = models.ForeignKey(Repository, on_delete=models.CASCADE, related_name='symbols')
+    file = models.ForeignKey(File, on_delete=models.CASCADE, related_name='symbols')
+    name = models.CharField(max_length=255)
+    # function, method, class, variable, interface, type, enum or struct; blank for references
+    kind = models.CharField(max_length=20, blank=True)
+    role = models.CharField(max_length=20, choices=ROLE_CHOICES)
+    # Enclosing class or function of a definition
+    container = models.CharField(max_length=255, blank=True)
+    line = models.PositiveIntegerField()
+    column = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [models.Index(fields=['repository', 'name', 'role'])]
+
+    def __str__(self):
+        return f"{self.name} ({self.role}) at {self.file_id}:{self.line}"
+
+
+class FileImport(models.Model):
+    """
+    An import edge from a file
+
+    `target` is the normalized key the import resolves to: a dotted module
+    path for Python and Java, a repository path without extension for
+    relative JS/TS imports, or the header path for C includes.
+    """
+    repository = models.ForeignKey(Repository, on_delete=models.CASCADE, related_name='imports')
+    file = models.ForeignKey(File, on_delete=models.CASCADE, related_name='imports')
+    module = models.CharField(max_length=500)
+    target = models.CharField(max_length=500)
+    line = models.PositiveIntegerField()
+
+    class Meta:
+        indexes = [models.Index(fields=['repository', 'target'])]
+
+    def __str__(self):
+        return f"{self.file_id} imports {self.module}"
+
+
+class ImportJob(models.Model):
+    """
+    An archive import into a repository and its progress
+
+    Kept in the database so every worker process sees the same jobs; the
+    partial unique constraint allows one queued or running import per repository.
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    COMMITTING = 'committing'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATE_CHOICES = [
+        (QUEUED, 'Queued'), (RUNNING, 'Running'), (COMMITTING, 'Committing'), (DONE, 'Done'), (FAILED, 'Failed')
+    ]
+    ACTIVE_STATES = (QUEUED, RUNNING, COMMITTING)
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    repository = models.ForeignKey(Repository, on_delete=models.CASCADE, related_name='import_jobs')
+    state = models.CharField(max_length=20, choices=STATE_CHOICES, default=QUEUED)
+    archive_type = models.CharField(max_length=10)
+    total = models.PositiveIntegerField(blank=True, null=True)
+    processed = models.PositiveIntegerField(default=0)
+    created = models.PositiveIntegerField(default=0)
+    updated = models.PositiveIntegerField(default=0)
+    skipped = models.JSONField(default=list, blank=True)
+    commit = models.CharField(max_length=40, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['repository'],
+                condition=models.Q(state__in=['queued', 'running', 'committing']),
+                name='filesys_one_active_import_per_repository'
+            )
+        ]
+
+    def __str__(self):
+        return f"Import {self.id.hex} into {self.repository_id} ({self.state})"
+
+    def as_progress(self):
+        """The job as the import status endpoint reports it"""
+        return {
+            'job': self.id.hex,
+            'repository': self.repository.slug,
+            'type': self.archive_type,
+            'state': self.state,
+            'total': self.total,
+            'processed': self.processed,
+            'created': self.created,
+            'updated': self.updated,
+            'skipped': self.skipped,
+            'commit': self.commit or None,
+            'error': self.error or None,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+        }
@@ -0,0 +1,17 @@
+from django.conf import settings
+from rest_framework.pagination import CursorPagination
+
+
+class RepositoryCursorPagination(CursorPagination):
+    """
+    Newest-first cursor pagination for repository listings
+
+    Pages are keyed on (created_at, id), so each page is an index range scan
+    no matter how deep the client pages, and new signups do not shift pages.
+    """
+    ordering = ('-created_at', '-id')
+    page_size_query_param = 'page_size'
+
+    def __init__(self):
+        self.page_size = getattr(settings, 'FILESYS_REPOSITORY_PAGE_SIZE', 50)
+        self.max_page_size = getattr(settings, 'FILESYS_REPOSITORY_MAX_PAGE_SIZE', 200)
@@ -1,12 +1,17 @@
 from rest_framework import permissions
 
+from .access import get_role
+from .models import RepositoryAccess
+
 class IsOwnerOrCollaborator(permissions.BasePermission):
     def has_object_permission(self, request, view, obj):
+        # Roles come from the request's cached access map, so this never queries per object
+        repository_id = obj.repository_id if hasattr(obj, 'repository_id') else obj.pk
+        role = get_role(request, repository_id)
+
         # For read operations, check if user is owner or collaborator
         if request.method in permissions.SAFE_METHODS:
-            return obj.user_has_access(request.user)
+            return role is not None
 
         # For write operations, check if user is owner
-        if hasattr(obj, 'repository'):  # File object
-            return obj.repository.user == request.user
-        return obj.user == request.user  # Repository object
\ No newline at end of file
+        return role == RepositoryAccess.OWNER
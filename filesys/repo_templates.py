@@ -0,0 +1,232 @@
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+import zlib
+
+import git
+from django.conf import settings
+
+from .atomic import atomic_write
+
+logger = logging.getLogger(__name__)
+
+_IDE_AND_OS_IGNORES = """
+# IDE
+.vscode/
+.idea/
+*.swp
+*.swo
+
+# OS
+.DS_Store
+Thumbs.db
+"""
+
+# Files every new repository of a template starts with
+TEMPLATES = {
+    'python': {
+        '.gitignore': """# Python
+__pycache__/
+*.py[cod]
+*.so
+.env
+.venv/
+venv/
+ENV/
+""" + _IDE_AND_OS_IGNORES,
+    },
+    'node': {
+        '.gitignore': """# Node
+node_modules/
+npm-debug.log*
+yarn-debug.log*
+yarn-error.log*
+dist/
+build/
+coverage/
+.env
+""" + _IDE_AND_OS_IGNORES,
+    },
+    'empty': {},
+}
+DEFAULT_TEMPLATE = 'python'
+
+# Written fresh for each repository instead of being shared with the skeleton
+_SKIP_GIT_ENTRIES = {'hooks', 'logs', 'index.lock'}
+
+_build_lock = threading.Lock()
+_skeletons = {}
+
+
+class TemplateError(Exception):
+    """Raised when a repository cannot be created from a template"""
+
+
+def template_root():
+    """Where skeletons are built; inside c3 so they can be hardlinked into new repositories"""
+    return getattr(settings, 'FILESYS_TEMPLATE_DIR', None) or os.path.join(settings.BASE_DIR, 'c3', '~templates')
+
+
+def _template_key(name):
+    digest = hashlib.sha1()
+    for path, content in sorted(TEMPLATES[name].items()):
+        digest.update(f"{path}\0{content}\0".encode('utf-8'))
+    return f"{name}-{digest.hexdigest()[:12]}"
+
+
+def _build_skeleton(name, target):
+    """Initialise a repository with the template's files staged and its tree written, but no commit"""
+    staging = tempfile.mkdtemp(prefix=f".{name}-", dir=os.path.dirname(target))
+    try:
+        repo = git.Repo.init(staging)
+        for path, content in TEMPLATES[name].items():
+            file_path = os.path.join(staging, path)
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            with open(file_path, 'w') as f:
+                f.write(content)
+        if TEMPLATES[name]:
+            repo.index.add(list(TEMPLATES[name]))
+        tree = repo.index.write_tree()
+        with open(os.path.join(repo.git_dir, 'template-tree'), 'w') as f:
+            f.write(tree.hexsha)
+        repo.close()
+        try:
+            os.replace(staging, target)
+        except OSError:
+            # Another process built the same skeleton first
+            if not os.path.isdir(target):
+                raise
+            shutil.rmtree(staging, ignore_errors=True)
+    except Exception:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+
+def get_skeleton(name):
+    """Path of the prebuilt skeleton for a template, building it on first use"""
+    if name not in TEMPLATES:
+        raise TemplateError(f"Unknown repository template: {name}")
+    key = _template_key(name)
+    path = _skeletons.get(key)
+    if path is not None and os.path.isdir(path):
+        return path
+    with _build_lock:
+        path = os.path.join(template_root(), key)
+        if not os.path.isdir(path):
+            os.makedirs(template_root(), exist_ok=True)
+            _build_skeleton(name, path)
+            logger.info(f"Built repository template skeleton {key}")
+        _skeletons[key] = path
+        return path
+
+
+def link_or_copy(src, dst):
+    """Hardlink `src` to `dst`, copying instead across filesystems or where links are unsupported"""
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+def _copy_skeleton(skeleton, repo_dir):
+    """
+    Copy a skeleton into place
+
+    Object files are immutable, so they are hardlinked; everything git or the
+    editor rewrites in place (HEAD, config, index, working tree files) is copied.
+    """
+    for root, dirs, filenames in os.walk(skeleton):
+        rel_root = os.path.relpath(root, skeleton)
+        if rel_root == '.git':
+            dirs[:] = [d for d in dirs if d not in _SKIP_GIT_ENTRIES]
+        dest_root = os.path.join(repo_dir, rel_root) if rel_root != '.' else repo_dir
+        os.makedirs(dest_root, exist_ok=True)
+        in_objects = rel_root == os.path.join('.git', 'objects') or rel_root.startswith(os.path.join('.git', 'objects') + os.sep)
+        for filename in filenames:
+            if rel_root == '.git' and filename in _SKIP_GIT_ENTRIES:
+                continue
+            src = os.path.join(root, filename)
+            dst = os.path.join(dest_root, filename)
+            if in_objects:
+                link_or_copy(src, dst)
+            else:
+                shutil.copy2(src, dst)
+
+
+def git_ident(value):
+    # git strips these from identities
+    return ''.join(ch for ch in value if ch not in '<>\n').strip()
+
+
+def _write_loose_object(git_dir, obj_type, body):
+    """Store an object the way `git hash-object -w` does and return its hexsha"""
+    data = f"{obj_type} {len(body)}\0".encode('ascii') + body
+    hexsha = hashlib.sha1(data).hexdigest()
+    obj_dir = os.path.join(git_dir, 'objects', hexsha[:2])
+    obj_path = os.path.join(obj_dir, hexsha[2:])
+    if not os.path.exists(obj_path):
+        atomic_write(obj_path, zlib.compress(data))
+        os.chmod(obj_path, 0o444)
+    return hexsha
+
+
+def _initial_commit(git_dir, tree_sha, name, email, message):
+    """Write a root commit for `tree_sha`, point HEAD's branch at it and log it in the reflogs"""
+    offset = time.localtime().tm_gmtoff
+    sign = '+' if offset >= 0 else '-'
+    stamp = f"{int(time.time())} {sign}{abs(offset) // 3600:02d}{abs(offset) % 3600 // 60:02d}"
+    ident = f"{name} <{email}> {stamp}"
+    body = f"tree {tree_sha}\nauthor {ident}\ncommitter {ident}\n\n{message}\n".encode('utf-8')
+    commit_sha = _write_loose_object(git_dir, 'commit', body)
+
+    with open(os.path.join(git_dir, 'HEAD'), 'r') as f:
+        head = f.read().strip()
+    branch_ref = head[len('ref: '):] if head.startswith('ref: ') else 'refs/heads/master'
+    ref_path = os.path.join(git_dir, *branch_ref.split('/'))
+    atomic_write(ref_path, f"{commit_sha}\n")
+
+    entry = f"{'0' * 40} {commit_sha} {ident}\tcommit (initial): {message}\n"
+    for log in ('HEAD', branch_ref):
+        log_path = os.path.join(git_dir, 'logs', *log.split('/'))
+        os.makedirs(os.path.dirname(log_path), exist_ok=True)
+        with open(log_path, 'a') as f:
+            f.write(entry)
+    return commit_sha
+
+
+def create_from_template(repo_dir, user, template=None):
+    """
+    Create a git repository at `repo_dir` from a prebuilt template skeleton
+
+    The skeleton is copied (objects hardlinked), the user's identity is
+    written to .git/config, and the initial commit object, branch ref and
+    reflogs are written directly, so no git process is started per repository.
+
+    Returns:
+        str: hexsha of the initial commit
+    """
+    template = template or DEFAULT_TEMPLATE
+    skeleton = get_skeleton(template)
+
+    git_dir = os.path.join(repo_dir, '.git')
+    if os.path.exists(git_dir):
+        shutil.rmtree(git_dir)
+    os.makedirs(repo_dir, exist_ok=True)
+    _copy_skeleton(skeleton, repo_dir)
+
+    with open(os.path.join(git_dir, 'template-tree'), 'r') as f:
+        tree_sha = f.read().strip()
+    os.remove(os.path.join(git_dir, 'template-tree'))
+
+    name = git_ident(user.username)
+    email = git_ident(user.email or '')
+    # The config writer quotes and escapes values that contain " or a backslash
+    with git.Repo(repo_dir) as repo, repo.config_writer() as config:
+        config.set_value('user', 'name', name)
+        config.set_value('user', 'email', email)
+
+    return _initial_commit(git_dir, tree_sha, name, email, 'Initial commit')
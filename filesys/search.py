@@ -0,0 +1,440 @@
+import fnmatch
+import logging
+import re
+import time
+
+from django.conf import settings
+from django.db import DatabaseError, connection, connections
+from django.db.models import Q
+
+from .models import File
+
+logger = logging.getLogger(__name__)
+
+SEARCH_TABLE = 'filesys_search_index'
+
+# Trigram tokenizer: every 3-character window is a token, so MATCH with a
+# quoted phrase finds arbitrary substrings (case-insensitively) via the index
+_CREATE_TABLE = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5("
+    "path, content, repository_id UNINDEXED, blob_id UNINDEXED, tokenize='trigram')"
+)
+
+_fts_available = {}
+
+# Regex metacharacters that end a run of literal characters
+_REGEX_SPECIAL = set('.^$*+?{}[]()|\\')
+
+
+class InvalidQuery(ValueError):
+    """Raised for an empty query or a regular expression that does not compile or is too costly to run"""
+
+
+def create_search_table(using='default'):
+    """
+    Create the FTS5 trigram table if this database supports it; run after every migrate
+
+    Returns:
+        bool: whether the trigram index is available
+    """
+    conn = connections[using]
+    available = False
+    if conn.vendor == 'sqlite':
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(_CREATE_TABLE)
+            available = True
+        except DatabaseError as e:
+            logger.warning(f"FTS5 trigram index unavailable, code search will scan file contents: {str(e)}")
+    _fts_available[using] = available
+    return available
+
+
+def ensure_search_table():
+    """Whether the trigram index is available on the default database, creating it on first use"""
+    available = _fts_available.get(connection.alias)
+    if available is None:
+        available = create_search_table(connection.alias)
+    return available
+
+
+def _indexable_content(file_obj):
+    content = file_obj.get_content() or ''
+    if len(content) > getattr(settings, 'FILESYS_SEARCH_MAX_FILE_BYTES', 1024 * 1024):
+        # Oversized files stay findable by path only
+        return ''
+    return content
+
+
+def index_files(files):
+    """Add or refresh the index rows for saved File instances"""
+    files = [file_obj for file_obj in files if file_obj.pk]
+    if not files or not ensure_search_table():
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f"INSERT OR REPLACE INTO {SEARCH_TABLE}(rowid, path, content, repository_id, blob_id) "
+            "VALUES (%s, %s, %s, %s, %s)",
+            [
+                (file_obj.pk, file_obj.path, _indexable_content(file_obj), file_obj.repository_id, file_obj.blob_id or '')
+                for file_obj in files
+            ]
+        )
+
+
+def reindex_file(file_obj, created=False):
+    """Refresh one file's index row, skipping the write when its path and blob are unchanged"""
+    if not ensure_search_table():
+        return
+    if not file_obj.get_content():
+        # Empty files can never match a content search, and path-only searches read the File table
+        if not created:
+            unindex_files([file_obj.pk])
+        return
+    if not created and file_obj.blob_id:
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT path, blob_id FROM {SEARCH_TABLE} WHERE rowid = %s", [file_obj.pk])
+            row = cursor.fetchone()
+        if row == (file_obj.path, file_obj.blob_id):
+            return
+    index_files([file_obj])
+
+
+def unindex_files(file_ids):
+    if not file_ids or not ensure_search_table():
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(f"DELETE FROM {SEARCH_TABLE} WHERE rowid = %s", [(file_id,) for file_id in file_ids])
+
+
+def rebuild_index(repository):
+    """
+    Re-index every file of a repository from scratch
+
+    Returns:
+        int: number of files indexed
+    """
+    if not ensure_search_table():
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {SEARCH_TABLE} WHERE repository_id = %s", [repository.pk])
+    count = 0
+    files = File.objects.filter(repository=repository).select_related('blob')
+    batch = []
+    for file_obj in files.iterator(chunk_size=500):
+        batch.append(file_obj)
+        if len(batch) >= 500:
+            index_files(batch)
+            count += len(batch)
+            batch = []
+    index_files(batch)
+    return count + len(batch)
+
+
+def copy_index(source, target):
+    """
+    Copy a repository's index rows to another that has the same File paths, e.g. a fork
+
+    Rows are matched by path and copied inside the database, so no content
+    passes through Python.
+    """
+    if not ensure_search_table():
+        return
+    file_table = connection.ops.quote_name(File._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT OR REPLACE INTO {SEARCH_TABLE}(rowid, path, content, repository_id, blob_id) "
+            f"SELECT dst.id, s.path, s.content, dst.repository_id, s.blob_id "
+            f"FROM {file_table} src "
+            f"JOIN {SEARCH_TABLE} s ON s.rowid = src.id "
+            f"JOIN {file_table} dst ON dst.repository_id = %s AND dst.path = src.path "
+            f"WHERE src.repository_id = %s",
+            [target.pk, source.pk]
+        )
+
+
+def _skip_group(pattern, i):
+    """Index just past the group or character class opening at `i`"""
+    depth = 0
+    while i < len(pattern):
+        char = pattern[i]
+        if char == '\\':
+            i += 2
+            continue
+        if char == '[':
+            i += 1
+            if i < len(pattern) and pattern[i] == '^':
+                i += 1
+            if i < len(pattern) and pattern[i] == ']':
+                i += 1
+            while i < len(pattern) and pattern[i] != ']':
+                i += 2 if pattern[i] == '\\' else 1
+            if depth == 0:
+                return i + 1
+        elif char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+            if depth == 0:
+                return i + 1
+        i += 1
+    return i
+
+
+def required_literals(pattern):
+    """
+    Literal substrings every match of `pattern` must contain
+
+    Conservative: alternation disables extraction, groups and classes end a
+    run, and a character followed by an optional quantifier is dropped.
+    """
+    if '|' in pattern:
+        return []
+    runs = []
+    current = ''
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        if char == '\\':
+            escaped = pattern[i + 1:i + 2]
+            if escaped and not escaped.isalnum():
+                current += escaped
+            else:
+                runs.append(current)
+                current = ''
+            i += 2
+            continue
+        if char in '([':
+            runs.append(current)
+            current = ''
+            i = _skip_group(pattern, i)
+            continue
+        if char in '*?{':
+            # The preceding character may not appear at all
+            current = current[:-1]
+            runs.append(current)
+            current = ''
+            if char == '{':
+                i = pattern.find('}', i) + 1 or len(pattern)
+                continue
+        elif char in _REGEX_SPECIAL:
+            runs.append(current)
+            current = ''
+        else:
+            current += char
+        i += 1
+    runs.append(current)
+    return [run for run in runs if len(run) >= 3]
+
+
+_BOUNDED_REPEAT_RE = re.compile(r'\{\d*,?\d*\}')
+
+
+def _repeat_at(pattern, i, outer=False):
+    """Length of the quantifier at `i`, or 0; an outer `?` repeats nothing so it is not counted"""
+    char = pattern[i:i + 1]
+    if char in ('*', '+'):
+        return 1
+    if char == '?' and not outer:
+        return 1
+    if char == '{':
+        match = _BOUNDED_REPEAT_RE.match(pattern, i)
+        if match and match.group() != '{}':
+            return len(match.group())
+    return 0
+
+
+def has_nested_quantifier(pattern):
+    """
+    Whether a repeated group contains a quantifier of its own, e.g. (a+)+ or (\w*\s?)*
+
+    Python's re backtracks through every way of splitting the input between
+    the two quantifiers, so such patterns can take exponential time.
+    """
+    # One flag per open group: whether it contains a quantifier
+    stack = [False]
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        if char == '\\':
+            i += 2
+            continue
+        if char == '[':
+            i = _skip_group(pattern, i)
+            continue
+        if char == '(':
+            stack.append(False)
+            # (?:, (?P<name>, (?= ... : the ? is not a quantifier
+            i += 2 if pattern[i + 1:i + 2] == '?' else 1
+            continue
+        if char == ')' and len(stack) > 1:
+            inner = stack.pop()
+            if _repeat_at(pattern, i + 1, outer=True):
+                if inner:
+                    return True
+                stack[-1] = True
+            elif inner:
+                stack[-1] = True
+        elif _repeat_at(pattern, i):
+            stack[-1] = True
+        i += 1
+    return False
+
+
+def _phrase(literal):
+    return '"' + literal.replace('"', '""') + '"'
+
+
+def _candidates_fts(repository, literals, path_glob, limit):
+    sql = f"SELECT rowid, path, content FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s AND repository_id = %s"
+    params = [' AND '.join(f"content:{_phrase(literal)}" for literal in literals), repository.pk]
+    if path_glob:
+        sql += " AND path GLOB %s"
+        params.append(path_glob)
+    sql += " LIMIT %s"
+    params.append(limit)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+
+
+def _candidates_scan(repository, literals, path_glob, limit):
+    files = File.objects.filter(repository=repository).select_related('blob')
+    for literal in literals:
+        files = files.filter(Q(blob__content__icontains=literal) | Q(content__icontains=literal))
+    rows = []
+    for file_obj in files.iterator(chunk_size=500):
+        if path_glob and not fnmatch.fnmatchcase(file_obj.path, path_glob):
+            continue
+        rows.append((file_obj.pk, file_obj.path, _indexable_content(file_obj)))
+        if len(rows) >= limit:
+            break
+    return rows
+
+
+def _path_candidates(repository, literals, path_glob, limit):
+    """(id, path) of files whose path contains every literal, for path-only hits"""
+    files = File.objects.filter(repository=repository)
+    for literal in literals:
+        files = files.filter(path__icontains=literal)
+    rows = []
+    for file_id, path in files.values_list('pk', 'path').iterator(chunk_size=500):
+        if path_glob and not fnmatch.fnmatchcase(path, path_glob):
+            continue
+        rows.append((file_id, path))
+        if len(rows) >= limit:
+            break
+    return rows
+
+
+class SearchTimeout(Exception):
+    """Raised inside a search once FILESYS_SEARCH_TIMEOUT has passed"""
+
+
+def _file_matches(matcher, content, snippet_lines, deadline):
+    """(number of matching lines, snippets for the first few of them)"""
+    count = 0
+    snippets = []
+    for line_number, line in enumerate(content.splitlines(), start=1):
+        if time.monotonic() > deadline:
+            raise SearchTimeout()
+        spans = [match.span() for match in matcher.finditer(line) if match.end() > match.start()]
+        if not spans:
+            continue
+        count += 1
+        if len(snippets) < snippet_lines:
+            snippets.append({
+                'line': line_number,
+                'text': line[:500],
+                'ranges': [list(span) for span in spans if span[0] < 500]
+            })
+    return count, snippets
+
+
+def search_repository(repository, query, regex=False, path_glob=None, case_sensitive=False, offset=0, limit=20):
+    """
+    Search a repository's file contents
+
+    Candidates come from the trigram index (literal substrings of the query
+    are matched through FTS5), or from a scan of the stored contents when the
+    index is unavailable; each candidate is then verified line by line. Files
+    whose path matches are ranked first whether or not their content does.
+    Regexes with nested quantifiers are rejected, and verification stops
+    after FILESYS_SEARCH_TIMEOUT seconds with `truncated` and `timed_out` set.
+
+    Args:
+        query: Substring, or regular expression when `regex` is set; may be
+            empty when `path_glob` is given, to list matching paths
+        path_glob: Optional glob on the repository-relative path (`*` also matches `/`)
+
+    Returns:
+        dict: `results` ranked by matching line count, `total`, `next_offset`,
+        `truncated` when the candidate limit or the timeout was reached, and `timed_out`
+
+    Raises:
+        InvalidQuery: for an empty search, a regex that does not compile or
+            one with nested quantifiers
+    """
+    query = query or ''
+    path_glob = (path_glob or '').strip('/') or None
+    if not query and not path_glob:
+        raise InvalidQuery('A query or a path filter is required')
+
+    flags = 0 if case_sensitive else re.IGNORECASE
+    if regex and has_nested_quantifier(query):
+        raise InvalidQuery('Nested quantifiers such as (a+)+ are not supported')
+    try:
+        matcher = re.compile(query if regex else re.escape(query), flags) if query else None
+    except re.error as e:
+        raise InvalidQuery(f"Invalid regular expression: {str(e)}")
+    literals = required_literals(query) if regex else ([query] if len(query) >= 3 else [])
+
+    max_candidates = getattr(settings, 'FILESYS_SEARCH_MAX_CANDIDATES', 5000)
+    # Without a literal to match the index cannot narrow anything down, and the
+    # repository's files are found faster through the File table
+    fetch = _candidates_fts if literals and ensure_search_table() else _candidates_scan
+    candidates = fetch(repository, literals, path_glob, max_candidates + 1)
+    truncated = len(candidates) > max_candidates
+    candidates = candidates[:max_candidates]
+
+    if matcher is not None and literals:
+        # Content candidates all contain the literals; files matching by path alone are added
+        # here, so a path hit ranks the same whether or not the index narrowed the content
+        seen = {file_id for file_id, _, _ in candidates}
+        candidates += [
+            (file_id, path, None)
+            for file_id, path in _path_candidates(repository, literals, path_glob, max_candidates)
+            if file_id not in seen
+        ]
+
+    snippet_lines = getattr(settings, 'FILESYS_SEARCH_SNIPPET_LINES', 3)
+    deadline = time.monotonic() + getattr(settings, 'FILESYS_SEARCH_TIMEOUT', 5.0)
+    timed_out = False
+    results = []
+    for file_id, path, content in candidates:
+        if matcher is None:
+            results.append({'id': file_id, 'path': path, 'score': 0, 'matches': []})
+            continue
+        try:
+            count, snippets = _file_matches(matcher, content or '', snippet_lines, deadline)
+        except SearchTimeout:
+            timed_out = truncated = True
+            break
+        path_hit = bool(matcher.search(path))
+        if count or path_hit:
+            results.append({
+                'id': file_id,
+                'path': path,
+                'score': count + (10 if path_hit else 0),
+                'matches': snippets
+            })
+
+    results.sort(key=lambda result: (-result['score'], len(result['path']), result['path']))
+    page = results[offset:offset + limit]
+    return {
+        'total': len(results),
+        'results': page,
+        'next_offset': offset + limit if offset + limit < len(results) else None,
+        'truncated': truncated,
+        'timed_out': timed_out
+    }
@@ -1,14 +1,17 @@
 from rest_framework import serializers
 from .models import Repository, File
+from .repo_templates import TEMPLATES
 from django.conf import settings
 import os
 
 class RepositorySerializer(serializers.ModelSerializer):
     slug = serializers.CharField(read_only=True)
+    # Skeleton the repository is created from; only used on create
+    template = serializers.ChoiceField(choices=sorted(TEMPLATES), required=False, write_only=True)
     
     class Meta:
         model = Repository
-        fields = ['id', 'user', 'name', 'slug', 'description', 'location', 'created_at', 'updated_at']
+        fields = ['id', 'user', 'name', 'slug', 'description', 'location', 'created_at', 'updated_at', 'template']
         read_only_fields = ['id', 'user', 'slug', 'created_at', 'updated_at']
 
     def validate_name(self, value):
@@ -18,24 +21,26 @@ class RepositorySerializer(serializers.ModelSerializer):
         return value
 
     def create(self, validated_data):
+        validated_data.pop('template', None)
         validated_data['user'] = self.context['request'].user
         validated_data['location'] = os.path.join(settings.BASE_DIR, 'c3', validated_data['user'].username, validated_data['name'])
         return super().create(validated_data)
 
     def update(self, instance, validated_data):
+        validated_data.pop('template', None)
         if 'name' in validated_data:
             validated_data['location'] = os.path.join(settings.BASE_DIR, 'c3', instance.user.username, validated_data['name'])
         return super().update(instance, validated_data)
 
 class FileSerializer(serializers.ModelSerializer):
     language = serializers.CharField(read_only=True)
+    # Stored in a content-addressed Blob rather than on the File row; optional to allow partial updates
+    content = serializers.CharField(required=False, allow_blank=True, allow_null=True)
 
     class Meta:
         model = File
         fields = ['id', 'repository', 'path', 'content', 'language', 'created_at', 'updated_at']
         read_only_fields = ['id', 'repository', 'language', 'created_at', 'updated_at']
-        # Allow partial updates
-        extra_kwargs = {'content': {'required': False}}
 
     def validate_path(self, value):
         repository = self.context.get('repository')
@@ -47,8 +52,15 @@ class FileSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError("A file with this path already exists in the repository.")
         return value
 
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        data['content'] = instance.get_content()
+        return data
+
     def create(self, validated_data):
+        content = validated_data.pop('content', '')
         file_instance = super().create(validated_data)
+        file_instance.set_content(content)
         file_instance.language = file_instance.detect_language()
         file_instance.save()
         return file_instance
@@ -56,7 +68,34 @@ class FileSerializer(serializers.ModelSerializer):
     def update(self, instance, validated_data):
         # Update content and language if content changes
         if 'content' in validated_data:
-            instance.content = validated_data['content']
+            instance.set_content(validated_data['content'])
             instance.language = instance.detect_language()
         instance.save()
-        return instance
\ No newline at end of file
+        return instance
+
+class FileBatchOperationSerializer(serializers.Serializer):
+    op = serializers.ChoiceField(choices=['create', 'update', 'delete'])
+    path = serializers.CharField(max_length=500)
+    content = serializers.CharField(required=False, allow_blank=True, trim_whitespace=False)
+
+    def validate_path(self, value):
+        if any(char in value for char in ['..', '\\', ':']) or value.startswith('/'):
+            raise serializers.ValidationError("File path contains invalid characters.")
+        return value
+
+    def validate(self, attrs):
+        if attrs['op'] != 'delete' and 'content' not in attrs:
+            raise serializers.ValidationError({'content': f"Content is required for {attrs['op']}."})
+        return attrs
+
+
+class FileBatchSerializer(serializers.Serializer):
+    operations = FileBatchOperationSerializer(many=True, allow_empty=False)
+    message = serializers.CharField(required=False, max_length=1000)
+
+    def validate_operations(self, value):
+        paths = [operation['path'] for operation in value]
+        duplicates = sorted({path for path in paths if paths.count(path) > 1})
+        if duplicates:
+            raise serializers.ValidationError(f"Paths appear more than once: {', '.join(duplicates)}")
+        return value
@@ -0,0 +1,67 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from .access import grant, rebuild_access, revoke
+from .blobs import release_blob
+from .models import File, Repository, RepositoryAccess
+from .search import reindex_file, unindex_files
+from .symbols import schedule_symbol_index
+
+
+@receiver(post_delete, sender=File)
+def release_file_blob(sender, instance, **kwargs):
+    """Drop the deleted file's blob reference, including cascaded deletes"""
+    release_blob(instance.blob_id)
+
+
+@receiver(post_save, sender=File)
+def index_saved_file(sender, instance, created, update_fields=None, **kwargs):
+    """Keep the code search and symbol indexes in step with every File save"""
+    if update_fields is not None and not {'path', 'blob', 'content'} & set(update_fields):
+        return
+    reindex_file(instance, created=created)
+    schedule_symbol_index([instance])
+
+
+@receiver(post_delete, sender=File)
+def unindex_deleted_file(sender, instance, **kwargs):
+    unindex_files([instance.pk])
+
+
+@receiver(post_save, sender=Repository)
+def grant_owner_access(sender, instance, created, update_fields=None, **kwargs):
+    """Give a new repository's owner access, and move it when the owner changes"""
+    if created:
+        grant(instance, [instance.user_id], RepositoryAccess.OWNER)
+        return
+    if update_fields is not None and 'user' not in update_fields:
+        return
+    owner_rows = RepositoryAccess.objects.filter(
+        repository=instance, user_id=instance.user_id, role=RepositoryAccess.OWNER
+    )
+    if not owner_rows.exists():
+        # Invalidates both the previous and the new owner's cached maps
+        rebuild_access(Repository.all_objects.filter(pk=instance.pk))
+
+
+@receiver(m2m_changed, sender=Repository.collaborators.through)
+def sync_collaborator_access(sender, instance, action, reverse, pk_set, **kwargs):
+    """Mirror collaborator changes, from either side of the relation, into RepositoryAccess"""
+    if action == 'pre_clear':
+        related = instance.collaborative_repositories if reverse else instance.collaborators
+        instance._cleared_collaborator_pks = set(related.values_list('pk', flat=True))
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if action == 'post_clear':
+        pk_set = getattr(instance, '_cleared_collaborator_pks', set())
+
+    if reverse:
+        pairs = [(repository, [instance.pk]) for repository in Repository.all_objects.filter(pk__in=pk_set)]
+    else:
+        pairs = [(instance, list(pk_set))]
+    for repository, user_ids in pairs:
+        if action == 'post_add':
+            grant(repository, user_ids, RepositoryAccess.COLLABORATOR)
+        else:
+            revoke(repository, user_ids)
@@ -0,0 +1,52 @@
+import logging
+import os
+import sys
+import threading
+
+from django.conf import settings
+from django.db import DatabaseError, connections
+
+logger = logging.getLogger(__name__)
+
+# manage.py commands that serve requests; every other command (migrate, test,
+# shell, ...) runs without the background workers
+_SERVING_COMMANDS = {'runserver', 'runworker'}
+
+
+def serving_process():
+    """True when this process serves requests and should run the background workers"""
+    if not getattr(settings, 'BACKGROUND_WORKERS_ON_STARTUP', True):
+        return False
+    if os.path.basename(sys.argv[0]) in ('manage.py', 'django-admin'):
+        if len(sys.argv) < 2 or sys.argv[1] not in _SERVING_COMMANDS:
+            return False
+        # The autoreloader's parent process only watches files; its child serves
+        if sys.argv[1] == 'runserver' and '--noreload' not in sys.argv and os.environ.get('RUN_MAIN') != 'true':
+            return False
+    return True
+
+
+def run_at_startup(name, func):
+    """
+    Call `func` on a daemon thread shortly after startup, if this process serves requests
+
+    The delay keeps the database out of app initialization. A database that
+    is not migrated yet is logged and skipped rather than failing the server.
+    """
+    if not serving_process():
+        return
+
+    def run():
+        try:
+            func()
+        except DatabaseError as e:
+            logger.warning(f"Startup task {name} skipped: {str(e)}")
+        except Exception as e:
+            logger.error(f"Startup task {name} failed: {str(e)}")
+        finally:
+            connections.close_all()
+
+    timer = threading.Timer(getattr(settings, 'BACKGROUND_STARTUP_DELAY', 1.0), run)
+    timer.name = f'startup-{name}'
+    timer.daemon = True
+    timer.start()
@@ -0,0 +1,544 @@
+import ast
+import bisect
+import logging
+import posixpath
+import re
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection, connections, transaction
+from django.db.models import F, Value
+from django.db.models.functions import Coalesce
+
+from .models import File, FileImport, Symbol
+
+logger = logging.getLogger(__name__)
+
+
+class Extraction:
+    """Definitions, references and imports found in one file"""
+
+    def __init__(self):
+        # (name, kind, container, line, column)
+        self.definitions = []
+        # (name, line, column)
+        self.references = []
+        # (module as written, target key, line)
+        self.imports = []
+
+    def reference(self, name, line, column):
+        self.references.append((name, line, column))
+
+
+# --- Python ---------------------------------------------------------------
+
+class _PythonVisitor(ast.NodeVisitor):
+    def __init__(self, path, extraction):
+        self.extraction = extraction
+        self.package = _python_package(path)
+        # (name, is_class) for every enclosing class and function
+        self.scope = []
+
+    def _container(self):
+        return '.'.join(name for name, _ in self.scope)
+
+    def _define(self, node, name, kind):
+        self.extraction.definitions.append((name, kind, self._container(), node.lineno, node.col_offset))
+
+    def visit_ClassDef(self, node):
+        self._define(node, node.name, 'class')
+        self.scope.append((node.name, True))
+        self.generic_visit(node)
+        self.scope.pop()
+
+    def visit_FunctionDef(self, node):
+        in_class = bool(self.scope) and self.scope[-1][1]
+        self._define(node, node.name, 'method' if in_class else 'function')
+        self.scope.append((node.name, False))
+        self.generic_visit(node)
+        self.scope.pop()
+
+    visit_AsyncFunctionDef = visit_FunctionDef
+
+    def _assign_targets(self, node, targets):
+        # Only module and class level names are worth indexing as definitions
+        if not self.scope or self.scope[-1][1]:
+            for target in targets:
+                for item in ast.walk(target):
+                    if isinstance(item, ast.Name):
+                        self._define(item, item.id, 'variable')
+        self.generic_visit(node)
+
+    def visit_Assign(self, node):
+        self._assign_targets(node, node.targets)
+
+    def visit_AnnAssign(self, node):
+        self._assign_targets(node, [node.target])
+
+    def visit_Name(self, node):
+        if isinstance(node.ctx, ast.Load):
+            self.extraction.reference(node.id, node.lineno, node.col_offset)
+
+    def visit_Attribute(self, node):
+        if isinstance(node.ctx, ast.Load) and node.end_col_offset is not None:
+            self.extraction.reference(node.attr, node.end_lineno, node.end_col_offset - len(node.attr))
+        self.generic_visit(node)
+
+    def visit_Import(self, node):
+        for alias in node.names:
+            self.extraction.imports.append((alias.name, alias.name, node.lineno))
+
+    def visit_ImportFrom(self, node):
+        if node.level:
+            base = self.package[:len(self.package) - (node.level - 1)] if node.level - 1 <= len(self.package) else []
+            module = '.'.join(base + (node.module.split('.') if node.module else []))
+            written = '.' * node.level + (node.module or '')
+        else:
+            module = written = node.module or ''
+        if module:
+            self.extraction.imports.append((written, module, node.lineno))
+        for alias in node.names:
+            if alias.name != '*':
+                name = f"{module}.{alias.name}" if module else alias.name
+                self.extraction.imports.append((written, name, node.lineno))
+
+
+def _python_package(path):
+    """Dotted package parts of the package a Python file belongs to"""
+    return [part for part in posixpath.dirname(path).split('/') if part]
+
+
+def extract_python(path, content):
+    extraction = Extraction()
+    try:
+        tree = ast.parse(content)
+    except (SyntaxError, ValueError):
+        # Half-typed code is the normal state of an editor buffer; keep the file unindexed
+        return extraction
+    _PythonVisitor(path, extraction).visit(tree)
+    return extraction
+
+
+# --- JS/TS and C-style languages ------------------------------------------
+
+# Comments and string literals, so definitions inside them are not indexed
+_LEXEMES_RE = re.compile(
+    r"//[^\n]*|/\*.*?\*/|\"(?:\\.|[^\"\\\n])*\"|'(?:\\.|[^'\\\n])*'|`(?:\\.|[^`\\])*`",
+    re.S
+)
+_IDENTIFIER_RE = re.compile(r'[A-Za-z_$][\w$]*')
+
+_KEYWORDS = frozenset('''
+    abstract as async await auto bool boolean break byte case catch char class const constexpr continue
+    debugger default delete do double else enum export extends extern false final finally float for from
+    function goto if implements import in inline instanceof int interface let long namespace new
+    noexcept null nullptr operator override package private protected public readonly register return
+    short signed sizeof static struct super switch synchronized template this throw throws true try type
+    typedef typeof typename undefined union unsigned using var virtual void volatile while with yield
+'''.split())
+
+_JS_DEFINITIONS = [
+    (re.compile(r'\bfunction\s*\*?\s*([A-Za-z_$][\w$]*)'), 'function'),
+    (re.compile(r'\bclass\s+([A-Za-z_$][\w$]*)'), 'class'),
+    (re.compile(r'\binterface\s+([A-Za-z_$][\w$]*)'), 'interface'),
+    (re.compile(r'\btype\s+([A-Za-z_$][\w$]*)\s*(?:<[^>]*>)?\s*='), 'type'),
+    (re.compile(r'\benum\s+([A-Za-z_$][\w$]*)'), 'enum'),
+    (re.compile(
+        r'\b(?:const|let|var)\s+([A-Za-z_$][\w$]*)\s*(?::[^=;]+)?=\s*(?:async\s+)?'
+        r'(?:function\b|\([^()]*\)\s*(?::[^=;{]+)?=>|[A-Za-z_$][\w$]*\s*=>)'
+    ), 'function'),
+    (re.compile(r'\b(?:const|let|var)\s+([A-Za-z_$][\w$]*)'), 'variable'),
+]
+_JS_METHOD_RE = re.compile(
+    r'^[ \t]*(?:(?:public|private|protected|static|async|readonly|get|set|override)\s+)*'
+    r'([A-Za-z_$][\w$]*)\s*\([^()]*\)\s*(?::\s*[^{;]+)?\{',
+    re.M
+)
+_JS_IMPORT_RES = [
+    re.compile(r"\bimport\s+(?:[^'\";]*?\s+from\s+)?['\"]([^'\"]+)['\"]"),
+    re.compile(r"\bexport\s+[^'\";]*?\s+from\s+['\"]([^'\"]+)['\"]"),
+    re.compile(r"\b(?:require|import)\s*\(\s*['\"]([^'\"]+)['\"]\s*\)"),
+]
+_JS_EXTENSIONS = ('.js', '.jsx', '.ts', '.tsx', '.mjs', '.cjs')
+
+_C_TYPE_RE = re.compile(r'\b(class|struct|union|enum|interface)\s+([A-Za-z_]\w*)[^;{}()=]*\{')
+# Type tokens and the separators between them share no characters, so a line that
+# is not a definition fails in linear time instead of backtracking over every split
+_C_FUNCTION_RE = re.compile(
+    r'^[ \t]*(?:[\w:<>,\[\]]+[ \t*&]+)+([A-Za-z_~][\w:~]*)\s*\([^;{}()]*(?:\([^()]*\)[^;{}()]*)*\)'
+    r'\s*(?:const\s*)?(?:noexcept\s*)?(?:throws\s+[\w.,\s]+)?\{',
+    re.M
+)
+_C_INCLUDE_RE = re.compile(r'^[ \t]*#[ \t]*include[ \t]*[<"]([^>"]+)[>"]', re.M)
+_JAVA_IMPORT_RE = re.compile(r'^[ \t]*import\s+(?:static\s+)?([\w.]+?)(?:\.\*)?\s*;', re.M)
+_CSHARP_USING_RE = re.compile(r'^[ \t]*using\s+(?:static\s+)?([\w.]+)\s*;', re.M)
+
+
+def _blank(match):
+    return re.sub(r'[^\n]', ' ', match.group())
+
+
+def _mask(content):
+    """(content with comments blanked, content with comments and string literals blanked)"""
+    without_comments = _LEXEMES_RE.sub(
+        lambda match: _blank(match) if match.group().startswith('/') else match.group(), content
+    )
+    return without_comments, _LEXEMES_RE.sub(_blank, content)
+
+
+def _block_end(text, start):
+    """Offset just past the brace block opening at or after `start`"""
+    depth = 0
+    start = text.find('{', start)
+    if start < 0:
+        return len(text)
+    for offset in range(start, len(text)):
+        if text[offset] == '{':
+            depth += 1
+        elif text[offset] == '}':
+            depth -= 1
+            if depth == 0:
+                return offset + 1
+    return len(text)
+
+
+class _Positions:
+    def __init__(self, text):
+        self.line_starts = [0] + [match.end() for match in re.finditer('\n', text)]
+
+    def __call__(self, offset):
+        line = bisect.bisect_right(self.line_starts, offset)
+        return line, offset - self.line_starts[line - 1]
+
+
+def _relative_target(path, spec, strip_extensions=()):
+    target = posixpath.normpath(posixpath.join(posixpath.dirname(path), spec)).lstrip('/')
+    for extension in strip_extensions:
+        if target.endswith(extension):
+            return target[:-len(extension)]
+    return target
+
+
+def extract_clike(path, content, language):
+    extraction = Extraction()
+    source, code = _mask(content)
+    position = _Positions(content)
+    is_js = language in ('javascript', 'typescript')
+
+    defined_at = set()
+    classes = []
+
+    def define(offset, name, kind, container=''):
+        if offset in defined_at or name in _KEYWORDS:
+            return
+        defined_at.add(offset)
+        line, column = position(offset)
+        extraction.definitions.append((name, kind, container, line, column))
+
+    if is_js:
+        for regex, kind in _JS_DEFINITIONS:
+            for match in regex.finditer(code):
+                define(match.start(1), match.group(1), kind)
+                if kind == 'class':
+                    classes.append((match.end(), _block_end(code, match.end()), match.group(1)))
+    else:
+        for match in _C_TYPE_RE.finditer(code):
+            kind = {'union': 'struct'}.get(match.group(1), match.group(1))
+            define(match.start(2), match.group(2), kind)
+            if kind in ('class', 'struct', 'interface'):
+                classes.append((match.end() - 1, _block_end(code, match.end() - 1), match.group(2)))
+
+    def enclosing_class(offset):
+        inside = [(start, name) for start, end, name in classes if start <= offset < end]
+        return max(inside)[1] if inside else None
+
+    method_re = _JS_METHOD_RE if is_js else _C_FUNCTION_RE
+    for match in method_re.finditer(code):
+        name = match.group(1)
+        container = enclosing_class(match.start(1))
+        if '::' in name:
+            container, _, name = name.rpartition('::')
+        if is_js and container is None:
+            # Outside a class body this pattern is as likely a call followed by a block
+            continue
+        offset = match.end(1) - len(name)
+        define(offset, name, 'method' if container else 'function', container or '')
+
+    for match in _IDENTIFIER_RE.finditer(code):
+        name = match.group()
+        if name in _KEYWORDS or match.start() in defined_at:
+            continue
+        if match.start() and code[match.start() - 1].isdigit():
+            continue
+        line, column = position(match.start())
+        extraction.reference(name, line, column)
+
+    if is_js:
+        for regex in _JS_IMPORT_RES:
+            for match in regex.finditer(source):
+                spec = match.group(1)
+                target = _relative_target(path, spec, _JS_EXTENSIONS) if spec.startswith('.') else spec
+                extraction.imports.append((spec, target, position(match.start(1))[0]))
+    elif language in ('c', 'cpp'):
+        for match in _C_INCLUDE_RE.finditer(source):
+            spec = match.group(1)
+            target = _relative_target(path, spec) if spec.startswith('.') else spec
+            extraction.imports.append((spec, target, position(match.start(1))[0]))
+    else:
+        regex = _JAVA_IMPORT_RE if language == 'java' else _CSHARP_USING_RE
+        for match in regex.finditer(source):
+            extraction.imports.append((match.group(1), match.group(1), position(match.start(1))[0]))
+    return extraction
+
+
+EXTRACTORS = {
+    'python': extract_python,
+    'javascript': lambda path, content: extract_clike(path, content, 'javascript'),
+    'typescript': lambda path, content: extract_clike(path, content, 'typescript'),
+    'c': lambda path, content: extract_clike(path, content, 'c'),
+    'cpp': lambda path, content: extract_clike(path, content, 'cpp'),
+    'java': lambda path, content: extract_clike(path, content, 'java'),
+    'csharp': lambda path, content: extract_clike(path, content, 'csharp'),
+}
+
+
+def import_targets(path, language):
+    """Every import target key that can refer to the file at `path`"""
+    stem, extension = posixpath.splitext(path)
+    parts = [part for part in stem.split('/') if part]
+    if language == 'python':
+        if parts and parts[-1] == '__init__':
+            parts = parts[:-1]
+        # Any directory may be a source root (e.g. src/), so every dotted suffix can name it
+        return {'.'.join(parts[i:]) for i in range(len(parts))}
+    if language in ('javascript', 'typescript'):
+        targets = {stem}
+        if parts and parts[-1] == 'index':
+            targets.add('/'.join(parts[:-1]))
+        return targets
+    if language in ('c', 'cpp'):
+        parts = path.split('/')
+        return {'/'.join(parts[i:]) for i in range(len(parts))}
+    if language == 'java':
+        return {'.'.join(parts[i:]) for i in range(len(parts))}
+    return {path}
+
+
+# --- Index maintenance ----------------------------------------------------
+
+def extract_file(file_obj):
+    """Extraction for a File's current content, empty for unsupported or oversized files"""
+    extractor = EXTRACTORS.get(file_obj.language_from_path())
+    content = file_obj.get_content() or ''
+    if extractor is None or not content:
+        return Extraction()
+    if len(content) > getattr(settings, 'FILESYS_SYMBOLS_MAX_FILE_BYTES', 512 * 1024):
+        return Extraction()
+    return extractor(file_obj.path, content)
+
+
+def _needs_index(file_obj, force):
+    return force or not file_obj.blob_id or file_obj.symbols_blob != file_obj.blob_id
+
+
+def _index_rows(file_obj, extraction):
+    """(Symbol rows, FileImport rows) for one file's extraction"""
+    # Each name is kept once per line; a line repeating a name adds nothing for lookups
+    references = {}
+    for name, line, column in extraction.references:
+        references.setdefault((name, line), column)
+    symbols = [
+        Symbol(
+            repository_id=file_obj.repository_id, file=file_obj, name=name[:255], kind=kind,
+            role=Symbol.DEFINITION, container=container[:255], line=line, column=column
+        )
+        for name, kind, container, line, column in extraction.definitions
+    ] + [
+        Symbol(
+            repository_id=file_obj.repository_id, file=file_obj, name=name[:255],
+            role=Symbol.REFERENCE, line=line, column=column
+        )
+        for (name, line), column in references.items()
+    ]
+    imports = [
+        FileImport(
+            repository_id=file_obj.repository_id, file=file_obj, module=module[:500],
+            target=target[:500], line=line
+        )
+        for module, target, line in extraction.imports
+    ]
+    return symbols, imports
+
+
+def _symbol_key(symbol):
+    return (symbol.file_id, symbol.name, symbol.kind, symbol.role, symbol.container, symbol.line, symbol.column)
+
+
+def _import_key(file_import):
+    return (file_import.file_id, file_import.module, file_import.target, file_import.line)
+
+
+def _sync_rows(model, fields, key, file_ids, rows):
+    """
+    Make `model`'s rows for file_ids equal to `rows`, touching only the ones that differ
+
+    An autosave usually changes a line or two, so deleting and reinserting
+    every identifier of the file would rewrite far more than changed.
+    """
+    wanted = Counter(key(row) for row in rows)
+    stale = []
+    for start in range(0, len(file_ids), 500):
+        existing = model.objects.filter(file_id__in=file_ids[start:start + 500]).values_list('pk', 'file_id', *fields)
+        for pk, *values in existing:
+            values = tuple(values)
+            if wanted[values] > 0:
+                wanted[values] -= 1
+            else:
+                stale.append(pk)
+    for start in range(0, len(stale), 500):
+        model.objects.filter(pk__in=stale[start:start + 500]).delete()
+    added = []
+    for row in rows:
+        row_key = key(row)
+        if wanted[row_key] > 0:
+            wanted[row_key] -= 1
+            added.append(row)
+    model.objects.bulk_create(added, batch_size=500)
+    return len(stale), len(added)
+
+
+def _replace_rows(extracted):
+    """Bring the rows for [(file, extraction)] up to date in one transaction"""
+    file_ids = [file_obj.pk for file_obj, _ in extracted]
+    symbols, imports = [], []
+    for file_obj, extraction in extracted:
+        file_symbols, file_imports = _index_rows(file_obj, extraction)
+        symbols += file_symbols
+        imports += file_imports
+    with transaction.atomic():
+        _sync_rows(Symbol, ('name', 'kind', 'role', 'container', 'line', 'column'), _symbol_key, file_ids, symbols)
+        _sync_rows(FileImport, ('module', 'target', 'line'), _import_key, file_ids, imports)
+        # Only record the blob where no newer write replaced it meanwhile
+        expected = {file_obj.pk: file_obj.blob_id for file_obj, _ in extracted}
+        for start in range(0, len(file_ids), 500):
+            current = File.objects.select_for_update().filter(pk__in=file_ids[start:start + 500])
+            unchanged = [pk for pk, blob_id in current.values_list('pk', 'blob_id') if expected[pk] == blob_id]
+            File.objects.filter(pk__in=unchanged).update(symbols_blob=Coalesce(F('blob_id'), Value('')))
+    for file_obj, _ in extracted:
+        file_obj.symbols_blob = file_obj.blob_id or ''
+
+
+def index_file_symbols(file_obj, force=False):
+    """
+    Update a file's symbols and import edges
+
+    Skipped when the file's blob is the one the index was built from.
+
+    Returns:
+        bool: whether the file was re-indexed
+    """
+    if not _needs_index(file_obj, force):
+        return False
+    _replace_rows([(file_obj, extract_file(file_obj))])
+    return True
+
+
+def index_symbols(files, force=False):
+    """
+    Re-index changed files, logging instead of raising so a bad file never fails a write
+
+    Files are parsed one by one and their rows written in one transaction per
+    FILESYS_SYMBOLS_BATCH_SIZE files, so a bulk import does not pay a commit per file.
+    """
+    batch_size = getattr(settings, 'FILESYS_SYMBOLS_BATCH_SIZE', 500)
+    indexed = 0
+    pending = []
+
+    def flush():
+        try:
+            _replace_rows(pending)
+            return len(pending)
+        except Exception as e:
+            logger.error(f"Symbol indexing failed for {len(pending)} file(s): {str(e)}")
+            return 0
+
+    for file_obj in files:
+        if not _needs_index(file_obj, force):
+            continue
+        try:
+            pending.append((file_obj, extract_file(file_obj)))
+        except Exception as e:
+            logger.error(f"Symbol indexing failed for {file_obj.path}: {str(e)}")
+        if len(pending) >= batch_size:
+            indexed += flush()
+            pending = []
+    if pending:
+        indexed += flush()
+    return indexed
+
+
+def _copy_rows(model, columns, source, target):
+    quote = connection.ops.quote_name
+    table = quote(model._meta.db_table)
+    file_table = quote(File._meta.db_table)
+    names = ', '.join(quote(column) for column in columns)
+    values = ', '.join(f"r.{quote(column)}" for column in columns)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {table} (repository_id, file_id, {names}) "
+            f"SELECT dst.repository_id, dst.id, {values} FROM {table} r "
+            f"JOIN {file_table} src ON src.id = r.file_id "
+            f"JOIN {file_table} dst ON dst.repository_id = %s AND dst.path = src.path "
+            f"WHERE r.repository_id = %s",
+            [target.pk, source.pk]
+        )
+
+
+def copy_symbols(source, target):
+    """
+    Copy a repository's symbols and import edges to another with the same File paths, e.g. a fork
+
+    The copy runs inside the database; target files should carry the source's
+    symbols_blob so they are not parsed again.
+    """
+    _copy_rows(Symbol, ['name', 'kind', 'role', 'container', 'line', 'column'], source, target)
+    _copy_rows(FileImport, ['module', 'target', 'line'], source, target)
+
+
+_executor = None
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        # One worker by default, so a file's index jobs run in the order they were scheduled
+        _executor = ThreadPoolExecutor(
+            max_workers=getattr(settings, 'FILESYS_SYMBOLS_WORKERS', 1),
+            thread_name_prefix='symbols'
+        )
+    return _executor
+
+
+def _index_in_background(files):
+    try:
+        index_symbols(files)
+    finally:
+        connections.close_all()
+
+
+def schedule_symbol_index(files):
+    """
+    Index files on the symbol worker pool once the current transaction commits
+
+    Parsing and row writes stay off the request thread. With
+    FILESYS_SYMBOLS_WORKERS = 0 the files are indexed on commit in the calling thread.
+    """
+    files = list(files)
+    if not files:
+        return
+    if getattr(settings, 'FILESYS_SYMBOLS_WORKERS', 1) > 0:
+        transaction.on_commit(lambda: _get_executor().submit(_index_in_background, files))
+    else:
+        transaction.on_commit(lambda: index_symbols(files))
+
@@ -1,3 +1,1558 @@
-from django.test import TestCase
+import asyncio
+import io
+import os
+import shutil
+import stat
+import subprocess
+import tarfile
+import tempfile
+import zipfile
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+import git
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import AsyncClient, SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from rest_framework import serializers
+from rest_framework.test import APIClient
+
+from . import atomic
+from .access import get_access_map
+from .archive import ARCHIVE_FORMATS, CHUNK_SIZE, stream_worktree_archive, worktree_files
+from .async_views import limiter
+from .atomic import TEMP_PREFIX, atomic_write
+from .batch import apply_file_batch
+from .blobs import collect_garbage, content_hash
+from .conditional import file_etag
+from .fork import ForkError, _copy_files, fork_repository
+from .git_log import InvalidRevision, _parse_log, read_log
+from .git_objects import diff_revisions
+from .git_pool import check_ignored, drop_ignored, pool
+from .importer import ArchiveImportError, ImportInProgress, _scan, clean_path, get_progress, run_import, start_import
+from .models import Blob, File, FileImport, ImportJob, Repository, RepositoryAccess, Symbol
+from .repo_templates import create_from_template
+from .search import SEARCH_TABLE, InvalidQuery, ensure_search_table, has_nested_quantifier, search_repository
+from .symbols import _import_key, _sync_rows, extract_clike, extract_python
+from .trash import TrashReaper, tombstone_repository
+
+
+@mock.patch('filesys.views.schedule_auto_commit')
+@mock.patch('filesys.views.enqueue_commit')
+class FileViewSetQueryCountTests(TestCase):
+    """
+    Query-count regression tests for the file endpoints
+
+    The repository is resolved once per request and shared by every viewset
+    hook, so these counts must not grow with extra repository lookups.
+    Git work is patched out; it happens outside the request anyway.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.location, ignore_errors=True)
+        self.user = get_user_model().objects.create_user('owner', 'owner@example.com', 'pw')
+        self.repository = Repository.objects.create(user=self.user, name='proj', location=self.location)
+        self.file = File(repository=self.repository, path='main.py')
+        self.file.set_content('print(1)\n')
+        self.file.language = 'python'
+        self.file.save()
+        with open(os.path.join(self.location, 'main.py'), 'w') as f:
+            f.write('print(1)\n')
+
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.base_url = f'/fs/{self.repository.slug}/files/'
+        self.detail_url = f'{self.base_url}{self.file.id}/'
+        # Warm the cached access map so the counts below cover only the endpoint itself
+        self.client.get(self.base_url)
+
+    def test_retrieve(self, *mocks):
+        # repository, file (+ blob)
+        with self.assertNumQueries(2):
+            response = self.client.get(self.detail_url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['content'], 'print(1)\n')
+
+    def test_list(self, *mocks):
+        # repository, files (+ blobs)
+        with self.assertNumQueries(2):
+            response = self.client.get(self.base_url)
+        self.assertEqual(response.status_code, 200)
+
+    def test_window(self, *mocks):
+        with self.assertNumQueries(2):
+            response = self.client.get(f'{self.detail_url}window/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_download(self, *mocks):
+        with self.assertNumQueries(2):
+            response = self.client.get(f'{self.detail_url}download/')
+        self.assertEqual(response.status_code, 200)
+        response.close()
+
+    def test_update(self, *mocks):
+        # repository, file, transaction savepoints (2), new blob (update, savepoints, insert),
+        # old blob release, file update, search index check and refresh
+        with self.assertNumQueries(12):
+            response = self.client.patch(self.detail_url, {'content': 'print(2)\n'}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+    def test_create(self, *mocks):
+        # repository, path uniqueness check, transaction savepoints (2), file insert,
+        # new blob (update, savepoints, insert), file update, search index check and insert
+        with self.assertNumQueries(12):
+            response = self.client.post(self.base_url, {'path': 'util.py', 'content': 'x = 1\n'}, format='json')
+        self.assertEqual(response.status_code, 201)
+
+    def test_destroy(self, *mocks):
+        # repository, file, symbol and import cascades, file delete, blob release, search index delete
+        with self.assertNumQueries(7):
+            response = self.client.delete(self.detail_url)
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(os.path.exists(os.path.join(self.location, 'main.py')))
+
+
+
+
+class FileRangeTests(TestCase):
+    """Line windows, byte ranges and the conditional headers that guard them"""
+
+    def setUp(self):
+        cache.clear()
+        self.location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.location, ignore_errors=True)
+        self.user = get_user_model().objects.create_user('owner', 'owner@example.com', 'pw')
+        self.repository = Repository.objects.create(user=self.user, name='proj', location=self.location)
+        self.body = ''.join(f'line {i}\n' for i in range(1, 101))
+        self.file = File(repository=self.repository, path='app.log')
+        self.file.set_content('')
+        self.file.save()
+        self.file_path = os.path.join(self.location, 'app.log')
+        with open(self.file_path, 'w') as f:
+            f.write(self.body)
+
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        base_url = f'/fs/{self.repository.slug}/files/{self.file.id}/'
+        self.window_url = f'{base_url}window/'
+        self.download_url = f'{base_url}download/'
+
+    def _body(self, response):
+        content = b''.join(response.streaming_content) if response.streaming else response.content
+        response.close()
+        return content
+
+    def test_line_window(self):
+        response = self.client.get(self.window_url, {'start_line': 3, 'end_line': 4})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['content'], 'line 3\nline 4\n')
+        self.assertEqual((data['start_line'], data['end_line'], data['total_lines']), (3, 4, 100))
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+
+    def test_byte_ranges(self):
+        for url in (self.window_url, self.download_url):
+            with self.subTest(url=url):
+                response = self.client.get(url, HTTP_RANGE='bytes=7-13')
+                self.assertEqual(response.status_code, 206)
+                self.assertEqual(response['Content-Range'], f'bytes 7-13/{len(self.body)}')
+                self.assertEqual(self._body(response), self.body.encode()[7:14])
+
+                response = self.client.get(url, HTTP_RANGE='bytes=-9')
+                self.assertEqual(response.status_code, 206)
+                self.assertEqual(self._body(response), self.body.encode()[-9:])
+
+    def test_unsatisfiable_range(self):
+        response = self.client.get(self.download_url, HTTP_RANGE=f'bytes={len(self.body)}-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f'bytes */{len(self.body)}')
+
+    def test_multiple_ranges_get_the_whole_file(self):
+        response = self.client.get(self.download_url, HTTP_RANGE='bytes=0-1,5-6')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self._body(response), self.body.encode())
+
+    def test_preconditions_come_before_the_range(self):
+        etag = self.client.get(self.download_url)['ETag']
+        response = self.client.get(self.download_url, HTTP_RANGE='bytes=0-3', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get(self.download_url, HTTP_RANGE='bytes=0-3', HTTP_IF_MATCH='"stale"')
+        self.assertEqual(response.status_code, 412)
+
+    def test_if_range(self):
+        first = self.client.get(self.download_url, HTTP_RANGE='bytes=0-6')
+        etag, last_modified = first['ETag'], first['Last-Modified']
+        self._body(first)
+        for validator in (etag, last_modified):
+            response = self.client.get(self.download_url, HTTP_RANGE='bytes=7-13', HTTP_IF_RANGE=validator)
+            self.assertEqual(response.status_code, 206, validator)
+            self._body(response)
+
+        # The file changes: a resumed download must not splice new bytes onto the old prefix
+        with open(self.file_path, 'a') as f:
+            f.write('line 101\n')
+        os.utime(self.file_path, (0, 0))
+        for validator in (etag, last_modified, f'W/{etag}'):
+            response = self.client.get(self.download_url, HTTP_RANGE='bytes=7-13', HTTP_IF_RANGE=validator)
+            self.assertEqual(response.status_code, 200, validator)
+            self.assertEqual(self._body(response), (self.body + 'line 101\n').encode())
+
+    def test_etag_follows_appends_without_reading_the_file(self):
+        etag, _ = file_etag(self.file, self.file_path)
+        with open(self.file_path, 'a') as f:
+            f.write('line 101\n')
+        with mock.patch('builtins.open', side_effect=AssertionError('file read')):
+            new_etag, _ = file_etag(self.file, self.file_path)
+            self.assertEqual(file_etag(self.file, self.file_path)[0], new_etag)
+        self.assertNotEqual(etag, new_etag)
+
+class ConditionalGetTests(TestCase):
+    """File, manifest and contents responses carry validators, and unchanged resources answer 304"""
+
+    def setUp(self):
+        cache.clear()
+        self.location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.location, ignore_errors=True)
+        self.user = get_user_model().objects.create_user('owner', 'owner@example.com', 'pw')
+        self.repository = Repository.objects.create(user=self.user, name='proj', location=self.location)
+        self.file = File(repository=self.repository, path='main.py')
+        self.file.set_content('print(1)\n')
+        self.file.save()
+        with open(os.path.join(self.location, 'main.py'), 'w') as f:
+            f.write('print(1)\n')
+
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.urls = [
+            f'/fs/{self.repository.slug}/files/{self.file.id}/',
+            f'/fs/{self.repository.slug}/manifest/',
+            f'/fs/{self.repository.slug}/contents/',
+        ]
+
+    def test_unchanged_resources_are_not_modified(self):
+        for url in self.urls:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertTrue(response['ETag'].startswith('"'))
+                self.assertIn('Last-Modified', response)
+
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response.content, b'')
+
+    def test_changes_on_disk_give_a_new_tag(self):
+        etags = [self.client.get(url)['ETag'] for url in self.urls]
+        with open(os.path.join(self.location, 'main.py'), 'w') as f:
+            f.write('print(22)\n')
+        for url, etag in zip(self.urls, etags):
+            with self.subTest(url=url):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 200)
+                self.assertNotEqual(response['ETag'], etag)
+
+    def test_new_untracked_file_changes_the_manifest_tag(self):
+        url = self.urls[1]
+        etag = self.client.get(url)['ETag']
+        with open(os.path.join(self.location, 'notes.txt'), 'w') as f:
+            f.write('todo\n')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('notes.txt', [entry['path'] for entry in response.json()['files']])
+
+
+@mock.patch('filesys.views.schedule_auto_commit')
+@mock.patch('filesys.views.enqueue_commit')
+class BinaryTransferTests(TestCase):
+    """Raw uploads and downloads stream bytes through unchanged, binary or not"""
+
+    def setUp(self):
+        cache.clear()
+        self.base_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.base_dir, ignore_errors=True)
+        self.location = os.path.join(self.base_dir, 'c3', 'owner', 'proj')
+        os.makedirs(self.location)
+        self.user = get_user_model().objects.create_user('owner', 'owner@example.com', 'pw')
+        self.repository = Repository.objects.create(user=self.user, name='proj', location=self.location)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.files_url = f'/fs/{self.repository.slug}/files/'
+        self.payload = bytes(range(256)) * 1024
+
+    def _upload(self, path, body):
+        return self.client.generic(
+            'PUT', f'{self.files_url}upload/?path={path}', body, content_type='application/octet-stream'
+        )
+
+    def test_upload_then_download_round_trip(self, enqueue, schedule):
+        response = self._upload('assets/logo.png', self.payload)
+        self.assertEqual(response.status_code, 201)
+        file_id = response.json()['id']
+        with open(os.path.join(self.location, 'assets', 'logo.png'), 'rb') as f:
+            self.assertEqual(f.read(), self.payload)
+        self.assertEqual(enqueue.call_args[0][1], ['assets/logo.png'])
+        # No temp file is left next to the target
+        self.assertEqual(os.listdir(os.path.join(self.location, 'assets')), ['logo.png'])
+
+        response = self.client.get(f'{self.files_url}{file_id}/download/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertIn('logo.png', response['Content-Disposition'])
+        self.assertEqual(b''.join(response.streaming_content), self.payload)
+        response.close()
+
+        # Uploading again replaces the file and keeps its row
+        response = self._upload('assets/logo.png', b'\x89PNG')
+        self.assertEqual((response.status_code, response.json()['id']), (200, file_id))
+        self.assertEqual(File.objects.filter(repository=self.repository).count(), 1)
+
+    def test_upload_rejects_paths_outside_the_repository(self, *mocks):
+        for path in ('../escape.bin', '/etc/passwd', '.git/config'):
+            with self.subTest(path=path):
+                self.assertEqual(self._upload(path, b'x').status_code, 400)
+
+    @override_settings(FILESYS_SENDFILE_HEADER='X-Accel-Redirect', FILESYS_SENDFILE_ROOT='/protected')
+    def test_download_through_sendfile(self, *mocks):
+        file_id = self._upload('data.bin', self.payload).json()['id']
+        with override_settings(BASE_DIR=self.base_dir):
+            response = self.client.get(f'{self.files_url}{file_id}/download/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['X-Accel-Redirect'], '/protected/owner/proj/data.bin')
+
+
+class RepositoryListingTests(TestCase):
+    """The repository listing pages by cursor, with per-user flags computed in the query"""
+
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user('owner', 'owner@example.com', 'pw')
+        self.other = User.objects.create_user('other', 'other@example.com', 'pw')
+        created_at = timezone.now() - timedelta(minutes=1)
+        self.slugs = []
+        # repo1 and repo2 share a timestamp, so the id has to break the tie
+        for i, seconds in enumerate((0, 1, 1, 2, 3)):
+            owner = self.user if i % 2 == 0 else self.other
+            repository = Repository.objects.create(user=owner, name=f'repo{i}', location=tempfile.gettempdir())
+            if i == 1:
+                repository.collaborators.add(self.user)
+            Repository.objects.filter(pk=repository.pk).update(created_at=created_at + timedelta(seconds=seconds))
+            self.slugs.append(repository.slug)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def _walk(self, url):
+        pages = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            pages.append(response.json()['repositories'])
+            url = response.json()['next']
+        return pages
+
+    def test_pages_cover_every_repository_once(self):
+        for page_size, sizes in ((2, [2, 2, 1]), (3, [3, 2])):
+            pages = self._walk(f'/fs/all/?page_size={page_size}')
+            self.assertEqual([len(page) for page in pages], sizes)
+            self.assertEqual([item['slug'] for page in pages for item in page], self.slugs[::-1])
+
+        flags = {item['slug']: (item['is_owner'], item['is_collaborator']) for page in pages for item in page}
+        self.assertEqual(flags['owner/repo0'], (True, False))
+        self.assertEqual(flags['other/repo1'], (False, True))
+        self.assertEqual(flags['other/repo3'], (False, False))
+
+    def test_new_repository_does_not_shift_later_pages(self):
+        first = self.client.get('/fs/all/?page_size=2').json()
+        Repository.objects.create(user=self.other, name='late', location=tempfile.gettempdir())
+        second = self.client.get(first['next']).json()
+        self.assertEqual([item['slug'] for item in second['repositories']], self.slugs[2:0:-1])
+
+    def test_query_count_and_collaborators(self):
+        # One query per page, flags included; collaborators add one prefetch
+        with self.assertNumQueries(1):
+            self.client.get('/fs/all/?page_size=2')
+        with self.assertNumQueries(2):
+            response = self.client.get('/fs/all/?page_size=5&fields=collaborators')
+        items = {item['slug']: item for item in response.json()['repositories']}
+        self.assertEqual(items['other/repo1']['collaborators'], [{'username': 'owner', 'id': self.user.pk}])
+        self.assertNotIn('collaborators', self.client.get('/fs/all/').json()['repositories'][0])
+
+
+class AsyncEndpointTests(TestCase):
+    """The async routes answer like the viewsets, and the per-repository limiter sheds load with a 503"""
+
+    def setUp(self):
+        cache.clear()
+        self.location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.location, ignore_errors=True)
+        User = get_user_model()
+        self.user = User.objects.create_user('owner', 'owner@example.com', 'pw')
+        self.collaborator = User.objects.create_user('collab', 'collab@example.com', 'pw')
+        self.repository = Repository.objects.create(user=self.user, name='proj', location=self.location)
+        self.repository.collaborators.add(self.collaborator)
+        self.file = File(repository=self.repository, path='main.py')
+        self.file.set_content('print(1)\n')
+        self.file.save()
+        with open(os.path.join(self.location, 'main.py'), 'w') as f:
+            f.write('print(1)\n')
+        with open(os.path.join(self.location, 'notes.txt'), 'w') as f:
+            f.write('todo\n')
+
+        self.sync_client = APIClient()
+        self.sync_client.force_authenticate(self.user)
+        self.async_base = f'/fs/async/{self.repository.slug}'
+        self.detail_url = f'{self.async_base}/files/{self.file.id}/'
+
+    async def _client(self, user):
+        client = AsyncClient()
+        await client.aforce_login(user)
+        return client
+
+    async def test_payloads_match_the_viewsets(self):
+        client = await self._client(self.user)
+        pairs = [
+            (self.detail_url, f'/fs/{self.repository.slug}/files/{self.file.id}/'),
+            (f'{self.async_base}/manifest/', f'/fs/{self.repository.slug}/manifest/'),
+            (f'{self.async_base}/contents/', f'/fs/{self.repository.slug}/contents/'),
+        ]
+        for async_url, sync_url in pairs:
+            response = await client.get(async_url)
+            self.assertEqual(response.status_code, 200, async_url)
+            expected = await sync_to_async(self.sync_client.get)(sync_url)
+            self.assertEqual(response.json(), expected.json())
+            self.assertEqual(response['ETag'], expected['ETag'])
+            response = await client.get(async_url, headers={'If-None-Match': response['ETag']})
+            self.assertEqual(response.status_code, 304)
+
+    async def test_update_is_owner_only(self):
+        client = await self._client(self.collaborator)
+        self.assertEqual((await client.get(self.detail_url)).status_code, 200)
+        response = await client.patch(self.detail_url, {'content': 'print(3)'}, content_type='application/json')
+        self.assertEqual(response.status_code, 403)
+
+        client = await self._client(self.user)
+        response = await client.patch(self.detail_url, {'content': 'print(2)'}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        with open(os.path.join(self.location, 'main.py')) as f:
+            self.assertEqual(f.read(), 'print(2)')
+        self.assertEqual((await client.get(self.detail_url)).json()['content'], 'print(2)')
+
+    async def test_anonymous_and_unknown(self):
+        self.assertEqual((await AsyncClient().get(self.detail_url)).status_code, 403)
+        client = await self._client(self.user)
+        self.assertEqual((await client.get(f'{self.async_base}/files/999999/')).status_code, 404)
+
+    @override_settings(FILESYS_ASYNC_REPOSITORY_CONCURRENCY=1, FILESYS_ASYNC_QUEUE_TIMEOUT=0.05)
+    async def test_limiter_returns_503_when_saturated(self):
+        client = await self._client(self.user)
+        async with limiter.slot(self.repository.pk):
+            response = await client.get(self.detail_url)
+            self.assertEqual(response.status_code, 503)
+            self.assertEqual(response['Retry-After'], '1')
+        self.assertEqual((await client.get(self.detail_url)).status_code, 200)
+        # Idle repositories hold no semaphore
+        self.assertEqual(limiter._slots, {})
+
+    @override_settings(FILESYS_ASYNC_REPOSITORY_CONCURRENCY=2, FILESYS_ASYNC_QUEUE_TIMEOUT=1.0)
+    async def test_limiter_bounds_concurrency(self):
+        running = peak = 0
+
+        async def work():
+            nonlocal running, peak
+            async with limiter.slot('repo'):
+                running += 1
+                peak = max(peak, running)
+                await asyncio.sleep(0.01)
+                running -= 1
+
+        await asyncio.gather(*(work() for _ in range(6)))
+        self.assertEqual(peak, 2)
+        self.assertEqual(limiter._slots, {})
+
+
+class BlobReferenceTests(TestCase):
+    """Every File holds exactly one reference on its blob, whichever path created, changed or copied it"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user('owner', 'owner@example.com', 'pw')
+        self.repository = Repository.objects.create(user=self.user, name='proj', location=tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.repository.location, ignore_errors=True)
+
+    def _file(self, path, content, repository=None):
+        file_obj = File(repository=repository or self.repository, path=path)
+        file_obj.set_content(content)
+        file_obj.save()
+        return file_obj
+
+    def _refs(self, content):
+        return Blob.objects.get(pk=content_hash(content)).ref_count
+
+    def test_identical_content_shares_one_blob(self):
+        self._file('a.py', 'x = 1\n')
+        self._file('b.py', 'x = 1\n')
+        self.assertEqual(Blob.objects.count(), 1)
+        self.assertEqual(self._refs('x = 1\n'), 2)
+
+    def test_update_moves_the_reference(self):
+        a = self._file('a.py', 'x = 1\n')
+        self._file('b.py', 'x = 1\n')
+        a.set_content('x = 2\n')
+        a.save()
+        self.assertEqual(self._refs('x = 1\n'), 1)
+        self.assertEqual(self._refs('x = 2\n'), 1)
+        # Saving the same content again takes no second reference
+        a.set_content('x = 2\n')
+        a.save()
+        self.assertEqual(self._refs('x = 2\n'), 1)
+
+    def test_delete_releases_and_garbage_collection_removes(self):
+        a = self._file('a.py', 'x = 1\n')
+        b = self._file('b.py', 'x = 1\n')
+        a.delete()
+        self.assertEqual(self._refs('x = 1\n'), 1)
+        self.assertEqual(collect_garbage(), 0)
+        b.delete()
+        self.assertEqual(self._refs('x = 1\n'), 0)
+        self.assertEqual(collect_garbage(), 1)
+        self.assertFalse(Blob.objects.exists())
+
+    def test_cascaded_delete_releases(self):
+        self._file('a.py', 'x = 1\n')
+        self._file('b.py', 'y = 2\n')
+        self.repository.delete()
+        self.assertEqual(set(Blob.objects.values_list('ref_count', flat=True)), {0})
+
+    def test_fork_copy_takes_one_reference_per_file(self):
+        self._file('a.py', 'x = 1\n')
+        self._file('b.py', 'x = 1\n')
+        self._file('c.py', 'y = 2\n')
+        fork = Repository.objects.create(user=self.user, name='fork', location=tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, fork.location, ignore_errors=True)
+
+        self.assertEqual(_copy_files(self.repository, fork), 3)
+        self.assertEqual(self._refs('x = 1\n'), 4)
+        self.assertEqual(self._refs('y = 2\n'), 2)
+        fork.delete()
+        self.assertEqual(self._refs('x = 1\n'), 2)
+        self.assertEqual(self._refs('y = 2\n'), 1)
+
+
+@mock.patch('filesys.batch.commit_now')
+class FileBatchTests(TestCase):
+    """A batch applies every operation, on disk and in the database, or none of them"""
+
+    def setUp(self):
+        self.location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.location, ignore_errors=True)
+        self.user = get_user_model().objects.create_user('owner', 'owner@example.com', 'pw')
+        self.repository = Repository.objects.create(user=self.user, name='proj', location=self.location)
+        for path, content in (('keep.py', 'old\n'), ('gone.py', 'bye\n')):
+            file_obj = File(repository=self.repository, path=path)
+            file_obj.set_content(content)
+            file_obj.save()
+            with open(os.path.join(self.location, path), 'w') as f:
+                f.write(content)
+
+    def _apply(self, operations):
+        return apply_file_batch(self.repository, operations, lambda path: os.path.join(self.location, path))
+
+    def _disk(self):
+        files = {}
+        for root, _, filenames in os.walk(self.location):
+            for filename in filenames:
+                with open(os.path.join(root, filename)) as f:
+                    files[os.path.relpath(os.path.join(root, filename), self.location)] = f.read()
+        return files
+
+    def _state(self):
+        return (
+            self._disk(),
+            {f.path: f.get_content() for f in File.objects.filter(repository=self.repository)},
+            dict(Blob.objects.values_list('pk', 'ref_count')),
+        )
+
+    def test_applies_everything_in_one_commit(self, commit_now):
+        result = self._apply([
+            {'op': 'create', 'path': 'pkg/new.py', 'content': 'new\n'},
+            {'op': 'update', 'path': 'keep.py', 'content': 'new\n'},
+            {'op': 'delete', 'path': 'gone.py'},
+        ])
+        disk, rows, blobs = self._state()
+        self.assertEqual(disk, {'keep.py': 'new\n', os.path.join('pkg', 'new.py'): 'new\n'})
+        self.assertEqual(rows, {'keep.py': 'new\n', 'pkg/new.py': 'new\n'})
+        self.assertEqual(blobs[content_hash('new\n')], 2)
+        self.assertEqual(blobs[content_hash('old\n')], 0)
+        self.assertEqual(result['deleted'], ['gone.py'])
+        commit_now.assert_called_once()
+        self.assertEqual(sorted(commit_now.call_args.kwargs['changed_paths']), ['keep.py', 'pkg/new.py'])
+        self.assertEqual(commit_now.call_args.kwargs['removed_paths'], ['gone.py'])
+
+    def test_invalid_operation_rejects_the_whole_batch(self, commit_now):
+        before = self._state()
+        with self.assertRaises(serializers.ValidationError) as raised:
+            self._apply([
+                {'op': 'create', 'path': 'fine.py', 'content': 'x\n'},
+                {'op': 'update', 'path': 'keep.py', 'content': 'new\n'},
+                {'op': 'create', 'path': 'gone.py', 'content': 'dup\n'},
+                {'op': 'delete', 'path': 'missing.py'},
+            ])
+        self.assertEqual(set(raised.exception.detail['errors']), {'gone.py', 'missing.py'})
+        self.assertEqual(self._state(), before)
+        commit_now.assert_not_called()
+
+    def test_database_failure_leaves_disk_untouched(self, commit_now):
+        before = self._state()
+        with mock.patch('filesys.batch.release_blobs', side_effect=RuntimeError('boom')):
+            with self.assertRaises(RuntimeError):
+                self._apply([
+                    {'op': 'create', 'path': 'fine.py', 'content': 'x\n'},
+                    {'op': 'update', 'path': 'keep.py', 'content': 'new\n'},
+                    {'op': 'delete', 'path': 'gone.py'},
+                ])
+        # No row, reference, working tree file or staged temp file survives the rollback
+        self.assertEqual(self._state(), before)
+        self.assertFalse([name for name in self._disk() if os.path.basename(name).startswith(TEMP_PREFIX)])
+        commit_now.assert_not_called()
+
+
+class GitLogTests(TestCase):
+    """`git log -z` output is split on NULs, so messages may contain anything but a NUL"""
+
+    def setUp(self):
+        cache.clear()
+        self.location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.location, ignore_errors=True)
+        self.addCleanup(pool.discard, self.location)
+        self.repo = git.Repo.init(self.location)
+        self.addCleanup(self.repo.close)
+        with self.repo.config_writer() as config:
+            config.set_value('user', 'name', 'owner')
+            config.set_value('user', 'email', 'owner@example.com')
+        for i in range(5):
+            self._commit('main.py', f'print({i})\n', f'Change {i}')
+
+    def _commit(self, path, content, message):
+        with open(os.path.join(self.location, path), 'w') as f:
+            f.write(content)
+        self.repo.index.add([path])
+        return self.repo.index.commit(message).hexsha
+
+    def test_parse_log_keeps_fields_apart(self):
+        fields = [
+            'a' * 40, f"{'b' * 40} {'c' * 40}", 'Some One', 'one@example.com', 'Mon Jan 1 00:00:00 2024 +0000',
+            'subject with "quotes", \\ and %x00', 'body line 1\n\nbody line 2\n',
+        ]
+        commits = _parse_log('\0'.join(fields) + '\0\n' + '\0'.join(['d' * 40, '', 'x', 'x@x', 'date', 'root', '']))
+        self.assertEqual(len(commits), 2)
+        self.assertEqual(commits[0]['parents'], ['b' * 40, 'c' * 40])
+        self.assertEqual(commits[0]['message'], 'subject with "quotes", \\ and %x00')
+        self.assertEqual(commits[0]['body'], 'body line 1\n\nbody line 2')
+        self.assertEqual(commits[1]['commit'], 'd' * 40)
+        self.assertEqual(commits[1]['parents'], [])
+
+    def test_multiline_messages(self):
+        sha = self._commit('main.py', 'done\n', 'Subject | with; separators\n\nFirst paragraph\n\nSecond')
+        first = read_log(self.location, limit=1)['commits'][0]
+        self.assertEqual(first['commit'], sha)
+        self.assertEqual(first['message'], 'Subject | with; separators')
+        self.assertEqual(first['body'], 'First paragraph\n\nSecond')
+        self.assertEqual(first['author'], 'owner')
+
+    def test_cursor_pages_through_history(self):
+        expected = [commit.hexsha for commit in self.repo.iter_commits('HEAD')]
+        seen, cursor = [], None
+        while True:
+            page = read_log(self.location, after=cursor, limit=2)
+            seen += [commit['commit'] for commit in page['commits']]
+            cursor = page['next']
+            if cursor is None:
+                break
+        self.assertEqual(seen, expected)
+
+    def test_first_page_follows_the_tip(self):
+        first = read_log(self.location, limit=2)
+        self.assertEqual(read_log(self.location, limit=2), first)
+        sha = self._commit('main.py', 'new\n', 'Newer')
+        page = read_log(self.location, limit=2)
+        self.assertEqual(page['tip'], sha)
+        self.assertEqual(page['commits'][0]['commit'], sha)
+
+    def test_invalid_revisions(self):
+        with self.assertRaises(InvalidRevision):
+            read_log(self.location, ref='no-such-branch')
+        with self.assertRaises(InvalidRevision):
+            read_log(self.location, after='--all')
+
+
+class GitObjectTests(TestCase):
+    """File-at-revision and diffs come from the object database, between commits or against the working tree"""
+
+    def setUp(self):
+        cache.clear()
+        self.location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.location, ignore_errors=True)
+        self.addCleanup(pool.discard, self.location)
+        self.repo = git.Repo.init(self.location)
+        self.addCleanup(self.repo.close)
+        with self.repo.config_writer() as config:
+            config.set_value('user', 'name', 'owner')
+            config.set_value('user', 'email', 'owner@example.com')
+        self._write('main.py', 'a\nb\nc\n')
+        self._write('old.txt', 'bye\n')
+        self.repo.index.add(['main.py', 'old.txt'])
+        self.first = self.repo.index.commit('first')
+        self._write('main.py', 'a\nB\nc')
+        self._write('logo.png', b'\x89PNG\0\0')
+        os.remove(os.path.join(self.location, 'old.txt'))
+        self.repo.index.add(['main.py', 'logo.png'])
+        self.repo.index.remove(['old.txt'])
+        self.second = self.repo.index.commit('second')
+
+        self.user = get_user_model().objects.create_user('owner', 'owner@example.com', 'pw')
+        self.repository = Repository.objects.create(
+            user=self.user, name='proj', location=self.location, git_initialized=True
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.base_url = f'/fs/{self.repository.slug}'
+
+    def _write(self, path, content):
+        mode = 'wb' if isinstance(content, bytes) else 'w'
+        with open(os.path.join(self.location, path), mode) as f:
+            f.write(content)
+
+    def test_diff_between_commits(self):
+        files = {entry['path']: entry for entry in diff_revisions(self.repo, self.first, self.second)}
+        self.assertEqual(
+            {path: entry['status'] for path, entry in files.items()},
+            {'main.py': 'modified', 'old.txt': 'deleted', 'logo.png': 'added'}
+        )
+        self.assertTrue(files['logo.png']['binary'])
+        self.assertNotIn('diff', files['logo.png'])
+        self.assertEqual(files['main.py']['diff'], (
+            '--- a/main.py\n+++ b/main.py\n@@ -1,3 +1,3 @@\n a\n-b\n-c\n+B\n+c\n\\ No newline at end of file\n'
+        ))
+        self.assertEqual(files['old.txt']['diff'].splitlines()[:2], ['--- a/old.txt', '+++ /dev/null'])
+        self.assertEqual([entry['path'] for entry in diff_revisions(self.repo, self.first, self.second, path='old.txt')],
+                         ['old.txt'])
+
+    def test_diff_against_working_tree(self):
+        self._write('main.py', 'changed\n')
+        self._write('new.py', 'x = 1\n')
+        with open(os.path.join(self.location, '.git', 'info', 'exclude'), 'a') as f:
+            f.write('ignored/\n')
+        os.makedirs(os.path.join(self.location, 'ignored'))
+        self._write('ignored/big.bin', 'x')
+        files = {entry['path']: entry['status'] for entry in diff_revisions(self.repo, self.second)}
+        self.assertEqual(files, {'main.py': 'modified', 'new.py': 'added'})
+
+        with override_settings(GIT_DIFF_MAX_BYTES=4):
+            entry = diff_revisions(self.repo, self.second, path='main.py')[0]
+        self.assertTrue(entry['too_large'])
+        self.assertNotIn('diff', entry)
+
+    def test_file_at_endpoint(self):
+        url = f'{self.base_url}/file-at/'
+        response = self.client.get(url, {'ref': self.first.hexsha, 'path': 'main.py'})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual((data['content'], data['binary'], data['commit']), ('a\nb\nc\n', False, self.first.hexsha))
+        self.assertEqual(self.client.get(url, {'path': 'main.py'}).json()['content'], 'a\nB\nc')
+
+        # The tag is the blob id: the old version's tag does not match HEAD's blob
+        response = self.client.get(url, {'path': 'main.py'}, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+        etag = self.client.get(url, {'path': 'main.py'})['ETag']
+        self.assertEqual(self.client.get(url, {'path': 'main.py'}, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        raw = self.client.get(url, {'path': 'logo.png', 'raw': '1'})
+        self.assertEqual((raw.content, raw['Content-Type']), (b'\x89PNG\0\0', 'image/png'))
+        self.assertTrue(self.client.get(url, {'path': 'logo.png'}).json()['binary'])
+        self.assertEqual(self.client.get(url, {'path': 'old.txt'}).status_code, 404)
+        self.assertEqual(self.client.get(url, {'path': 'main.py', 'ref': 'no-such-ref'}).status_code, 400)
+
+    def test_diff_endpoint(self):
+        url = f'{self.base_url}/diff/'
+        response = self.client.get(url, {'base': self.first.hexsha, 'head': self.second.hexsha})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([entry['path'] for entry in response.json()['files']], ['logo.png', 'main.py', 'old.txt'])
+        response = self.client.get(
+            url, {'base': self.first.hexsha, 'head': self.second.hexsha}, HTTP_IF_NONE_MATCH=response['ETag']
+        )
+        self.assertEqual(response.status_code, 304)
+
+        # Against the working tree there is no stable validator
+        self._write('main.py', 'changed\n')
+        response = self.client.get(url)
+        self.assertEqual(response.json()['head'], None)
+        self.assertNotIn('ETag', response)
+        self.assertEqual([entry['path'] for entry in response.json()['files']], ['main.py'])
+
+
+class ArchiveExportTests(TestCase):
+    """Exports stream the working tree, or a commit through git archive, as zip or tar.gz"""
+
+    def setUp(self):
+        cache.clear()
+        self.location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.location, ignore_errors=True)
+        self.addCleanup(pool.discard, self.location)
+        with git.Repo.init(self.location) as repo:
+            with repo.config_writer() as config:
+                config.set_value('user', 'name', 'owner')
+                config.set_value('user', 'email', 'owner@example.com')
+            self._write('.gitignore', 'build/\n')
+            self._write('main.py', 'print(1)\n')
+            self._write('pkg/util.py', 'x = 1\n')
+            repo.index.add(['.gitignore', 'main.py', 'pkg/util.py'])
+            repo.index.commit('initial')
+        self.large = os.urandom(3 * CHUNK_SIZE + 17)
+        self._write('pkg/data.bin', self.large)
+        self._write('build/out.o', 'ignored')
+
+        self.user = get_user_model().objects.create_user('owner', 'owner@example.com', 'pw')
+        self.repository = Repository.objects.create(
+            user=self.user, name='proj', location=self.location, git_initialized=True
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = f'/fs/{self.repository.slug}/archive/'
+
+    def _write(self, path, content):
+        full_path = os.path.join(self.location, path)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        with open(full_path, 'wb' if isinstance(content, bytes) else 'w') as f:
+            f.write(content)
+
+    def _download(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        body = b''.join(response.streaming_content)
+        response.close()
+        return response, body
+
+    def _zip_entries(self, body):
+        with zipfile.ZipFile(io.BytesIO(body)) as archive:
+            # git archive also writes directory entries
+            return {name: archive.read(name) for name in archive.namelist() if not name.endswith('/')}
+
+    def _tar_entries(self, body):
+        with tarfile.open(fileobj=io.BytesIO(body), mode='r:gz') as archive:
+            return {member.name: archive.extractfile(member).read() for member in archive.getmembers() if member.isfile()}
+
+    def test_worktree_exports(self):
+        expected = {
+            'proj/.gitignore': b'build/\n', 'proj/main.py': b'print(1)\n',
+            'proj/pkg/util.py': b'x = 1\n', 'proj/pkg/data.bin': self.large,
+        }
+        response, body = self._download(type='zip')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="proj.zip"')
+        self.assertEqual(self._zip_entries(body), expected)
+
+        response, body = self._download(type='tar.gz')
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertEqual(self._tar_entries(body), expected)
+
+        _, body = self._download(type='tar.gz', path='pkg')
+        self.assertEqual(set(self._tar_entries(body)), {'proj/pkg/util.py', 'proj/pkg/data.bin'})
+
+    def test_large_files_stream_in_chunks(self):
+        files = worktree_files(self.location, 'pkg')
+        for fmt in ARCHIVE_FORMATS:
+            chunks = list(stream_worktree_archive(files, fmt, 'proj'))
+            self.assertGreater(len(chunks), 3, fmt)
+
+    def test_commit_export(self):
+        response, body = self._download(type='zip', ref='HEAD')
+        self.assertEqual(set(self._zip_entries(body)), {'proj/.gitignore', 'proj/main.py', 'proj/pkg/util.py'})
+        self.assertEqual(self.client.get(self.url, {'ref': 'HEAD'}, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+        _, body = self._download(type='tar.gz', ref='HEAD', path='pkg')
+        self.assertEqual(self._tar_entries(body), {'proj/pkg/util.py': b'x = 1\n'})
+
+    def test_bad_requests(self):
+        self.assertEqual(self.client.get(self.url, {'type': 'rar'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'path': '../etc'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'path': 'missing'}).status_code, 404)
+        self.assertEqual(self.client.get(self.url, {'ref': 'HEAD', 'path': 'missing'}).status_code, 404)
+        self.assertEqual(self.client.get(self.url, {'ref': 'no-such-ref'}).status_code, 400)
+
+
+class ForkTests(TestCase):
+    """A fork is an independent copy: same files and history, its own owner and access rows"""
+
+    def setUp(self):
+        self.base_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.base_dir, ignore_errors=True)
+        settings_override = override_settings(BASE_DIR=self.base_dir, FILESYS_SYMBOLS_WORKERS=0)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        User = get_user_model()
+        self.owner = User.objects.create_user('owner', 'owner@example.com', 'pw')
+        self.collaborator = User.objects.create_user('collab', 'collab@example.com', 'pw')
+        location = os.path.join(self.base_dir, 'c3', 'owner', 'proj')
+        self.source = Repository.objects.create(
+            user=self.owner, name='proj', location=location, git_initialized=True
+        )
+        self.source.collaborators.add(self.collaborator)
+        self.addCleanup(pool.discard, location)
+
+        files = {'main.py': 'print(1)\n', 'pkg/util.py': 'x = 1\n'}
+        with git.Repo.init(location) as repo:
+            with repo.config_writer() as config:
+                config.set_value('user', 'name', 'owner')
+                config.set_value('user', 'email', 'owner@example.com')
+            for path, content in files.items():
+                os.makedirs(os.path.dirname(os.path.join(location, path)), exist_ok=True)
+                with open(os.path.join(location, path), 'w') as f:
+                    f.write(content)
+                file_obj = File(repository=self.source, path=path)
+                file_obj.set_content(content)
+                file_obj.save()
+            repo.index.add(list(files))
+            self.source.last_commit_hash = repo.index.commit('Initial commit').hexsha
+            self.source.save()
+
+    def _fork(self, user, name=None):
+        fork = fork_repository(self.source, user, name)
+        self.addCleanup(pool.discard, fork.location)
+        return fork
+
+    def test_copies_files_and_history(self):
+        fork = self._fork(self.collaborator)
+        self.assertEqual(fork.slug, 'collab/proj')
+        self.assertEqual(fork.location, os.path.join(self.base_dir, 'c3', 'collab', 'proj'))
+        self.assertEqual(
+            {f.path: f.blob_id for f in File.objects.filter(repository=fork)},
+            {f.path: f.blob_id for f in File.objects.filter(repository=self.source)}
+        )
+        for path in ('main.py', 'pkg/util.py'):
+            with open(os.path.join(fork.location, path)) as forked, open(os.path.join(self.source.location, path)) as source:
+                self.assertEqual(forked.read(), source.read())
+        # Only the immutable objects share inodes with the source
+        for path in ('main.py', 'pkg/util.py'):
+            self.assertFalse(os.path.samefile(os.path.join(fork.location, path), os.path.join(self.source.location, path)))
+        objects = os.path.join('.git', 'objects', self.source.last_commit_hash[:2], self.source.last_commit_hash[2:])
+        self.assertTrue(os.path.samefile(os.path.join(fork.location, objects), os.path.join(self.source.location, objects)))
+        with git.Repo(fork.location) as repo:
+            self.assertEqual(repo.head.commit.hexsha, self.source.last_commit_hash)
+            self.assertEqual(repo.config_reader().get_value('user', 'name'), 'collab')
+            self.assertFalse(repo.is_dirty(untracked_files=True))
+        # Nothing is left behind in the staging area
+        self.assertEqual(os.listdir(os.path.join(self.base_dir, 'c3', 'collab')), ['proj'])
+
+    def test_access_rows(self):
+        fork = self._fork(self.collaborator)
+        # The forking user owns the fork; the source's collaborators are not carried over
+        self.assertEqual(
+            list(RepositoryAccess.objects.filter(repository=fork).values_list('user_id', 'role')),
+            [(self.collaborator.pk, RepositoryAccess.OWNER)]
+        )
+        self.assertEqual(
+            set(RepositoryAccess.objects.filter(repository=self.source).values_list('user_id', 'role')),
+            {(self.owner.pk, RepositoryAccess.OWNER), (self.collaborator.pk, RepositoryAccess.COLLABORATOR)}
+        )
+
+    def test_fork_is_independent(self):
+        fork = self._fork(self.collaborator)
+        forked = File.objects.get(repository=fork, path='main.py')
+        forked.set_content('print(2)\n')
+        forked.save()
+        # Written in place: the working tree is copied, not linked
+        with open(os.path.join(fork.location, 'main.py'), 'w') as f:
+            f.write('print(2)\n')
+        self.assertEqual(File.objects.get(repository=self.source, path='main.py').get_content(), 'print(1)\n')
+        with open(os.path.join(self.source.location, 'main.py')) as f:
+            self.assertEqual(f.read(), 'print(1)\n')
+
+    def test_name_taken(self):
+        self._fork(self.collaborator)
+        with self.assertRaises(ForkError):
+            fork_repository(self.source, self.collaborator)
+        self.assertEqual(self._fork(self.collaborator, 'proj-2').slug, 'collab/proj-2')
+
+
+class RepositoryTemplateTests(TestCase):
+    """Repositories created from a skeleton are usable git repositories owned by the user"""
+
+    def setUp(self):
+        self.base_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.base_dir, ignore_errors=True)
+        settings_override = override_settings(BASE_DIR=self.base_dir)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_identity_with_quotes_and_backslashes(self):
+        user = get_user_model().objects.create_user('o"brien\\x', 'o"b\\x@example.com', 'pw')
+        repo_dir = os.path.join(self.base_dir, 'c3', 'obrien', 'proj')
+        commit = create_from_template(repo_dir, user)
+        with git.Repo(repo_dir) as repo:
+            self.assertEqual(repo.head.commit.hexsha, commit)
+            self.assertEqual(repo.git.config('user.name'), 'o"brien\\x')
+            self.assertEqual(repo.git.config('user.email'), 'o"b\\x@example.com')
+            self.assertEqual(repo.git.fsck('--no-dangling'), '')
+
+
+@mock.patch('filesys.importer.schedule_auto_commit')
+@mock.patch('filesys.importer.commit_now', return_value=False)
+@mock.patch('filesys.importer.threading.Thread')
+class ImportJobTests(TestCase):
+    """Import jobs live in the database, so every worker process sees them and one runs per repository"""
+
+    def setUp(self):
+        self.location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.location, ignore_errors=True)
+        self.user = get_user_model().objects.create_user('owner', 'owner@example.com', 'pw')
+        self.repository = Repository.objects.create(user=self.user, name='proj', location=self.location)
+
+    def _archive(self):
+        fd, path = tempfile.mkstemp(suffix='.zip')
+        os.close(fd)
+        with zipfile.ZipFile(path, 'w') as archive:
+            archive.writestr('project/main.py', 'print(1)\n')
+            archive.writestr('project/pkg/util.py', 'x = 1\n')
+        self.addCleanup(lambda: os.path.exists(path) and os.unlink(path))
+        return path
+
+    def test_one_active_import_per_repository(self, thread, *mocks):
+        progress = start_import(self.repository, self._archive())
+        self.assertEqual(progress['state'], ImportJob.QUEUED)
+        with self.assertRaises(ImportInProgress):
+            start_import(self.repository, self._archive())
+        other = Repository.objects.create(user=self.user, name='other', location=self.location)
+        start_import(other, self._archive())
+        self.assertEqual(thread.call_count, 2)
+
+    def test_finished_job_releases_the_repository(self, thread, *mocks):
+        path = self._archive()
+        job = start_import(self.repository, path)['job']
+        progress = run_import(self.repository, path, 'zip', job)
+        self.assertEqual(progress['state'], ImportJob.DONE)
+
+        stored = get_progress(job, self.repository)
+        self.assertEqual((stored['state'], stored['processed'], stored['created']), (ImportJob.DONE, 2, 2))
+        self.assertEqual(set(File.objects.filter(repository=self.repository).values_list('path', flat=True)),
+                         {'main.py', 'pkg/util.py'})
+        # Another repository cannot read the job
+        other = Repository.objects.create(user=self.user, name='other', location=self.location)
+        self.assertIsNone(get_progress(job, other))
+        start_import(self.repository, self._archive())
+
+    def test_stale_job_stops_blocking(self, thread, *mocks):
+        job = start_import(self.repository, self._archive())['job']
+        ImportJob.objects.filter(pk=job).update(updated_at=timezone.now() - timedelta(hours=2))
+        with override_settings(FILESYS_IMPORT_STALE_AFTER=3600):
+            start_import(self.repository, self._archive())
+        stale = ImportJob.objects.get(pk=job)
+        self.assertEqual((stale.state, stale.error), (ImportJob.FAILED, 'Interrupted'))
+
+
+class AccessMapTests(TestCase):
+    """
+    Access maps are cached per user, so every ownership or collaborator change
+    must drop the affected users' entries straight away.
+    """
+
+    def setUp(self):
+        cache.clear()
+        User = get_user_model()
+        self.owner = User.objects.create_user('owner', 'owner@example.com', 'pw')
+        self.other = User.objects.create_user('other', 'other@example.com', 'pw')
+        self.repository = Repository.objects.create(user=self.owner, name='proj', location=tempfile.gettempdir())
+
+    def _role(self, user):
+        return get_access_map(user).get(self.repository.pk)
+
+    def test_map_is_cached(self):
+        self.assertEqual(self._role(self.owner), RepositoryAccess.OWNER)
+        with self.assertNumQueries(0):
+            self.assertEqual(self._role(self.owner), RepositoryAccess.OWNER)
+
+    def test_collaborator_changes_apply_immediately(self):
+        self.assertIsNone(self._role(self.other))
+        self.repository.collaborators.add(self.other)
+        self.assertEqual(self._role(self.other), RepositoryAccess.COLLABORATOR)
+        self.repository.collaborators.remove(self.other)
+        self.assertIsNone(self._role(self.other))
+
+        # From the user's side of the relation, and through clear()
+        self.other.collaborative_repositories.add(self.repository)
+        self.assertEqual(self._role(self.other), RepositoryAccess.COLLABORATOR)
+        self.repository.collaborators.clear()
+        self.assertIsNone(self._role(self.other))
+        self.assertEqual(self._role(self.owner), RepositoryAccess.OWNER)
+
+    def test_owner_change_moves_access(self):
+        self.assertEqual(self._role(self.owner), RepositoryAccess.OWNER)
+        self.assertIsNone(self._role(self.other))
+        self.repository.user = self.other
+        self.repository.save()
+        self.assertEqual(self._role(self.other), RepositoryAccess.OWNER)
+        self.assertIsNone(self._role(self.owner))
+
+    def test_removed_collaborator_is_denied_on_next_request(self):
+        self.repository.collaborators.add(self.other)
+        client = APIClient()
+        client.force_authenticate(self.other)
+        url = f'/acs/{self.repository.slug}/maintenance/'
+        self.assertEqual(client.get(url).status_code, 200)
+
+        client.force_authenticate(self.owner)
+        response = client.post(f'/fs/{self.repository.slug}/remove-collaborator/', {'user_id': self.other.pk})
+        self.assertEqual(response.status_code, 200)
+
+        client.force_authenticate(self.other)
+        self.assertEqual(client.get(url).status_code, 403)
+
+
+class SearchTests(TestCase):
+    """The trigram index follows every File change, and searching through it finds what a full scan finds"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user('owner', 'owner@example.com', 'pw')
+        self.repository = Repository.objects.create(user=self.user, name='proj', location=tempfile.gettempdir())
+
+    def _file(self, path, content):
+        file_obj = File(repository=self.repository, path=path)
+        file_obj.set_content(content)
+        file_obj.save()
+        return file_obj
+
+    def _row(self, file_obj):
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT path, content FROM {SEARCH_TABLE} WHERE rowid = %s", [file_obj.pk])
+            return cursor.fetchone()
+
+    def _paths(self, query, **kwargs):
+        return [result['path'] for result in search_repository(self.repository, query, **kwargs)['results']]
+
+    def test_index_follows_create_update_delete(self):
+        self.assertTrue(ensure_search_table())
+        file_obj = self._file('main.py', 'print(1)\n')
+        self.assertEqual(self._row(file_obj), ('main.py', 'print(1)\n'))
+
+        file_obj.set_content('print(2)\n')
+        file_obj.save()
+        self.assertEqual(self._row(file_obj), ('main.py', 'print(2)\n'))
+        file_obj.path = 'app.py'
+        file_obj.save()
+        self.assertEqual(self._row(file_obj), ('app.py', 'print(2)\n'))
+        self.assertEqual(self._paths('print(2)'), ['app.py'])
+
+        file_obj.delete()
+        self.assertIsNone(self._row(file_obj))
+        self.assertEqual(self._paths('print(2)'), [])
+
+    def test_scan_fallback_matches_index(self):
+        self._file('src/needle.py', 'def find_needle():\n    return "needle"\n')
+        self._file('src/hay.py', 'HAY = 1\n# no Needle here? yes: NEEDLE\n')
+        self._file('docs/readme.md', 'nothing to see\n')
+        self._file('tests/test_x.py', 'from src.needle import find_needle\n')
+        searches = [
+            ('needle', {}),
+            ('Needle', {'case_sensitive': True}),
+            (r'def \w+_needle', {'regex': True}),
+            ('needle', {'path_glob': 'src/*'}),
+            ('', {'path_glob': '*.md'}),
+        ]
+        indexed = [search_repository(self.repository, query, **kwargs) for query, kwargs in searches]
+        with mock.patch('filesys.search.ensure_search_table', return_value=False):
+            scanned = [search_repository(self.repository, query, **kwargs) for query, kwargs in searches]
+        self.assertEqual(indexed, scanned)
+        self.assertEqual([result['path'] for result in indexed[0]['results']],
+                         ['src/needle.py', 'src/hay.py', 'tests/test_x.py'])
+
+    def test_short_queries_scan_without_the_index(self):
+        self._file('a.py', 'x = 1\nif x: pass\n')
+        self._file('b.py', 'y = 2\n')
+        with mock.patch('filesys.search._candidates_fts') as fts:
+            self.assertEqual(self._paths('if'), ['a.py'])
+            self.assertEqual(self._paths('2', case_sensitive=True), ['b.py'])
+            self.assertEqual(self._paths(r'\d', regex=True), ['a.py', 'b.py'])
+        fts.assert_not_called()
+
+    def test_nested_quantifiers_rejected(self):
+        for pattern in ['(a+)+$', r'(\w*\s?)*x', '((ab)*c)+', '(?:a{2,})*']:
+            with self.assertRaises(InvalidQuery):
+                search_repository(self.repository, pattern, regex=True)
+        for pattern in ['(ab)+', 'a+b*', '(a|b)?c+', r'\(a+\)+']:
+            self.assertFalse(has_nested_quantifier(pattern), pattern)
+
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.get(f'/fs/{self.repository.slug}/search/', {'q': '(a+)+$', 'regex': '1'})
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(FILESYS_SYMBOLS_WORKERS=0)
+class SymbolIndexTests(TestCase):
+    """Saving a file re-indexes it on commit, touching only the rows that changed"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user('owner', 'owner@example.com', 'pw')
+        self.repository = Repository.objects.create(user=self.user, name='proj', location=tempfile.gettempdir())
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def _save(self, path, content, file_obj=None):
+        file_obj = file_obj or File(repository=self.repository, path=path)
+        file_obj.set_content(content)
+        with self.captureOnCommitCallbacks(execute=True):
+            file_obj.save()
+        return file_obj
+
+    def _definitions(self, file_obj):
+        return dict(
+            Symbol.objects.filter(file=file_obj, role=Symbol.DEFINITION).values_list('name', 'pk')
+        )
+
+    def test_edit_replaces_only_changed_rows(self):
+        file_obj = self._save('pkg/util.py', 'def keep():\n    pass\n\ndef old():\n    pass\n')
+        before = self._definitions(file_obj)
+        self.assertEqual(set(before), {'keep', 'old'})
+
+        self._save(None, 'def keep():\n    pass\n\ndef new():\n    pass\n', file_obj)
+        after = self._definitions(file_obj)
+        self.assertEqual(set(after), {'keep', 'new'})
+        # The unchanged definition keeps its row
+        self.assertEqual(after['keep'], before['keep'])
+        file_obj.refresh_from_db()
+        self.assertEqual(file_obj.symbols_blob, file_obj.blob_id)
+
+    def test_sync_rows_keeps_duplicates_counted(self):
+        file_obj = self._save('a.py', 'x = 1\n')
+        rows = [FileImport(repository=self.repository, file=file_obj, module='os', target='os', line=1)] * 2
+        self.assertEqual(_sync_rows(FileImport, ('module', 'target', 'line'), _import_key, [file_obj.pk], rows), (0, 2))
+        self.assertEqual(_sync_rows(FileImport, ('module', 'target', 'line'), _import_key, [file_obj.pk], rows[:1]), (1, 0))
+        self.assertEqual(FileImport.objects.filter(file=file_obj).count(), 1)
+
+    def test_symbols_and_dependents_endpoints(self):
+        self._save('pkg/util.py', 'def helper():\n    return 1\n')
+        self._save('pkg/main.py', 'from .util import helper\n\nprint(helper())\n')
+        self._save('app.py', 'import pkg.util\n')
+        base = f'/fs/{self.repository.slug}'
+
+        response = self.client.get(f'{base}/symbols/', {'name': 'helper'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [(row['path'], row['kind'], row['line']) for row in response.json()['symbols']],
+            [('pkg/util.py', 'function', 1)]
+        )
+        response = self.client.get(f'{base}/symbols/', {'name': 'helper', 'role': 'reference'})
+        self.assertEqual([row['path'] for row in response.json()['symbols']], ['pkg/main.py'])
+        self.assertEqual(self.client.get(f'{base}/symbols/').status_code, 400)
+
+        response = self.client.get(f'{base}/dependents/', {'path': 'pkg/util.py'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            sorted({(row['path'], row['module']) for row in response.json()['dependents']}),
+            [('app.py', 'pkg.util'), ('pkg/main.py', '.util')]
+        )
+        response = self.client.get(f'{base}/dependents/', {'path': 'pkg/main.py'})
+        self.assertEqual({row['target'] for row in response.json()['imports']}, {'pkg.util', 'pkg.util.helper'})
+        self.assertEqual(self.client.get(f'{base}/dependents/', {'path': 'missing.py'}).status_code, 404)
+
+
+@mock.patch('filesys.trash.reaper.wake')
+class TrashTests(TestCase):
+    """Deleting tombstones the repository at once; the reaper reclaims its directory, row and blobs later"""
+
+    def setUp(self):
+        self.base_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.base_dir, ignore_errors=True)
+        settings_override = override_settings(FILESYS_TRASH_DIR=os.path.join(self.base_dir, '~trash'))
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.user = get_user_model().objects.create_user('owner', 'owner@example.com', 'pw')
+        self.location = os.path.join(self.base_dir, 'owner', 'proj')
+        os.makedirs(self.location)
+        with open(os.path.join(self.location, 'main.py'), 'w') as f:
+            f.write('print(1)\n')
+        self.repository = Repository.objects.create(user=self.user, name='proj', location=self.location)
+        self.file = File(repository=self.repository, path='main.py')
+        self.file.set_content('print(1)\n')
+        self.file.save()
+
+    def test_name_reusable_immediately(self, wake):
+        tombstone_repository(self.repository)
+        self.assertFalse(Repository.objects.filter(pk=self.repository.pk).exists())
+        tombstone = Repository.all_objects.get(pk=self.repository.pk)
+        self.assertIsNotNone(tombstone.deleted_at)
+        self.assertFalse(os.path.exists(self.location))
+        self.assertTrue(os.path.exists(os.path.join(tombstone.location, 'main.py')))
+
+        reused = Repository.objects.create(user=self.user, name='proj', location=self.location)
+        self.assertEqual(reused.slug, 'owner/proj')
+
+    def test_rollback_moves_the_directory_back(self, wake):
+        with mock.patch('filesys.trash.os.utime', side_effect=OSError('disk gone')):
+            with self.assertRaises(OSError):
+                tombstone_repository(self.repository)
+        self.assertTrue(os.path.exists(os.path.join(self.location, 'main.py')))
+        self.assertEqual(os.listdir(os.path.join(self.base_dir, '~trash')), [])
+        restored = Repository.objects.get(pk=self.repository.pk)
+        self.assertEqual((restored.name, restored.location), ('proj', self.location))
+
+    def test_reaper_deletes_row_and_collects_blobs(self, wake):
+        tombstone_repository(self.repository)
+        trashed = Repository.all_objects.get(pk=self.repository.pk).location
+        reaper = TrashReaper()
+        self.assertEqual(reaper.stats()['pending'], 1)
+
+        self.assertEqual(reaper.reap(), 1)
+        self.assertFalse(Repository.all_objects.filter(pk=self.repository.pk).exists())
+        self.assertFalse(os.path.exists(trashed))
+        self.assertFalse(Blob.objects.exists())
+        stats = reaper.stats()
+        self.assertEqual((stats['reclaimed'], stats['pending'], stats['failures']), (1, 0, 0))
+        self.assertGreater(stats['reclaimed_bytes'], 0)
+
+    def test_stats_endpoint_is_admin_only(self, wake):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        self.assertEqual(client.get('/fs/trash/').status_code, 403)
+
+        admin = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'pw')
+        client.force_authenticate(admin)
+        tombstone_repository(self.repository)
+        response = client.get('/fs/trash/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['pending'], 1)
+
+
+class CheckIgnoredTests(SimpleTestCase):
+    """Ignored paths are found by one `git check-ignore --stdin` per batch, however many there are"""
+
+    def setUp(self):
+        self.location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.location, ignore_errors=True)
+        self.repo = git.Repo.init(self.location)
+        self.addCleanup(self.repo.close)
+        with open(os.path.join(self.location, '.gitignore'), 'w') as f:
+            f.write('*.log\nbuild/\n!keep.log\n')
+
+    def test_patterns_directories_and_negation(self):
+        # A directory pattern only matches the bare name once it exists as a directory
+        os.makedirs(os.path.join(self.location, 'build'))
+        paths = ['app.log', 'keep.log', 'main.py', 'build', 'build/out.o', 'src/debug.log', 'dir with space/a.log']
+        self.assertEqual(
+            check_ignored(self.repo, paths),
+            {'app.log', 'build', 'build/out.o', 'src/debug.log', 'dir with space/a.log'}
+        )
+        self.assertEqual(check_ignored(self.repo, ['main.py']), set())
+
+    def test_batches(self):
+        paths = [f'file{i}.log' for i in range(5)] + ['main.py']
+        with override_settings(GIT_CHECK_IGNORE_BATCH=2), \
+                mock.patch('filesys.git_pool.subprocess.run', wraps=subprocess.run) as run:
+            self.assertEqual(check_ignored(self.repo, paths), set(paths[:5]))
+        self.assertEqual(run.call_count, 3)
+
+    def test_drop_ignored_keeps_tracked_paths(self):
+        with open(os.path.join(self.location, 'tracked.log'), 'w') as f:
+            f.write('x')
+        self.repo.index.add(['tracked.log'], force=True)
+        with mock.patch('filesys.git_pool.check_ignored', wraps=check_ignored) as check:
+            self.assertEqual(drop_ignored(self.repo, self.repo.index, ['tracked.log']), ['tracked.log'])
+            check.assert_not_called()
+            self.assertEqual(drop_ignored(self.repo, self.repo.index, ['tracked.log', 'new.log']), ['tracked.log'])
+
+
+class ArchivePathTests(SimpleTestCase):
+    """Archive member names are mapped into the working tree, or rejected, before anything is written"""
+
+    def test_accepts_relative_paths(self):
+        self.assertEqual(clean_path('src/main.py'), 'src/main.py')
+        self.assertEqual(clean_path('./src//main.py'), 'src/main.py')
+        self.assertEqual(clean_path('win\\dir\\main.py'), 'win/dir/main.py')
+        self.assertEqual(clean_path('project-main/src/main.py', strip=1), 'src/main.py')
+
+    def test_rejects_parent_components(self):
+        for name in ('../evil.py', 'src/../../evil.py', '..\\evil.py', 'src/..'):
+            self.assertIsNone(clean_path(name), name)
+
+    def test_rejects_git_metadata(self):
+        for name in ('.git/config', 'src/.git/hooks/pre-commit', 'project-main/.git/HEAD'):
+            self.assertIsNone(clean_path(name, strip=1 if name.startswith('project') else 0), name)
+
+    def test_rejects_absolute_paths(self):
+        for name in ('/etc/passwd', '\\server\\share\\x', 'C:/Windows/x.py', 'c:evil.py'):
+            self.assertIsNone(clean_path(name), name)
+
+    def test_stripping_everything_skips_the_entry(self):
+        self.assertIsNone(clean_path('project-main/', strip=1))
+        self.assertIsNone(clean_path('main.py', strip=1))
+
+
+class ArchiveScanTests(SimpleTestCase):
+    """The file count and uncompressed size claimed by the headers are capped before extraction"""
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.path = os.path.join(directory, 'archive.zip')
+        # Two highly compressible 1 MB entries, the shape of a zip bomb
+        with zipfile.ZipFile(self.path, 'w', zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr('project/a.bin', b'\0' * 1024 * 1024)
+            archive.writestr('project/b.bin', b'\0' * 1024 * 1024)
+
+    def test_within_limits(self):
+        self.assertEqual(_scan(self.path, 'zip', 2, 2 * 1024 * 1024), (2, 'project'))
+
+    def test_too_many_files(self):
+        with self.assertRaisesMessage(ArchiveImportError, 'more than 1 files'):
+            _scan(self.path, 'zip', 1, 2 * 1024 * 1024)
+
+    def test_too_large_uncompressed(self):
+        with self.assertRaisesMessage(ArchiveImportError, 'expands to more than'):
+            _scan(self.path, 'zip', 2, 1024 * 1024)
+
+
+class AtomicWriteTests(SimpleTestCase):
+    """The data reaches the disk before the rename and the directory entry after it, in every durable mode"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        self.target = os.path.join(self.directory, 'main.py')
+        with open(self.target, 'w') as f:
+            f.write('old\n')
+
+    def _events(self, durability, write):
+        events = []
+        real_fsync, real_replace = os.fsync, os.replace
+
+        def fsync(fd):
+            st = os.fstat(fd)
+            events.append(('fsync', 'dir' if stat.S_ISDIR(st.st_mode) else st.st_ino))
+            return real_fsync(fd)
+
+        def replace(src, dst):
+            events.append(('replace', os.stat(src).st_ino))
+            return real_replace(src, dst)
+
+        with mock.patch('os.fsync', side_effect=fsync), mock.patch('os.replace', side_effect=replace):
+            write(durability)
+        return events
+
+    def _assert_ordered(self, events):
+        replaced = [i for i, event in enumerate(events) if event[0] == 'replace']
+        self.assertEqual(len(replaced), 1, events)
+        inode = events[replaced[0]][1]
+        self.assertIn(('fsync', inode), events[:replaced[0]], events)
+        self.assertIn(('fsync', 'dir'), events[replaced[0]:], events)
+
+    def test_group_and_fsync_sync_data_before_rename(self):
+        for durability in ('group', 'fsync'):
+            with self.subTest(durability=durability):
+                self._assert_ordered(self._events(durability, lambda mode: atomic_write(self.target, 'new\n', mode)))
+                with open(self.target) as f:
+                    self.assertEqual(f.read(), 'new\n')
+
+    def test_stream_writes(self):
+        def write(mode):
+            with open(self.target, 'rb') as source:
+                atomic.atomic_write_stream(os.path.join(self.directory, 'copy.py'), source, durability=mode)
+        self._assert_ordered(self._events('group', write))
+
+    def test_staged_writes(self):
+        def write(mode):
+            tmp_path = atomic.write_temp(self.target, 'new\n', durability='none')
+            atomic.sync_files([tmp_path], mode)
+            atomic.publish(tmp_path, self.target, durability='none')
+            atomic.sync_directories([self.target], mode)
+        self._assert_ordered(self._events('group', write))
+
+    def test_none_never_syncs(self):
+        events = self._events('none', lambda mode: atomic_write(self.target, 'new\n', mode))
+        self.assertEqual([event[0] for event in events], ['replace'])
+
+    def test_group_sync_reports_failures(self):
+        with mock.patch('os.fsync', side_effect=OSError('EIO')):
+            with self.assertRaises(OSError):
+                atomic_write(self.target, 'new\n', 'group')
+        with open(self.target) as f:
+            self.assertEqual(f.read(), 'old\n')
+        self.assertEqual(os.listdir(self.directory), ['main.py'])
+
+
+class SymbolExtractionTests(SimpleTestCase):
+    """Definitions, references and imports pulled out of sample sources"""
+
+    def _definitions(self, extraction):
+        return {(name, kind, container) for name, kind, container, _, _ in extraction.definitions}
+
+    def test_python(self):
+        source = (
+            'import os\n'
+            'from .util import helper as h\n'
+            'VERSION = 1\n'
+            '\n'
+            'class Greeter:\n'
+            '    greeting = "hi"\n'
+            '\n'
+            '    def greet(self, name):\n'
+            '        local = h(name)\n'
+            '        return os.path.join(local)\n'
+            '\n'
+            'async def main():\n'
+            '    Greeter().greet("x")\n'
+        )
+        extraction = extract_python('pkg/mod.py', source)
+        self.assertEqual(self._definitions(extraction), {
+            ('VERSION', 'variable', ''), ('Greeter', 'class', ''), ('greeting', 'variable', 'Greeter'),
+            ('greet', 'method', 'Greeter'), ('main', 'function', ''),
+        })
+        self.assertEqual({target for _, target, _ in extraction.imports}, {'os', 'pkg.util', 'pkg.util.helper'})
+        references = {name for name, _, _ in extraction.references}
+        self.assertTrue({'h', 'os', 'join', 'Greeter', 'greet'} <= references)
+        # Half-typed code is skipped rather than failing
+        self.assertEqual(extract_python('bad.py', 'def broken(:\n').definitions, [])
+
+    def test_c(self):
+        source = (
+            '#include <stdio.h>\n'
+            '#include "./util.h"\n'
+            '/* int commented(void) { return 0; } */\n'
+            'struct point { int x; int y; };\n'
+            '\n'
+            'static int add(int a, int b) {\n'
+            '    return a + b;\n'
+            '}\n'
+            '\n'
+            'void Shape::draw(const char *label) const {\n'
+            '    printf("int fake(void) {", label);\n'
+            '}\n'
+        )
+        extraction = extract_clike('src/main.cpp', source, 'cpp')
+        self.assertEqual(self._definitions(extraction), {
+            ('point', 'struct', ''), ('add', 'function', ''), ('draw', 'method', 'Shape'),
+        })
+        self.assertEqual({target for _, target, _ in extraction.imports}, {'stdio.h', 'src/util.h'})
+        self.assertIn('printf', {name for name, _, _ in extraction.references})
+
+    def test_typescript(self):
+        source = (
+            "import { render } from './view';\n"
+            'export class Widget {\n'
+            '  private draw(ctx: Context): void {\n'
+            '    render(ctx);\n'
+            '  }\n'
+            '}\n'
+            'const build = (x) => new Widget();\n'
+            'interface Props { size: number }\n'
+        )
+        extraction = extract_clike('src/widget.ts', source, 'typescript')
+        self.assertEqual(self._definitions(extraction), {
+            ('Widget', 'class', ''), ('draw', 'method', 'Widget'), ('build', 'function', ''),
+            ('Props', 'interface', ''),
+        })
+        self.assertEqual(extraction.imports, [('./view', 'src/view', 1)])
@@ -0,0 +1,252 @@
+import logging
+import os
+import re
+import shutil
+import stat
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.utils import timezone
+
+from .blobs import collect_garbage
+from .commit_queue import discard_queue
+from .dirty import tracker as dirty_tracker
+from .git_pool import pool
+from .models import Repository
+
+logger = logging.getLogger(__name__)
+
+# Trash entries are named <repository id>-<uuid hex>
+TRASH_ENTRY_RE = re.compile(r'^\d+-[0-9a-f]{32}$')
+
+
+def trash_root():
+    """
+    Directory deleted repositories are moved into
+
+    It lives inside c3 so the move is a same-filesystem rename, and its name
+    contains '~', which usernames cannot, so it never collides with a user directory.
+    """
+    return getattr(settings, 'FILESYS_TRASH_DIR', None) or os.path.join(settings.BASE_DIR, 'c3', '~trash')
+
+
+def _make_writable(func, path, excinfo):
+    try:
+        os.chmod(path, stat.S_IWRITE | stat.S_IREAD | stat.S_IEXEC)
+        func(path)
+    except FileNotFoundError:
+        pass
+
+
+def _tree_size(path):
+    total = 0
+    for root, _, filenames in os.walk(path):
+        for filename in filenames:
+            try:
+                total += os.lstat(os.path.join(root, filename)).st_size
+            except OSError:
+                continue
+    return total
+
+
+def tombstone_repository(repository):
+    """
+    Mark a repository deleted and move its directory into the trash, in constant time
+
+    The row is hidden from the default manager and renamed so the owner can
+    reuse the name straight away; its directory is renamed into the trash
+    area in the same transaction, and moved back if the transaction fails.
+    Disk space and the row itself are reclaimed later by the reaper.
+    """
+    location = repository.location
+    if location:
+        # Close pooled handles and drop pending commits before the directory moves
+        pool.discard(location)
+        discard_queue(location)
+        dirty_tracker.forget(location)
+
+    target = None
+    if location and os.path.exists(location):
+        os.makedirs(trash_root(), exist_ok=True)
+        target = os.path.join(trash_root(), f"{repository.pk}-{uuid.uuid4().hex}")
+
+    suffix = f"~deleted-{repository.pk}"
+    moved = False
+    try:
+        with transaction.atomic():
+            Repository.all_objects.filter(pk=repository.pk).update(
+                deleted_at=timezone.now(),
+                name=f"{repository.name[:255 - len(suffix)]}{suffix}",
+                slug=f"{repository.slug[:500 - len(suffix)]}{suffix}",
+                location=target
+            )
+            if target is not None:
+                os.replace(location, target)
+                moved = True
+                # The orphan sweep goes by this mtime, so the entry is safe until the row commits
+                os.utime(target)
+    except BaseException:
+        if moved:
+            os.replace(target, location)
+        raise
+
+    logger.info(f"Tombstoned repository {repository.slug}" + (f" into {target}" if target else ''))
+    transaction.on_commit(reaper.wake)
+
+
+class TrashReaper:
+    """
+    Background thread that reclaims tombstoned repositories
+
+    Each pass removes trashed directories (retrying failures with exponential
+    backoff), deletes the rows once their directory is gone, collects the
+    blobs they no longer reference, and sweeps trash entries left without a
+    row by a crash between the rename and the commit. Passes never overlap.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pass_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._retry_at = {}
+        self._attempts = {}
+        self._stats = {
+            'reclaimed': 0,
+            'reclaimed_bytes': 0,
+            'orphans_removed': 0,
+            'failures': 0,
+            'last_error': '',
+            'last_pass_at': None,
+        }
+
+    @property
+    def retry_delay(self):
+        return getattr(settings, 'FILESYS_TRASH_RETRY_DELAY', 5.0)
+
+    @property
+    def max_retry_delay(self):
+        return getattr(settings, 'FILESYS_TRASH_MAX_RETRY_DELAY', 600.0)
+
+    @property
+    def orphan_grace(self):
+        return getattr(settings, 'FILESYS_TRASH_ORPHAN_GRACE', 3600.0)
+
+    def wake(self):
+        self._ensure_thread()
+        self._wakeup.set()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['retrying'] = len(self._attempts)
+        stats['pending'] = Repository.all_objects.filter(deleted_at__isnull=False).count()
+        return stats
+
+    def reap(self):
+        """Run one reclamation pass, waiting for any running pass first. Returns the number of repositories reclaimed."""
+        with self._pass_lock:
+            reclaimed = 0
+            now = time.monotonic()
+            tombstones = Repository.all_objects.filter(deleted_at__isnull=False).order_by('deleted_at')
+            for repository in tombstones:
+                if self._retry_at.get(repository.pk, 0) > now:
+                    continue
+                if self._reclaim(repository):
+                    reclaimed += 1
+            if reclaimed:
+                collect_garbage()
+            self._sweep_orphans()
+            with self._lock:
+                self._stats['last_pass_at'] = timezone.now()
+            return reclaimed
+
+    def _reclaim(self, repository):
+        # delete() clears the primary key
+        pk = repository.pk
+        location = repository.location
+        try:
+            size = 0
+            if location and os.path.exists(location):
+                size = _tree_size(location)
+                shutil.rmtree(location, onerror=_make_writable)
+            # Cascades to File rows, whose delete signal releases their blob references
+            repository.delete()
+        except Exception as e:
+            attempts = self._attempts.get(pk, 0) + 1
+            delay = min(self.retry_delay * (2 ** (attempts - 1)), self.max_retry_delay)
+            with self._lock:
+                self._attempts[pk] = attempts
+                self._retry_at[pk] = time.monotonic() + delay
+                self._stats['failures'] += 1
+                self._stats['last_error'] = str(e)
+            logger.warning(f"Reclaiming {location} failed (attempt {attempts}, retrying in {delay:.0f}s): {str(e)}")
+            return False
+
+        with self._lock:
+            self._attempts.pop(pk, None)
+            self._retry_at.pop(pk, None)
+            self._stats['reclaimed'] += 1
+            self._stats['reclaimed_bytes'] += size
+        logger.info(f"Reclaimed deleted repository {pk} ({size} bytes)")
+        return True
+
+    def _sweep_orphans(self):
+        root = trash_root()
+        try:
+            entries = os.listdir(root)
+        except FileNotFoundError:
+            return
+        referenced = set(
+            Repository.all_objects.filter(deleted_at__isnull=False).values_list('location', flat=True)
+        )
+        # Entries renamed in recently may belong to a tombstone whose transaction has not committed yet
+        cutoff = time.time() - self.orphan_grace
+        for entry in entries:
+            path = os.path.join(root, entry)
+            if not TRASH_ENTRY_RE.match(entry) or path in referenced:
+                continue
+            try:
+                if os.lstat(path).st_mtime > cutoff:
+                    continue
+            except OSError:
+                continue
+            try:
+                shutil.rmtree(path, onerror=_make_writable)
+            except OSError as e:
+                logger.warning(f"Could not remove orphaned trash entry {path}: {str(e)}")
+                continue
+            with self._lock:
+                self._stats['orphans_removed'] += 1
+
+    def _ensure_thread(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run_forever, name='trash-reaper', daemon=True)
+            self._thread.start()
+
+    def _run_forever(self):
+        while True:
+            self._wakeup.wait(timeout=self.max_retry_delay)
+            self._wakeup.clear()
+            try:
+                self.reap()
+                # Come back for repositories waiting on a retry
+                if self._retry_at:
+                    delay = max(0.0, min(self._retry_at.values()) - time.monotonic())
+                    timer = threading.Timer(delay, self._wakeup.set)
+                    timer.daemon = True
+                    timer.start()
+            except Exception as e:
+                logger.error(f"Trash reaper failed: {str(e)}")
+            finally:
+                connections.close_all()
+
+
+reaper = TrashReaper()
@@ -1,11 +1,21 @@
-from django.urls import path, include
+from django.urls import path, include, re_path
 from rest_framework.routers import DefaultRouter
-from .views import RepositoryViewSet, FileViewSet
+from . import async_views
+from .views import RepositoryViewSet, FileViewSet, trash_stats
 
 router = DefaultRouter()
 router.register(r'', RepositoryViewSet, basename='repository')
 router.register(r'(?P<repository_slug>[\w-]+/[\w-]+)/files', FileViewSet, basename='file')
 
+# Async variants of the hot endpoints for ASGI deployments; the payloads match the routes above
+async_urlpatterns = [
+    re_path(r'^(?P<repository_slug>[\w-]+/[\w-]+)/files/(?P<pk>\d+)/$', async_views.file_detail, name='async-file-detail'),
+    re_path(r'^(?P<repository_slug>[\w-]+/[\w-]+)/manifest/$', async_views.manifest, name='async-manifest'),
+    re_path(r'^(?P<repository_slug>[\w-]+/[\w-]+)/contents/$', async_views.contents, name='async-contents'),
+]
+
 urlpatterns = [
+    path('async/', include(async_urlpatterns)),
+    path('trash/', trash_stats, name='trash-stats'),
     path('', include(router.urls)),
-]
\ No newline at end of file
+]
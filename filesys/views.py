@@ -1,25 +1,48 @@
 import os
-import shutil
-import subprocess
+import mimetypes
 import logging
-import stat
-import time
-from pathlib import Path
-from django.db.models import Q
+import re
+import subprocess
+import git
 from django.contrib.auth import get_user_model
 from rest_framework import viewsets, permissions, serializers, status
-from rest_framework.decorators import action
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.decorators import action, api_view, authentication_classes, permission_classes
 from rest_framework.response import Response
 from rest_framework.exceptions import PermissionDenied
 from django.conf import settings
 from django.db import transaction
+from django.db.models import BooleanField, Exists, ExpressionWrapper, OuterRef, Prefetch, Q
 from django.shortcuts import get_object_or_404
-from django.http import Http404
-from .models import Repository, File
-from .serializers import RepositorySerializer, FileSerializer
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from .models import File, FileImport, Repository, RepositoryAccess, Symbol
+from .serializers import RepositorySerializer, FileSerializer, FileBatchSerializer
 from .permissions import IsOwnerOrCollaborator
+from .pagination import RepositoryCursorPagination
+from .access import accessible_repositories, get_role
+from .archive import ARCHIVE_FORMATS, stream_git_archive, stream_worktree_archive, worktree_files
+from .atomic import atomic_write, atomic_write_stream
+from .batch import apply_file_batch
+from .commit_queue import enqueue_commit
+from .dirty import mark_dirty
+from .git_log import InvalidRevision, log_etag, read_log, resolve_commit
+from .git_objects import blob_at, diff_revisions, is_binary, read_blob
+from .git_pool import git_repo
+from .fork import ForkError, fork_repository
+from .importer import (
+    IMPORT_TYPES, ArchiveImportError, ImportInProgress, UploadTooLarge, get_progress, spool_upload, start_import,
+)
+from .repo_templates import TemplateError, create_from_template
+from .search import InvalidQuery, search_repository
+from .symbols import import_targets
+from .trash import reaper, tombstone_repository
+from .worktree import manifest_entries, untracked_texts
+from .conditional import file_etag, not_modified_response, range_applies, repository_etag, set_validators
+from .line_index import (
+    ByteRangeReader, RangeNotSatisfiable, parse_range_header, read_line_window,
+)
 
-from autocommit.tasks import auto_commit_changes
+from autocommit.scheduler import schedule_auto_commit
 
 User = get_user_model()
 logger = logging.getLogger(__name__)
@@ -32,10 +55,7 @@ class RepositoryViewSet(viewsets.ModelViewSet):
 
     def get_queryset(self):
         # Show repositories where user is owner or collaborator
-        return Repository.objects.filter(
-            Q(user=self.request.user) | 
-            Q(collaborators=self.request.user)
-        ).distinct()
+        return accessible_repositories(self.request)
 
     def perform_create(self, serializer):
         user = self.request.user
@@ -46,56 +66,15 @@ class RepositoryViewSet(viewsets.ModelViewSet):
 
         try:
             os.makedirs(user_dir, exist_ok=True)
-            os.makedirs(repo_dir, exist_ok=True)
-            
+
             try:
-                git_dir = os.path.join(repo_dir, '.git')
-                if os.path.exists(git_dir):
-                    shutil.rmtree(git_dir)
-                
-                result = subprocess.run(['git', 'init'], cwd=repo_dir, check=True,
-                                     capture_output=True, text=True)
-                logger.info(f"Git init result: {result.stdout}")
-                
-                gitignore_path = os.path.join(repo_dir, '.gitignore')
-                with open(gitignore_path, 'w') as f:
-                    f.write("""# Python
-__pycache__/
-*.py[cod]
-*.so
-.env
-.venv/
-venv/
-ENV/
-
-# IDE
-.vscode/
-.idea/
-*.swp
-*.swo
-
-# OS
-.DS_Store
-Thumbs.db
-""")
-                
-                subprocess.run(['git', 'add', '.'], cwd=repo_dir, check=True)
-                subprocess.run(['git', 'config', '--local', 'user.email', user.email], 
-                             cwd=repo_dir, check=True)
-                subprocess.run(['git', 'config', '--local', 'user.name', user.username], 
-                             cwd=repo_dir, check=True)
-                
-                status = subprocess.run(['git', 'status', '--porcelain'], 
-                                     cwd=repo_dir, capture_output=True, text=True)
-                if status.stdout.strip():
-                    subprocess.run(['git', 'commit', '-m', 'Initial commit'], 
-                                 cwd=repo_dir, check=True)
-                    logger.info(f"Created initial commit for repository: {repo_name}")
-                
-            except subprocess.CalledProcessError as e:
-                logger.error(f"Git initialization failed: {e.stderr}")
+                # Copies a prebuilt skeleton and commits in-process instead of forking git per step
+                commit_sha = create_from_template(repo_dir, user, serializer.validated_data.get('template'))
+                logger.info(f"Created initial commit {commit_sha[:7]} for repository: {repo_name}")
+            except (TemplateError, git.exc.GitError, ValueError) as e:
+                logger.error(f"Git initialization failed: {str(e)}")
                 raise serializers.ValidationError(
-                    {'error': f'Git initialization failed: {e.stderr}'}
+                    {'error': f'Git initialization failed: {str(e)}'}
                 )
             
             serializer.save(user=user, location=repo_dir)
@@ -106,50 +85,11 @@ Thumbs.db
                 {'error': f'Directory creation failed: {str(e)}'}
             )
 
-    def _remove_readonly(self, func, path, excinfo):
-        """Helper function to handle readonly files on Windows"""
-        try:
-            # Make the file writable and try operation again
-            os.chmod(path, stat.S_IWRITE)
-            func(path)
-        except Exception as e:
-            logger.error(f"Failed to remove {path}: {str(e)}")
-
     def perform_destroy(self, instance):
+        # Only tombstone here; the directory is renamed into the trash and
+        # reclaimed, together with the row, by the background trash reaper
         try:
-            if os.path.exists(instance.location):
-                repo_path = Path(instance.location)
-                
-                # First, try to remove any read-only flags
-                for path in repo_path.rglob('*'):
-                    try:
-                        path.chmod(stat.S_IWRITE | stat.S_IREAD)
-                    except Exception as e:
-                        logger.warning(f"Could not change permissions for {path}: {str(e)}")
-
-                # Give OS a moment to release any file handles
-                time.sleep(0.5)
-                
-                # Try to remove the directory tree
-                try:
-                    shutil.rmtree(
-                        instance.location, 
-                        onerror=self._remove_readonly,
-                        ignore_errors=True
-                    )
-                except Exception as e:
-                    logger.error(f"First rmtree attempt failed: {str(e)}")
-                    # If first attempt fails, wait and try again
-                    time.sleep(1)
-                    shutil.rmtree(
-                        instance.location, 
-                        onerror=self._remove_readonly,
-                        ignore_errors=True
-                    )
-
-            # Delete the database record
-            super().perform_destroy(instance)
-
+            tombstone_repository(instance)
         except Exception as e:
             logger.error(f"Repository deletion failed: {str(e)}")
             raise serializers.ValidationError({
@@ -157,42 +97,25 @@ Thumbs.db
             })
 
     @action(detail=True, methods=['get'], url_path='contents')
-    def get_contents(self, request, pk=None):
+    def get_contents(self, request, slug=None):
         repository = self.get_object()
-        files = File.objects.filter(repository=repository)
+
+        etag, last_modified = repository_etag(repository)
+        not_modified = not_modified_response(request, etag, last_modified)
+        if not_modified is not None:
+            return not_modified
+
+        files = File.objects.filter(repository=repository).select_related('blob')
         
         db_files = [
             {
                 'path': file.path,
-                'content': file.content,
+                'content': file.get_content(),
                 'language': file.language or file.detect_language()
             } for file in files
         ]
         
-        fs_files = []
-        git_dir = os.path.join(repository.location, '.git')
-        for root, _, filenames in os.walk(repository.location):
-            if root.startswith(git_dir):
-                continue
-            for filename in filenames:
-                if filename.startswith('.') or filename == 'gitignore':
-                    continue
-                file_path = os.path.join(root, filename)
-                rel_path = os.path.relpath(file_path, repository.location)
-                if any(f['path'] == rel_path for f in db_files):
-                    continue
-                try:
-                    with open(file_path, 'r', encoding='utf-8') as f:
-                        content = f.read()
-                    file_obj = File(repository=repository, path=rel_path, content=content)
-                    fs_files.append({
-                        'path': rel_path,
-                        'content': content,
-                        'language': file_obj.detect_language()
-                    })
-                except (IOError, UnicodeDecodeError) as e:
-                    logger.warning(f"Could not read file {file_path}: {str(e)}")
-                    continue
+        fs_files = untracked_texts(repository, {f['path'] for f in db_files})
 
         response_data = {
             'repo_id': repository.id,
@@ -200,7 +123,30 @@ Thumbs.db
             'description': repository.description,
             'files': db_files + fs_files
         }
-        return Response(response_data)
+        return set_validators(Response(response_data), etag, last_modified)
+
+    @action(detail=True, methods=['get'], url_path='manifest')
+    def get_manifest(self, request, slug=None):
+        """
+        List working tree files with size, mtime and content hash, without contents.
+        Clients compare the per-file sha256 against their cache and only fetch what changed.
+        """
+        repository = self.get_object()
+
+        etag, last_modified = repository_etag(repository)
+        not_modified = not_modified_response(request, etag, last_modified)
+        if not_modified is not None:
+            return not_modified
+
+        file_ids = dict(File.objects.filter(repository=repository).values_list('path', 'id'))
+        entries = manifest_entries(repository.location, file_ids)
+
+        response_data = {
+            'repo_id': repository.id,
+            'name': repository.name,
+            'files': entries
+        }
+        return set_validators(Response(response_data), etag, last_modified)
 
     def get_object(self):
         """
@@ -217,28 +163,52 @@ Thumbs.db
     @action(detail=False, methods=['get'], url_path='all')
     def list_all_repositories(self, request):
         """
-        List all repositories with their full slugs and collaborators
-        """
-        repositories = Repository.objects.all().select_related('user').prefetch_related('collaborators')
-        data = [{
-            'slug': repo.slug,
-            'name': repo.name,
-            'description': repo.description,
-            'owner': repo.user.username,
-            'created_at': repo.created_at,
-            'updated_at': repo.updated_at,
-            'collaborators': [
-                {
-                    'username': user.username,
-                    'id': user.id
-                } for user in repo.collaborators.all()
-            ],
-            'is_owner': repo.user == request.user,
-            'is_collaborator': request.user in repo.collaborators.all()
-        } for repo in repositories]
-        
+        List all repositories with their full slugs, one cursor page at a time
+
+        `is_owner` and `is_collaborator` are computed by the database.
+        Collaborators are only included with `?fields=collaborators`.
+        """
+        user_id = request.user.pk
+        memberships = Repository.collaborators.through.objects.filter(
+            repository_id=OuterRef('pk'), user_id=user_id
+        )
+        repositories = Repository.objects.select_related('user').only(
+            'slug', 'name', 'description', 'created_at', 'updated_at', 'user__username'
+        ).annotate(
+            is_owner=ExpressionWrapper(Q(user_id=user_id), output_field=BooleanField()),
+            is_collaborator=Exists(memberships)
+        )
+
+        fields = {field.strip() for field in request.query_params.get('fields', '').split(',')}
+        with_collaborators = 'collaborators' in fields
+        if with_collaborators:
+            repositories = repositories.prefetch_related(
+                Prefetch('collaborators', queryset=User.objects.only('id', 'username').order_by('id'))
+            )
+
+        paginator = RepositoryCursorPagination()
+        page = paginator.paginate_queryset(repositories, request, view=self)
+        data = []
+        for repo in page:
+            item = {
+                'slug': repo.slug,
+                'name': repo.name,
+                'description': repo.description,
+                'owner': repo.user.username,
+                'created_at': repo.created_at,
+                'updated_at': repo.updated_at,
+                'is_owner': repo.is_owner,
+                'is_collaborator': repo.is_collaborator
+            }
+            if with_collaborators:
+                item['collaborators'] = [
+                    {'username': user.username, 'id': user.id} for user in repo.collaborators.all()
+                ]
+            data.append(item)
+
         return Response({
-            'count': len(data),
+            'next': paginator.get_next_link(),
+            'previous': paginator.get_previous_link(),
             'repositories': data
         })
 
@@ -308,28 +278,466 @@ Thumbs.db
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+    @action(detail=True, methods=['get'], url_path='log')
+    def log(self, request, slug=None):
+        """
+        Cursor-paginated commit log
+
+        Query params: `ref` (branch, tag or commit, default HEAD), `path` to only
+        list commits touching a path, `limit`, and `after`, the `next` cursor
+        returned by the previous page.
+        """
+        repository = self.get_object()
+        ref = request.query_params.get('ref') or 'HEAD'
+        after = request.query_params.get('after') or None
+        path = request.query_params.get('path') or None
+        max_limit = getattr(settings, 'GIT_LOG_MAX_LIMIT', 200)
+        try:
+            limit = min(max(int(request.query_params.get('limit', 50)), 1), max_limit)
+        except ValueError:
+            return Response({'error': 'limit must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            page = read_log(repository.location, ref=ref, after=after, path=path, limit=limit)
+        except InvalidRevision as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except (OSError, ValueError) as e:
+            logger.error(f"Error fetching git log: {str(e)}")
+            return Response(
+                {"error": "Failed to fetch git log", "details": str(e)},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+        # Pages only change when the ref moves, so pollers get a 304 until the next commit
+        etag = log_etag(page['tip'], after, path, limit)
+        not_modified = not_modified_response(request, etag)
+        if not_modified is not None:
+            return not_modified
+        response = Response({
+            'repository': repository.name,
+            'ref': ref,
+            'tip': page['tip'],
+            'commits': page['commits'],
+            'next': page['next'],
+        })
+        return set_validators(response, etag)
+
+    @action(detail=True, methods=['get'], url_path='file-at')
+    def file_at_revision(self, request, slug=None):
+        """
+        Content of a file as of a revision (`ref`, default HEAD) for `path`
+
+        Pass `raw=1` to get the bytes with a guessed content type instead of JSON.
+        """
+        repository = self.get_object()
+        ref = request.query_params.get('ref') or 'HEAD'
+        path = request.query_params.get('path')
+        if not path:
+            return Response({'error': 'path is required'}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            with git_repo(repository.location) as repo:
+                commit = repo.commit(resolve_commit(repo, ref))
+                try:
+                    blob = blob_at(repo, commit, path)
+                except KeyError:
+                    return Response(
+                        {'error': f"{path} does not exist at {ref}"},
+                        status=status.HTTP_404_NOT_FOUND
+                    )
+                # Blob contents are immutable, so the blob id is a perfect validator
+                etag = f'"{blob.hexsha}"'
+                not_modified = not_modified_response(request, etag)
+                if not_modified is not None:
+                    return not_modified
+                data = read_blob(repo, blob.hexsha)
+        except InvalidRevision as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except (git.exc.GitError, OSError, ValueError) as e:
+            logger.error(f"Error reading {path} at {ref}: {str(e)}")
+            return Response(
+                {"error": "Failed to read file at revision", "details": str(e)},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+        if request.query_params.get('raw'):
+            content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+            response = HttpResponse(data, content_type=content_type)
+        else:
+            binary = is_binary(data)
+            if not binary:
+                try:
+                    content = data.decode('utf-8')
+                except UnicodeDecodeError:
+                    binary = True
+            response = Response({
+                'path': path,
+                'ref': ref,
+                'commit': commit.hexsha,
+                'sha': blob.hexsha,
+                'size': len(data),
+                'binary': binary,
+                'content': None if binary else content,
+                'language': File(path=path).language_from_path(),
+            })
+        return set_validators(response, etag)
+
+    @action(detail=True, methods=['get'], url_path='diff')
+    def diff(self, request, slug=None):
+        """
+        Unified diffs between `base` and `head` revisions
+
+        Without `head` the working tree is compared against `base` (default
+        HEAD). `path` limits the diff to a file or directory and `context`
+        sets the number of context lines.
+        """
+        repository = self.get_object()
+        base = request.query_params.get('base') or 'HEAD'
+        head = request.query_params.get('head') or None
+        path = request.query_params.get('path') or None
+        try:
+            context = min(max(int(request.query_params.get('context', 3)), 0), 100)
+        except ValueError:
+            return Response({'error': 'context must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            with git_repo(repository.location) as repo:
+                base_commit = repo.commit(resolve_commit(repo, base))
+                head_commit = repo.commit(resolve_commit(repo, head)) if head else None
+                if head_commit is not None:
+                    # Two commits always diff the same way
+                    etag = log_etag(f"{base_commit.hexsha}-{head_commit.hexsha}", None, path, context)
+                    not_modified = not_modified_response(request, etag)
+                    if not_modified is not None:
+                        return not_modified
+                files = diff_revisions(repo, base_commit, head_commit, path=path, context=context)
+        except InvalidRevision as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except (git.exc.GitError, OSError, ValueError) as e:
+            logger.error(f"Error computing diff for {repository.slug}: {str(e)}")
+            return Response(
+                {"error": "Failed to compute diff", "details": str(e)},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+        response = Response({
+            'base': base_commit.hexsha,
+            'head': head_commit.hexsha if head_commit is not None else None,
+            'files': files,
+        })
+        if head_commit is not None:
+            set_validators(response, etag)
+        return response
+
+    @action(detail=True, methods=['get'], url_path='search')
+    def search(self, request, slug=None):
+        """
+        Ranked code search over the repository's files
+
+        Query params: `q` (substring, or a regular expression with `regex=1`),
+        `path` (glob such as `src/*.py`), `case=1` for a case-sensitive
+        search, and `limit`/`offset` for paging.
+        """
+        repository = self.get_object()
+        params = request.query_params
+        max_limit = getattr(settings, 'FILESYS_SEARCH_MAX_PAGE_SIZE', 100)
+        try:
+            limit = min(max(int(params.get('limit', 20)), 1), max_limit)
+            offset = max(int(params.get('offset', 0)), 0)
+        except ValueError:
+            return Response({'error': 'limit and offset must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            page = search_repository(
+                repository,
+                params.get('q', ''),
+                regex=params.get('regex') in ('1', 'true'),
+                path_glob=params.get('path'),
+                case_sensitive=params.get('case') in ('1', 'true'),
+                offset=offset,
+                limit=limit
+            )
+        except InvalidQuery as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(page)
+
+    @action(detail=True, methods=['get'], url_path='archive')
+    def archive(self, request, slug=None):
+        """
+        Stream the repository as a zip or tar.gz download
+
+        Query params: `type` (`zip` or `tar.gz`; DRF reserves `format`), `ref` to export a commit
+        through `git archive` instead of the working tree, and `path` to
+        export only a subdirectory or file.
+        """
+        repository = self.get_object()
+        fmt = request.query_params.get('type', 'zip')
+        if fmt not in ARCHIVE_FORMATS:
+            return Response(
+                {'error': f"type must be one of {', '.join(ARCHIVE_FORMATS)}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        prefix = request.query_params.get('path', '').strip('/')
+        if '..' in prefix.split('/'):
+            return Response({'error': 'Invalid path'}, status=status.HTTP_400_BAD_REQUEST)
+        ref = request.query_params.get('ref') or None
+        content_type, extension = ARCHIVE_FORMATS[fmt]
+        root = repository.name
+
+        try:
+            if ref:
+                with git_repo(repository.location) as repo:
+                    commit = resolve_commit(repo, ref)
+                    if prefix:
+                        # Raises KeyError when the path does not exist in that commit
+                        repo.commit(commit).tree.join(prefix)
+                # A commit's archive never changes
+                etag = log_etag(commit, None, prefix, fmt)
+                not_modified = not_modified_response(request, etag)
+                if not_modified is not None:
+                    return not_modified
+                stream = stream_git_archive(repository.location, commit, fmt, root, prefix)
+                label = commit[:7]
+            else:
+                files = worktree_files(repository.location, prefix)
+                if prefix and not files:
+                    raise KeyError(prefix)
+                stream = stream_worktree_archive(files, fmt, root)
+                label = None
+        except InvalidRevision as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except KeyError:
+            return Response({'error': 'Path not found'}, status=status.HTTP_404_NOT_FOUND)
+        except (git.exc.GitError, subprocess.CalledProcessError, OSError) as e:
+            logger.error(f"Error preparing archive of {repository.slug}: {str(e)}")
+            return Response(
+                {"error": "Failed to create archive", "details": str(e)},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+        filename = '-'.join(part for part in (root, prefix.replace('/', '-'), label) if part)
+        response = StreamingHttpResponse(stream, content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="{filename}.{extension}"'
+        if ref:
+            set_validators(response, etag)
+        return response
+
+    @action(detail=True, methods=['post'], url_path='import')
+    def import_archive(self, request, slug=None):
+        """
+        Import a zip or tar archive into the repository in the background
+
+        The archive is the raw request body, or the `file` field of a multipart
+        upload. Query params: `type` (`zip` or `tar`, detected when omitted),
+        `strip` (leading path components to drop; by default a single
+        top-level directory is dropped) and `message` for the commit.
+        Responds 202 with a job id to poll at import/<job>/, or 413 when the
+        upload is larger than FILESYS_IMPORT_MAX_BYTES.
+        """
+        repository = self.get_object()
+        params = request.query_params
+        archive_type = params.get('type') or None
+        if archive_type is not None and archive_type not in IMPORT_TYPES:
+            return Response(
+                {'error': f"type must be one of {', '.join(IMPORT_TYPES)}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        strip = params.get('strip', 'auto')
+        if strip != 'auto':
+            try:
+                strip = max(int(strip), 0)
+            except ValueError:
+                return Response({'error': 'strip must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+
+        if request.content_type.startswith('multipart/'):
+            stream = request.FILES.get('file')
+            if stream is None:
+                return Response({'error': 'No file uploaded'}, status=status.HTTP_400_BAD_REQUEST)
+            length = stream.size
+        else:
+            stream = request.stream
+            if stream is None:
+                return Response({'error': 'Empty request body'}, status=status.HTTP_400_BAD_REQUEST)
+            try:
+                length = int(request.META.get('CONTENT_LENGTH') or 0) or None
+            except ValueError:
+                length = None
+
+        try:
+            archive_path = spool_upload(stream, length)
+        except UploadTooLarge as e:
+            return Response({'error': str(e)}, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        except OSError as e:
+            raise serializers.ValidationError({'error': f'Upload failed: {str(e)}'})
+        try:
+            progress = start_import(repository, archive_path, archive_type, strip=strip, message=params.get('message'))
+        except ArchiveImportError as e:
+            os.unlink(archive_path)
+            code = status.HTTP_409_CONFLICT if isinstance(e, ImportInProgress) else status.HTTP_400_BAD_REQUEST
+            return Response({'error': str(e)}, status=code)
+        return Response(progress, status=status.HTTP_202_ACCEPTED)
+
+    @action(detail=True, methods=['get'], url_path=r'import/(?P<job_id>[0-9a-f]{32})')
+    def import_status(self, request, slug=None, job_id=None):
+        """Progress of an archive import: state, total, processed, created, updated, skipped and commit"""
+        repository = self.get_object()
+        progress = get_progress(job_id, repository)
+        if progress is None:
+            return Response({'error': 'Import not found'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(progress)
+
+    @action(detail=True, methods=['get'], url_path='symbols')
+    def symbols(self, request, slug=None):
+        """
+        Look up indexed symbols
+
+        Query params: `name` (exact) or `prefix`, or `path` for a file outline;
+        `role` is `definition` (default), `reference` or `all`, and `kind`
+        filters definitions (function, method, class, ...).
+        """
+        repository = self.get_object()
+        params = request.query_params
+        name, prefix, path = params.get('name'), params.get('prefix'), params.get('path')
+        if not (name or prefix or path):
+            return Response({'error': 'name, prefix or path is required'}, status=status.HTTP_400_BAD_REQUEST)
+
+        symbols = Symbol.objects.filter(repository=repository)
+        if name:
+            symbols = symbols.filter(name=name)
+        elif prefix:
+            symbols = symbols.filter(name__startswith=prefix)
+        if path:
+            symbols = symbols.filter(file__path=path.strip('/'))
+        role = params.get('role', Symbol.DEFINITION)
+        if role != 'all':
+            symbols = symbols.filter(role=role)
+        if params.get('kind'):
+            symbols = symbols.filter(kind=params['kind'])
+
+        limit = getattr(settings, 'FILESYS_SYMBOLS_MAX_RESULTS', 500)
+        rows = list(
+            symbols.order_by('file__path', 'line', 'column')
+            .values('name', 'kind', 'role', 'container', 'line', 'column', 'file__path')[:limit + 1]
+        )
+        for row in rows:
+            row['path'] = row.pop('file__path')
+        return Response({'symbols': rows[:limit], 'truncated': len(rows) > limit})
+
+    @action(detail=True, methods=['get'], url_path='dependents')
+    def dependents(self, request, slug=None):
+        """Files that import the file at `path`, and the imports of that file"""
+        repository = self.get_object()
+        path = request.query_params.get('path', '').strip('/')
+        file_obj = File.objects.filter(repository=repository, path=path).only('id', 'path').first()
+        if file_obj is None:
+            return Response({'error': 'File not found in repository'}, status=status.HTTP_404_NOT_FOUND)
+
+        targets = import_targets(path, file_obj.language_from_path())
+        dependents = (
+            FileImport.objects.filter(repository=repository, target__in=targets)
+            .exclude(file=file_obj)
+            .order_by('file__path', 'line')
+            .values('file__path', 'module', 'line')
+        )
+        imports = file_obj.imports.order_by('line').values('module', 'target', 'line')
+        return Response({
+            'path': path,
+            'dependents': [
+                {'path': row['file__path'], 'module': row['module'], 'line': row['line']}
+                for row in dependents
+            ],
+            'imports': list(imports),
+        })
+
+    @action(detail=True, methods=['post'], url_path='fork')
+    def fork(self, request, slug=None):
+        """
+        Fork the repository into the requesting user's account; read access is enough
+
+        Body: {"name": "optional new name", "description": "optional",
+               "users": ["alice", ...]}. `users` is for the owner only: the
+        repository is forked once into each listed account (e.g. a class of students).
+        """
+        # get_object() would apply the owner-only write permission; forking only needs read access
+        source = get_object_or_404(self.get_queryset(), slug=slug)
+        name = (request.data.get('name') or source.name).strip()
+        if not re.fullmatch(r'[\w-]+', name):
+            return Response(
+                {'error': 'Repository name may only contain letters, digits, underscores and hyphens'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        description = request.data.get('description')
+
+        usernames = request.data.get('users')
+        if not usernames:
+            try:
+                fork = fork_repository(source, request.user, name, description)
+            except ForkError as e:
+                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            return Response(
+                RepositorySerializer(fork, context=self.get_serializer_context()).data,
+                status=status.HTTP_201_CREATED
+            )
+
+        if get_role(request, source.pk) != RepositoryAccess.OWNER:
+            raise PermissionDenied('Only the repository owner can fork it for other users')
+        max_users = getattr(settings, 'FILESYS_FORK_MAX_USERS', 500)
+        if not isinstance(usernames, list) or len(usernames) > max_users:
+            return Response(
+                {'error': f'users must be a list of at most {max_users} usernames'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        users = {user.username: user for user in User.objects.filter(username__in=usernames)}
+        forks, errors = [], {}
+        for username in dict.fromkeys(usernames):
+            if username not in users:
+                errors[username] = 'User not found'
+                continue
+            try:
+                forks.append(fork_repository(source, users[username], name, description))
+            except ForkError as e:
+                errors[username] = str(e)
+        return Response({
+            'forks': RepositorySerializer(forks, many=True, context=self.get_serializer_context()).data,
+            'errors': errors
+        }, status=status.HTTP_201_CREATED if forks else status.HTTP_400_BAD_REQUEST)
+
 class FileViewSet(viewsets.ModelViewSet):
     serializer_class = FileSerializer
     permission_classes = [permissions.IsAuthenticated, IsOwnerOrCollaborator]
 
-    def get_queryset(self):
-        try:
+    def get_repository(self):
+        """
+        The repository named in the URL, if the user can access it
+
+        Resolved once per request (a viewset instance serves a single request)
+        with its owner joined in, and shared by get_queryset, get_object, the
+        serializer context and the perform_* hooks.
+        """
+        if not hasattr(self, '_repository'):
             repo_slug = self.kwargs['repository_slug'].replace('%2F', '/')
-            
-            # Get repository with access check
-            repository = Repository.objects.filter(
-                Q(user=self.request.user) | Q(collaborators=self.request.user),
+            self._repository = accessible_repositories(self.request).select_related('user').filter(
                 slug=repo_slug
-            ).first()  # Get the first matching repository that user has access to
-            
+            ).first()
+        return self._repository
+
+    def get_queryset(self):
+        try:
+            repository = self.get_repository()
             if not repository:
                 return File.objects.none()
                 
-            return File.objects.filter(repository=repository)
+            return File.objects.filter(repository=repository).select_related('blob')
         except Exception as e:
             logger.error(f"Error in get_queryset: {str(e)}")
             return File.objects.none()
 
+    def get_object(self):
+        instance = super().get_object()
+        # Reuse the resolved repository instead of lazy-loading instance.repository
+        instance.repository = self.get_repository()
+        return instance
+
     def retrieve(self, request, *args, **kwargs):
         try:
             instance = self.get_object()
@@ -347,11 +755,17 @@ class FileViewSet(viewsets.ModelViewSet):
             file_path = os.path.join(instance.repository.location, instance.path)
             if os.path.exists(file_path):
                 try:
+                    # Answer conditional requests before touching the file body
+                    etag, last_modified = file_etag(instance, file_path)
+                    not_modified = not_modified_response(request, etag, last_modified)
+                    if not_modified is not None:
+                        return not_modified
+
                     with open(file_path, 'r', encoding='utf-8') as f:
                         content = f.read()
                     data = serializer.data
                     data['content'] = content
-                    return Response(data)
+                    return set_validators(Response(data), etag, last_modified)
                 except UnicodeDecodeError:
                     logger.warning(f"Binary file detected: {file_path}")
                     return Response(
@@ -377,32 +791,232 @@ class FileViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
-    def get_serializer_context(self):
-        context = super().get_serializer_context()
+    @action(detail=True, methods=['get'], url_path='window')
+    def get_window(self, request, *args, **kwargs):
+        """
+        Serve part of a large file without reading all of it
+
+        With a `Range: bytes=...` header the raw bytes are returned as 206 Partial Content,
+        unless an If-Range validator no longer matches, which gets the regular 200. Otherwise `?start_line=&end_line=` (1-based, inclusive) selects a window of lines.
+        """
+        instance = self.get_object()
+        file_path = os.path.join(instance.repository.location, instance.path)
+        if not os.path.exists(file_path):
+            return Response(
+                {'error': 'File not found on disk'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+
         try:
-            repo_slug = self.kwargs['repository_slug'].replace('%2F', '/')
-            
-            # Get repository with access check
-            repository = Repository.objects.filter(
-                Q(user=self.request.user) | Q(collaborators=self.request.user),
-                slug=repo_slug
-            ).first()  # Get the first matching repository that user has access to
-            
-            if not repository:
-                raise Http404("Repository not found or access denied")
-            
-            context['repository'] = repository
-        except Repository.DoesNotExist:
-            raise Http404("Repository not found")
-        except Exception as e:
-            logger.error(f"Error getting repository: {str(e)}")
-            raise
+            st = os.stat(file_path)
+            etag, last_modified = file_etag(instance, file_path, st)
+
+            not_modified = not_modified_response(request, etag, last_modified)
+            if not_modified is not None:
+                return not_modified
+
+            range_header = request.headers.get('Range')
+            if range_header and range_applies(request, etag, last_modified):
+                response = self._range_response(file_path, st.st_size, range_header, etag, last_modified)
+                if response is not None:
+                    return response
+
+            max_window = getattr(settings, 'FILESYS_MAX_LINE_WINDOW', 5000)
+            try:
+                start_line = int(request.query_params.get('start_line', 1))
+                end_line = int(request.query_params.get('end_line', start_line + max_window - 1))
+            except ValueError:
+                return Response(
+                    {'error': 'start_line and end_line must be integers'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            end_line = min(end_line, start_line + max_window - 1)
 
+            data = read_line_window(file_path, start_line, end_line)
+            data['id'] = instance.id
+            data['path'] = instance.path
+            response = Response(data)
+            response['Accept-Ranges'] = 'bytes'
+            return set_validators(response, etag, last_modified)
+        except UnicodeDecodeError:
+            logger.warning(f"Binary file detected: {file_path}")
+            return Response(
+                {'error': 'Cannot read binary file'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        except OSError as e:
+            logger.error(f"Error reading file {file_path}: {str(e)}")
+            return Response(
+                {'error': f'Error reading file: {str(e)}'},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+    def _record_changes(self, repository, changed_paths=(), removed_paths=(), message=None):
+        """Hand written paths to the group commit, the dirty-path tracker and the auto-commit scheduler"""
+        enqueue_commit(repository, changed_paths, removed_paths, message)
+        mark_dirty(repository, list(changed_paths) + list(removed_paths))
+        schedule_auto_commit(repository.id)
+
+    def _range_response(self, file_path, size, range_header, etag, last_modified):
+        """
+        Build a streamed 206 (or 416) response for a single-range Range header
+
+        Returns None for a header that is ignored (multi-range or malformed),
+        in which case the caller serves the whole file.
+        """
+        try:
+            byte_range = parse_range_header(range_header, size)
+        except RangeNotSatisfiable:
+            response = HttpResponse(status=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+        if byte_range is None:
+            return None
+        start, end = byte_range
+        response = StreamingHttpResponse(
+            ByteRangeReader(file_path, start, end),
+            status=status.HTTP_206_PARTIAL_CONTENT,
+            content_type=mimetypes.guess_type(file_path)[0] or 'application/octet-stream'
+        )
+        response['Content-Length'] = str(end - start + 1)
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Accept-Ranges'] = 'bytes'
+        return set_validators(response, etag, last_modified)
+
+    def _resolve_file_path(self, repository, rel_path):
+        """Validate a repository-relative path and return its absolute location"""
+        if not rel_path or any(char in rel_path for char in ['..', '\\', ':']) or rel_path.startswith('/'):
+            raise serializers.ValidationError({'error': 'Invalid file path'})
+        root = os.path.realpath(repository.location)
+        file_path = os.path.realpath(os.path.join(root, rel_path))
+        if not file_path.startswith(root + os.sep) or file_path.startswith(os.path.join(root, '.git') + os.sep):
+            raise serializers.ValidationError({'error': 'Invalid file path'})
+        return file_path
+
+    @action(detail=True, methods=['get'], url_path='download')
+    def download(self, request, *args, **kwargs):
+        """
+        Stream the raw bytes of a file, text or binary
+
+        The body is never loaded into Python memory: FileResponse hands the open file to the
+        server's file wrapper (sendfile where available). When FILESYS_SENDFILE_HEADER is set
+        (X-Sendfile or X-Accel-Redirect) the transfer is delegated to the front-end web server.
+        """
+        instance = self.get_object()
+        file_path = os.path.join(instance.repository.location, instance.path)
+        if not os.path.isfile(file_path):
+            return Response(
+                {'error': 'File not found on disk'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+
+        st = os.stat(file_path)
+        etag, last_modified = file_etag(instance, file_path, st)
+
+        not_modified = not_modified_response(request, etag, last_modified)
+        if not_modified is not None:
+            return not_modified
+
+        range_header = request.headers.get('Range')
+        if range_header and range_applies(request, etag, last_modified):
+            response = self._range_response(file_path, st.st_size, range_header, etag, last_modified)
+            if response is not None:
+                return response
+
+        filename = os.path.basename(instance.path)
+        sendfile_header = getattr(settings, 'FILESYS_SENDFILE_HEADER', None)
+        if sendfile_header:
+            if sendfile_header == 'X-Accel-Redirect':
+                rel_location = os.path.relpath(file_path, os.path.join(settings.BASE_DIR, 'c3'))
+                target = settings.FILESYS_SENDFILE_ROOT.rstrip('/') + '/' + rel_location.replace(os.sep, '/')
+            else:
+                target = file_path
+            response = HttpResponse(content_type=mimetypes.guess_type(filename)[0] or 'application/octet-stream')
+            response[sendfile_header] = target
+            response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        else:
+            response = FileResponse(open(file_path, 'rb'), as_attachment=True, filename=filename)
+        response['Accept-Ranges'] = 'bytes'
+        return set_validators(response, etag, last_modified)
+
+    @action(detail=False, methods=['put', 'post'], url_path='upload')
+    def upload(self, request, *args, **kwargs):
+        """
+        Upload a file of any type as the raw request body (`?path=dir/name.png`)
+
+        The body is streamed in chunks to a temp file next to the target and renamed into
+        place, so it is never held in memory and readers never see a partial file.
+        """
+        repository = self.get_serializer_context()['repository']
+        rel_path = request.query_params.get('path', '').strip()
+        file_path = self._resolve_file_path(repository, rel_path)
+
+        try:
+            # request.stream reads straight from the WSGI/ASGI input without buffering the body
+            stream = request.stream
+            written = atomic_write_stream(file_path, stream) if stream is not None else 0
+            if stream is None:
+                atomic_write(file_path, b'')
+        except OSError as e:
+            raise serializers.ValidationError({'error': f'File operation failed: {str(e)}'})
+
+        file_obj, created = File.objects.get_or_create(repository=repository, path=rel_path)
+        # Uploaded bodies may be binary; the working tree copy is the source of truth
+        file_obj.set_content(None)
+        file_obj.language = file_obj.language_from_path()
+        file_obj.save()
+
+        self._record_changes(repository, changed_paths=[rel_path], message=f'Upload {rel_path}')
+
+        logger.info(f"Uploaded {written} bytes to {rel_path} in {repository.slug}")
+        serializer = self.get_serializer(file_obj)
+        return Response(
+            serializer.data,
+            status=status.HTTP_201_CREATED if created else status.HTTP_200_OK
+        )
+
+    @action(detail=False, methods=['post'], url_path='batch')
+    def batch(self, request, *args, **kwargs):
+        """
+        Create, update and delete many files in one request and one git commit
+
+        Body: {"operations": [{"op": "create|update|delete", "path": "...", "content": "..."}],
+               "message": "optional commit message"}
+        """
+        repository = self.get_serializer_context()['repository']
+        batch_serializer = FileBatchSerializer(data=request.data)
+        batch_serializer.is_valid(raise_exception=True)
+
+        try:
+            result = apply_file_batch(
+                repository,
+                batch_serializer.validated_data['operations'],
+                lambda rel_path: self._resolve_file_path(repository, rel_path),
+                message=batch_serializer.validated_data.get('message'),
+                allow_delete=repository.user == request.user
+            )
+        except OSError as e:
+            raise serializers.ValidationError({'error': f'File operation failed: {str(e)}'})
+        mark_dirty(repository, [file_obj.path for file_obj in result['created'] + result['updated']] + result['deleted'])
+        schedule_auto_commit(repository.id)
+
+        return Response({
+            'created': self.get_serializer(result['created'], many=True).data,
+            'updated': self.get_serializer(result['updated'], many=True).data,
+            'deleted': result['deleted']
+        })
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        repository = self.get_repository()
+        if not repository:
+            raise Http404("Repository not found or access denied")
+        context['repository'] = repository
         return context
 
     @transaction.atomic
     def perform_create(self, serializer):
-        repository = self.get_serializer_context()['repository']
+        repository = serializer.context['repository']
         file_path = os.path.join(repository.location, serializer.validated_data['path'])
         
         # Ensure file path is within repository
@@ -413,28 +1027,24 @@ class FileViewSet(viewsets.ModelViewSet):
             # Create directories if needed
             os.makedirs(os.path.dirname(file_path), exist_ok=True)
             
-            # Write file content
-            with open(file_path, 'w', encoding='utf-8') as f:
-                f.write(serializer.validated_data.get('content', ''))
+            # Write file content; readers see the old file or the new one, never a truncated mix
+            atomic_write(file_path, serializer.validated_data.get('content', '') or '')
             
             # Save to database
             serializer.save(repository=repository)
 
-            # Git operations
-            try:
-                subprocess.run(['git', 'add', serializer.validated_data['path']], 
-                             cwd=repository.location, check=True)
-                subprocess.run(['git', 'commit', '-m', f'Add {serializer.validated_data["path"]}'],
-                             cwd=repository.location, check=True)
-            except subprocess.CalledProcessError as e:
-                logger.warning(f"Git operations failed: {e.stderr}")
+            # Git operations run in the repository's group commit once the transaction commits
+            path = serializer.validated_data['path']
+            transaction.on_commit(lambda: self._record_changes(
+                repository, changed_paths=[path], message=f'Add {path}'
+            ))
 
         except OSError as e:
             raise serializers.ValidationError({'error': f'File operation failed: {str(e)}'})
 
     @transaction.atomic
     def perform_update(self, serializer):
-        instance = self.get_object()
+        instance = serializer.instance
         repository = instance.repository
         file_path = os.path.join(repository.location, instance.path)
 
@@ -443,23 +1053,16 @@ class FileViewSet(viewsets.ModelViewSet):
 
         try:
             # Update file content
-            with open(file_path, 'w', encoding='utf-8') as f:
-                f.write(serializer.validated_data.get('content', instance.content))
+            atomic_write(file_path, serializer.validated_data.get('content', instance.get_content()) or '')
             
             # Save to database
             serializer.save()
 
-            # Git operations
-            try:
-                subprocess.run(['git', 'add', instance.path], 
-                             cwd=repository.location, check=True)
-                subprocess.run(['git', 'commit', '-m', f'Update {instance.path}'],
-                             cwd=repository.location, check=True)
-            except subprocess.CalledProcessError as e:
-                logger.warning(f"Git operations failed: {e.stderr}")
-
-            # Trigger auto-commit after file is saved
-            auto_commit_changes(repository.id)
+            # Git operations run in the repository's group commit once the transaction commits,
+            # which also triggers the debounced background auto-commit
+            transaction.on_commit(lambda: self._record_changes(
+                repository, changed_paths=[instance.path], message=f'Update {instance.path}'
+            ))
             
         except OSError as e:
             raise serializers.ValidationError({'error': f'File operation failed: {str(e)}'})
@@ -473,15 +1076,23 @@ class FileViewSet(viewsets.ModelViewSet):
             if os.path.exists(file_path):
                 os.remove(file_path)
                 
-                # Git operations
-                try:
-                    subprocess.run(['git', 'rm', instance.path], 
-                                 cwd=instance.repository.location, check=True)
-                    subprocess.run(['git', 'commit', '-m', f'Delete {instance.path}'],
-                                 cwd=instance.repository.location, check=True)
-                except subprocess.CalledProcessError as e:
-                    logger.warning(f"Git operations failed: {e.stderr}")
+                # Git operations run in the repository's group commit
+                self._record_changes(
+                    instance.repository,
+                    removed_paths=[instance.path],
+                    message=f'Delete {instance.path}'
+                )
 
             super().perform_destroy(instance)
         except OSError as e:
-            raise serializers.ValidationError({'error': f'File deletion failed: {str(e)}'})
\ No newline at end of file
+            raise serializers.ValidationError({'error': f'File deletion failed: {str(e)}'})
+
+
+@api_view(['GET'])
+@authentication_classes([TokenAuthentication])
+@permission_classes([permissions.IsAdminUser])
+def trash_stats(request):
+    """
+    API endpoint returning the trash reaper's counters and the number of deleted repositories awaiting reclamation
+    """
+    return Response(reaper.stats())
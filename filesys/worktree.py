@@ -0,0 +1,66 @@
+import logging
+import os
+
+from .conditional import file_digest, walk_repository
+from .models import File
+
+logger = logging.getLogger(__name__)
+
+
+def manifest_entries(location, file_ids):
+    """
+    Manifest rows (id, path, size, mtime, sha256) for every working tree file
+
+    Touches only the disk, so it can run on any thread; `file_ids` maps
+    repository-relative paths to File ids.
+    """
+    entries = []
+    if not location or not os.path.exists(location):
+        return entries
+    for rel_path, abs_path, st in sorted(walk_repository(location)):
+        try:
+            digest = file_digest(abs_path, st)
+        except OSError as e:
+            logger.warning(f"Could not hash file {abs_path}: {str(e)}")
+            continue
+        entries.append({
+            'id': file_ids.get(rel_path),
+            'path': rel_path,
+            'size': st.st_size,
+            'modified': int(st.st_mtime),
+            'sha256': digest,
+        })
+    return entries
+
+
+def untracked_texts(repository, known_paths):
+    """
+    [{path, content, language}] for the readable text files on disk that have no File row
+
+    Dot files and `gitignore` are left out, as is anything under .git.
+    """
+    files = []
+    git_dir = os.path.join(repository.location, '.git')
+    for root, _, filenames in os.walk(repository.location):
+        if root.startswith(git_dir):
+            continue
+        for filename in filenames:
+            if filename.startswith('.') or filename == 'gitignore':
+                continue
+            file_path = os.path.join(root, filename)
+            rel_path = os.path.relpath(file_path, repository.location)
+            if rel_path in known_paths:
+                continue
+            try:
+                with open(file_path, 'r', encoding='utf-8') as f:
+                    content = f.read()
+                file_obj = File(repository=repository, path=rel_path, content=content)
+                files.append({
+                    'path': rel_path,
+                    'content': content,
+                    'language': file_obj.detect_language()
+                })
+            except (IOError, UnicodeDecodeError) as e:
+                logger.warning(f"Could not read file {file_path}: {str(e)}")
+                continue
+    return files